@@ -0,0 +1,157 @@
+"""
+Ingestão de áudio: a entrada (áudio ou vídeo) é demuxada e decodificada uma única vez
+para PCM float32 mono a 16 kHz, gravado na pasta do job e lido por memmap.
+
+O mesmo buffer alimenta o Whisper (como array, sem o ffmpeg interno do whisper),
+a duração, a detecção de silêncio e as estatísticas de loudness.
+"""
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import disk_cache
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 4
+FRAME_SECONDS = 0.03
+# Silêncio = energia abaixo do pico (percentil 95) menos este valor, por pelo menos SILENCE_MIN_SECONDS
+SILENCE_DB = float(os.environ.get("WHISPER_SILENCE_DB", "35"))
+SILENCE_MIN_SECONDS = float(os.environ.get("WHISPER_SILENCE_MIN_SECONDS", "0.3"))
+
+
+def frame_energy_db(samples, sr: int = SAMPLE_RATE):
+    """
+    Energia RMS (dB) em janelas de FRAME_SECONDS.
+    """
+    import numpy as np
+
+    frame = int(sr * FRAME_SECONDS)
+    n = len(samples) // frame
+    rms = np.sqrt(np.mean(np.asarray(samples[:n * frame]).reshape(n, frame) ** 2, axis=1) + 1e-12)
+    return 20 * np.log10(rms)
+
+
+def find_silences(db) -> List[Tuple[float, float]]:
+    """
+    Intervalos de silêncio (início, fim) em segundos a partir de frame_energy_db.
+    """
+    import numpy as np
+
+    n = len(db)
+    if n == 0:
+        return []
+    quiet = db < np.percentile(db, 95) - SILENCE_DB
+
+    silences = []
+    min_frames = max(1, int(SILENCE_MIN_SECONDS / FRAME_SECONDS))
+    i = 0
+    while i < n:
+        if not quiet[i]:
+            i += 1
+            continue
+        j = i
+        while j < n and quiet[j]:
+            j += 1
+        if j - i >= min_frames:
+            silences.append((i * FRAME_SECONDS, j * FRAME_SECONDS))
+        i = j
+    return silences
+
+
+def read_pcm(pcm_path: Path, start: int = 0, end: Optional[int] = None):
+    """
+    Amostras [start, end) do arquivo PCM, por memmap (só as páginas lidas vão para a memória).
+    """
+    import numpy as np
+
+    total = os.path.getsize(pcm_path) // BYTES_PER_SAMPLE
+    end = total if end is None else min(end, total)
+    if end <= start:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(pcm_path, dtype=np.float32, mode="r", offset=start * BYTES_PER_SAMPLE, shape=(end - start,))
+
+
+class IngestedAudio:
+    def __init__(self, pcm_path: Path, sample_rate: int = SAMPLE_RATE, sha256: Optional[str] = None):
+        self.pcm_path = Path(pcm_path)
+        self.sample_rate = sample_rate
+        # Hash do arquivo de entrada (não do PCM), usado pelo cache de transcrições
+        self.sha256 = sha256
+        self._samples = None
+        self._db = None
+
+    @property
+    def num_samples(self) -> int:
+        return os.path.getsize(self.pcm_path) // BYTES_PER_SAMPLE
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / float(self.sample_rate)
+
+    @property
+    def samples(self):
+        if self._samples is None:
+            self._samples = read_pcm(self.pcm_path)
+        return self._samples
+
+    def slice(self, start: float, end: float):
+        return read_pcm(self.pcm_path, int(start * self.sample_rate), int(end * self.sample_rate))
+
+    def energy_db(self):
+        if self._db is None:
+            self._db = frame_energy_db(self.samples, self.sample_rate)
+        return self._db
+
+    def silences(self) -> List[Tuple[float, float]]:
+        return find_silences(self.energy_db())
+
+    def loudness(self) -> Dict:
+        import numpy as np
+
+        samples = self.samples
+        if len(samples) == 0:
+            return {"rms_dbfs": None, "peak_dbfs": None, "silence_ratio": None}
+        rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+        peak = float(np.max(np.abs(samples)))
+        silent = sum(b - a for a, b in self.silences())
+        return {
+            "rms_dbfs": round(20 * np.log10(max(rms, 1e-9)), 2),
+            "peak_dbfs": round(20 * np.log10(max(peak, 1e-9)), 2),
+            "silence_ratio": round(silent / self.duration, 4) if self.duration else None,
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "duration": self.duration,
+            "sample_rate": self.sample_rate,
+            **self.loudness(),
+        }
+
+
+def ingest(input_path: Path, work_dir: Path, sha256: Optional[str] = None) -> IngestedAudio:
+    """
+    Decodifica o primeiro stream de áudio de `input_path` para work_dir/<hash>.f32.
+    Vídeo, legendas e dados não são decodificados (-vn -sn -dn).
+    Se o PCM já existe na pasta (mesmo conteúdo), é reaproveitado.
+    """
+    sha256 = sha256 or disk_cache.file_sha256(input_path)
+    pcm_path = Path(work_dir) / f"audio_{sha256[:16]}_{SAMPLE_RATE}.f32"
+    if pcm_path.exists():
+        return IngestedAudio(pcm_path, SAMPLE_RATE, sha256)
+
+    tmp = pcm_path.with_name(f".{pcm_path.name}.tmp")
+    cmd = [
+        "ffmpeg", "-nostdin", "-y", "-v", "error",
+        "-i", str(input_path),
+        "-map", "0:a:0", "-vn", "-sn", "-dn",
+        "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "-f", "f32le", str(tmp),
+    ]
+    try:
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"FFmpeg audio ingest failed with exit code {e.returncode}.\nStderr: {e.stderr}") from e
+    os.replace(tmp, pcm_path)
+    return IngestedAudio(pcm_path, SAMPLE_RATE, sha256)
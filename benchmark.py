@@ -0,0 +1,535 @@
+"""
+Benchmark dos engines de render com timelines sintéticas.
+
+Gera imagens e configs sintéticas (quantidade de imagens, resolução de origem, todos os
+efeitos e transições), roda generate_video_from_config, merge_video_audio e add_subtitles
+e grava tempo, fator de tempo real, pico de RSS e tamanho da saída em JSON.
+Com --baseline compara contra um resultado anterior e falha se houver regressão.
+
+Exemplos:
+    python benchmark.py --quick
+    python benchmark.py --suite engines --save-baseline
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.2
+    python benchmark.py --suite engines --encoder-presets ultrafast,veryfast,medium
+    python benchmark.py --suite kenburns
+    python benchmark.py --suite music
+    python benchmark.py --suite multi
+    python benchmark.py --suite hardcut
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import music_engine
+import video_engine
+
+EFFECT_TYPES = [
+    {"type": "none"},
+    {"type": "zoom_slow", "zoom_start": 1.0, "zoom_end": 1.15},
+    {"type": "fade"},
+    {"type": "slide_horizontal", "direction": "left_to_center"},
+    {"type": "slide_horizontal", "direction": "right_to_left"},
+    {"type": "slide_vertical", "direction": "bottom_to_top"},
+    {"type": "slide_vertical", "direction": "top_to_bottom"},
+]
+
+XFADE_TRANSITIONS = [
+    "fade", "wipeleft", "wiperight", "wipeup", "wipedown",
+    "slideleft", "slideright", "slideup", "slidedown",
+    "circlecrop", "rectcrop", "distance", "iris", "radial",
+    "smoothleft", "smoothright", "smoothup", "smoothdown", "pixelize",
+]
+
+DEFAULT_RESULTS = "benchmark_results.json"
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+
+# --- Geração de assets sintéticos -------------------------------------------------
+
+def make_images(dest: Path, count: int, size: str) -> List[str]:
+    """
+    Gera `count` imagens diferentes (alternando png/jpg) a partir do testsrc2 com hue variado.
+    """
+    names = []
+    for i in range(count):
+        ext = ".png" if i % 2 == 0 else ".jpg"
+        name = f"img{i:03d}{ext}"
+        subprocess.run([
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=1",
+            "-vf", f"hue=h={(i * 37) % 360}",
+            "-frames:v", "1", str(dest / name),
+        ], check=True)
+        names.append(name)
+    return names
+
+
+def make_timeline(
+    images: List[str],
+    resolution: str = "1080x1920",
+    fps: int = 30,
+    duration: float = 3.0,
+    transition_duration: float = 0.5,
+    effects: Optional[List[Dict]] = None,
+    transitions: Optional[List[str]] = None,
+    video_options: Optional[Dict] = None
+) -> Dict:
+    """
+    Timeline que percorre todos os efeitos e transições em rodízio.
+    Um nome de transição "none" gera corte seco.
+    """
+    effects = effects or EFFECT_TYPES
+    transitions = transitions or (XFADE_TRANSITIONS + ["none"])
+    items = []
+    for i, name in enumerate(images):
+        trans = transitions[i % len(transitions)]
+        if trans == "none":
+            transition = {"type": "none"}
+        else:
+            transition = {"type": "xfade", "transition": trans, "duration": transition_duration}
+        items.append({
+            "id": Path(name).stem,
+            "order": i,
+            "duration_seconds": duration,
+            "effect": effects[i % len(effects)],
+            "transition_to_next": transition,
+        })
+    return {
+        # Grafo único, salvo quando o caso escolhe outro modo (fixo, para não depender de RENDER_MODE)
+        "video": {"resolution": resolution, "fps": fps, "render_mode": "single", **(video_options or {})},
+        "timeline": {"images": items},
+    }
+
+
+def make_audio(dest: Path, name: str, seconds: float, freq: int) -> Path:
+    path = dest / name
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency={freq}:duration={seconds}",
+        str(path),
+    ], check=True)
+    return path
+
+
+def make_srt(dest: Path, seconds: float, every: float = 2.0) -> Path:
+    def fmt(t):
+        return f"{int(t // 3600):02d}:{int(t % 3600 // 60):02d}:{int(t % 60):02d},{int((t % 1) * 1000):03d}"
+
+    lines = []
+    t, n = 0.0, 1
+    while t < seconds:
+        end = min(seconds, t + every * 0.8)
+        lines += [str(n), f"{fmt(t)} --> {fmt(end)}", f"Legenda de teste {n}", ""]
+        t += every
+        n += 1
+    path = dest / "subtitles.srt"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return path
+
+
+def probe_duration(path: Path) -> float:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
+        capture_output=True, text=True
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return 0.0
+
+
+# --- Execução isolada -------------------------------------------------------------
+
+def _child(fn: Callable, kwargs: Dict, queue):
+    start = time.perf_counter()
+    error = None
+    try:
+        fn(**kwargs)
+    except Exception as e:
+        error = str(e)[-2000:]
+    wall = time.perf_counter() - start
+    # ru_maxrss está em KB no Linux; RUSAGE_CHILDREN = maior ffmpeg deste processo
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({"wall_seconds": wall, "peak_rss_kb": max(children, own), "ffmpeg_peak_rss_kb": children, "error": error})
+
+
+def run_isolated(fn: Callable, **kwargs) -> Dict:
+    """
+    Roda o caso num processo novo para que o pico de RSS seja só deste caso.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(fn, kwargs, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def measure(name: str, fn: Callable, output: Path, params: Dict, **kwargs) -> Dict:
+    print(f"  - {name} ...", end="", flush=True)
+    result = run_isolated(fn, **kwargs)
+    duration = probe_duration(output) if output.exists() else 0.0
+    record = {
+        "name": name,
+        "params": params,
+        **result,
+        "output_seconds": duration,
+        "realtime_factor": (duration / result["wall_seconds"]) if result["wall_seconds"] > 0 else 0.0,
+        "output_bytes": output.stat().st_size if output.exists() else 0,
+    }
+    if record["error"]:
+        print(f" ERROR: {record['error'][:200]}")
+    else:
+        print(
+            f" {record['wall_seconds']:.2f}s, {record['realtime_factor']:.2f}x realtime, "
+            f"peak {record['peak_rss_kb'] / 1024:.0f} MB, {record['output_bytes'] / 1e6:.1f} MB"
+        )
+    return record
+
+
+# --- Suítes -----------------------------------------------------------------------
+
+def suite_engines(work: Path, quick: bool, presets: List[str]) -> List[Dict]:
+    counts = [3] if quick else [5, 20, 60]
+    sources = ["1280x720"] if quick else ["1280x720", "4000x3000"]
+    resolution = "540x960" if quick else "1080x1920"
+    modes = ["single"] if quick else ["single", "parallel"]
+    records = []
+
+    for src in sources:
+        for count in counts:
+            case_dir = work / f"img_{src}_{count}"
+            case_dir.mkdir(exist_ok=True)
+            images = make_images(case_dir, count, src)
+            for mode in modes:
+                for preset in presets:
+                    cfg = make_timeline(images, resolution=resolution, video_options={
+                        "render_mode": mode,
+                        "encoder": {"preset": preset},
+                        # Sem caches para medir o render completo
+                        "segment_cache": False,
+                        "prescale_images": True,
+                    })
+                    out = case_dir / f"out_{mode}_{preset}.mp4"
+                    records.append(measure(
+                        f"generate/{src}/{count}img/{mode}/{preset}",
+                        video_engine.generate_video_from_config, out,
+                        {"source": src, "images": count, "resolution": resolution, "mode": mode, "preset": preset},
+                        cfg=cfg, base_dir=case_dir, output_file=out,
+                    ))
+
+    # Merge e legendas sobre um vídeo gerado
+    base = work / "media"
+    base.mkdir(exist_ok=True)
+    images = make_images(base, 3, "1280x720")
+    video = base / "slideshow.mp4"
+    video_engine.generate_video_from_config(make_timeline(images, resolution=resolution), base, video)
+    seconds = probe_duration(video)
+    narration = make_audio(base, "narration.wav", seconds + 2, 440)
+    background = make_audio(base, "background.mp3", 5, 880)
+    srt = make_srt(base, seconds)
+
+    out = base / "merge_full.mp4"
+    records.append(measure(
+        "merge/narration+background", video_engine.merge_video_audio, out, {"video_seconds": seconds},
+        video_input=video, output_file=out, narration_input=narration, background_input=background,
+    ))
+    out = base / "merge_bg.mp4"
+    records.append(measure(
+        "merge/background", video_engine.merge_video_audio, out, {"video_seconds": seconds},
+        video_input=video, output_file=out, background_input=background,
+    ))
+    out = base / "subs.mp4"
+    records.append(measure(
+        "subtitles/burn", video_engine.add_subtitles, out, {"video_seconds": seconds},
+        video_input=video, srt_input=srt, output_file=out,
+    ))
+    return records
+
+
+def compare_quality(reference: Path, candidate: Path) -> Dict:
+    """
+    PSNR/SSIM médios do candidato contra a referência (mesma resolução e frames).
+    """
+    result = subprocess.run([
+        "ffmpeg", "-v", "info", "-i", str(candidate), "-i", str(reference),
+        "-lavfi", "[0:v][1:v]psnr;[0:v][1:v]ssim", "-f", "null", "-",
+    ], capture_output=True, text=True)
+    quality = {"psnr_db": None, "ssim": None}
+    for line in result.stderr.splitlines():
+        if "PSNR" in line and "average:" in line:
+            value = line.split("average:", 1)[1].split()[0]
+            quality["psnr_db"] = float("inf") if value == "inf" else float(value)
+        if "SSIM" in line and "All:" in line:
+            quality["ssim"] = float(line.split("All:", 1)[1].split()[0])
+    return quality
+
+
+def suite_kenburns(work: Path, quick: bool, presets: List[str]) -> List[Dict]:
+    """
+    zoom_slow lado a lado: zoompan original x engine rápido (perspective).
+    A qualidade é medida contra a saída do zoompan.
+    """
+    resolution = "540x960" if quick else "1080x1920"
+    durations = [3.0] if quick else [5.0, 10.0]
+    variants = [
+        ("zoompan", {"engine": "zoompan"}),
+        ("fast", {"engine": "fast"}),
+    ]
+    images = make_images(work, 1, "4000x3000")
+    records = []
+
+    for duration in durations:
+        reference = None
+        for name, options in variants:
+            effect = {"type": "zoom_slow", "zoom_start": 1.0, "zoom_end": 1.15, **options}
+            cfg = make_timeline(
+                images, resolution=resolution, duration=duration, effects=[effect],
+                video_options={"prescale_images": False},
+            )
+            out = work / f"kenburns_{name}_{duration:g}.mp4"
+            record = measure(
+                f"kenburns/{resolution}/{duration:g}s/{name}",
+                video_engine.generate_video_from_config, out,
+                {"engine": name, "duration": duration, "resolution": resolution, **options},
+                cfg=cfg, base_dir=work, output_file=out,
+            )
+            if reference is None:
+                reference = out
+            elif out.exists() and reference.exists():
+                record["quality_vs_zoompan"] = compare_quality(reference, out)
+                print(f"      quality vs zoompan: {record['quality_vs_zoompan']}")
+            records.append(record)
+    return records
+
+
+def suite_music(work: Path, quick: bool, presets: List[str]) -> List[Dict]:
+    """
+    generate_music com o backend local (sem rede): geração e acerto no cache de faixas.
+    O prompt leva o nome da pasta de trabalho para a primeira chamada nunca estar no cache.
+    """
+    durations = [10] if quick else [10, 30]
+    records = []
+    for duration in durations:
+        prompt = f"benchmark {work.parent.name} {duration}s"
+        for name in ("generate", "cached"):
+            out = work / f"music_{duration}_{name}.mp3"
+            records.append(measure(
+                f"music/local/{duration}s/{name}",
+                music_engine.generate_music, out,
+                {"backend": "local", "duration": duration, "cached": name == "cached"},
+                prompt=prompt, duration=duration, output_path=out, backend="local",
+            ))
+    return records
+
+
+def _render_each(cfg: Dict, base_dir: Path, outputs: List[str]):
+    # Baseline do multi: um render completo por resolução, como três chamadas ao /generate-video
+    for resolution in outputs:
+        single = {**cfg, "video": {**cfg["video"], "resolution": resolution}}
+        single["video"].pop("resolutions", None)
+        video_engine.generate_video_from_config(single, base_dir, base_dir / f"each_{resolution}.mp4")
+
+
+def suite_multi(work: Path, quick: bool, presets: List[str]) -> List[Dict]:
+    """
+    Mesma timeline em três proporções: um render por resolução x uma passada com video.resolutions.
+    """
+    count = 3 if quick else 10
+    outputs = ["540x960", "540x540", "960x540"] if quick else ["1080x1920", "1080x1080", "1920x1080"]
+    images = make_images(work, count, "1280x720" if quick else "4000x3000")
+    cfg = make_timeline(images, video_options={"resolutions": outputs, "prescale_images": False})
+    records = [measure(
+        f"multi/{count}img/separate", _render_each, work / f"each_{outputs[0]}.mp4",
+        {"outputs": outputs, "mode": "separate"},
+        cfg=cfg, base_dir=work, outputs=outputs,
+    )]
+    records.append(measure(
+        f"multi/{count}img/one_pass", video_engine.generate_video_outputs, work / "multi" / f"{outputs[0]}.mp4",
+        {"outputs": outputs, "mode": "one_pass"},
+        cfg=cfg, base_dir=work, output_dir=work / "multi",
+    ))
+    return records
+
+
+def suite_hardcut(work: Path, quick: bool, presets: List[str]) -> List[Dict]:
+    """
+    Timelines só com cortes secos (e com um fade a cada 10 clipes): cadeia de xfade
+    com duration=0 (hardcut_concat=false) x concat nos cortes secos.
+    """
+    counts = [20] if quick else [50, 200]
+    resolution = "540x960" if quick else "1080x1920"
+    images_all = make_images(work, 10, "1280x720")
+    records = []
+    for count in counts:
+        images = [images_all[i % len(images_all)] for i in range(count)]
+        for mix in ("cuts", "cuts+fade"):
+            transitions = ["none"] if mix == "cuts" else ["none"] * 9 + ["fade"]
+            for hardcut in (False, True):
+                cfg = make_timeline(
+                    images, resolution=resolution, duration=1.0,
+                    effects=[{"type": "none"}], transitions=transitions,
+                    video_options={"hardcut_concat": hardcut, "prescale_images": True},
+                )
+                name = "concat" if hardcut else "xfade0"
+                out = work / f"hardcut_{count}_{mix}_{name}.mp4"
+                records.append(measure(
+                    f"hardcut/{count}img/{mix}/{name}",
+                    video_engine.generate_video_from_config, out,
+                    {"images": count, "transitions": mix, "hardcut_concat": hardcut, "resolution": resolution},
+                    cfg=cfg, base_dir=work, output_file=out,
+                ))
+    return records
+
+
+def suite_windowed(work: Path, quick: bool, presets: List[str]) -> List[Dict]:
+    """
+    Timelines longas: grafo único (uma entrada por imagem) x janelas de window_size imagens.
+    """
+    counts = [40] if quick else [100, 300]
+    resolution = "540x960" if quick else "1080x1920"
+    window_size = 10 if quick else 24
+    images_all = make_images(work, 10, "1280x720")
+    records = []
+    for count in counts:
+        images = [images_all[i % len(images_all)] for i in range(count)]
+        for mode in ("single", "windowed"):
+            cfg = make_timeline(
+                images, resolution=resolution, duration=1.0,
+                video_options={"render_mode": mode, "window_size": window_size, "prescale_images": True},
+            )
+            out = work / f"windowed_{count}_{mode}.mp4"
+            records.append(measure(
+                f"windowed/{count}img/{mode}",
+                video_engine.generate_video_from_config, out,
+                {"images": count, "render_mode": mode, "window_size": window_size, "resolution": resolution},
+                cfg=cfg, base_dir=work, output_file=out,
+            ))
+    return records
+
+
+SUITES: Dict[str, Callable[..., List[Dict]]] = {
+    "engines": suite_engines,
+    "kenburns": suite_kenburns,
+    "music": suite_music,
+    "multi": suite_multi,
+    "hardcut": suite_hardcut,
+    "windowed": suite_windowed,
+}
+
+
+# --- Baseline ---------------------------------------------------------------------
+
+def environment_info() -> Dict:
+    try:
+        ffmpeg = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.splitlines()[0]
+    except Exception:
+        ffmpeg = "unknown"
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg,
+        "commit": commit,
+        "timestamp": time.time(),
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compara tempo e pico de RSS de cada caso presente nos dois arquivos.
+    Retorna a lista de regressões (acima de 1 + tolerance).
+    """
+    base_cases = {c["name"]: c for c in baseline.get("cases", [])}
+    regressions = []
+    print(f"\n{'case':<55} {'wall':>9} {'base':>9} {'ratio':>7} {'rss MB':>8} {'ratio':>7}")
+    for case in results["cases"]:
+        ref = base_cases.get(case["name"])
+        if not ref or case["error"] or ref.get("error"):
+            continue
+        wall_ratio = case["wall_seconds"] / ref["wall_seconds"] if ref["wall_seconds"] else 1.0
+        rss_ratio = case["peak_rss_kb"] / ref["peak_rss_kb"] if ref["peak_rss_kb"] else 1.0
+        flag = ""
+        if wall_ratio > 1 + tolerance:
+            regressions.append(f"{case['name']}: wall {wall_ratio:.2f}x")
+            flag = " <-- wall"
+        if rss_ratio > 1 + tolerance:
+            regressions.append(f"{case['name']}: peak RSS {rss_ratio:.2f}x")
+            flag += " <-- rss"
+        print(
+            f"{case['name']:<55} {case['wall_seconds']:>8.2f}s {ref['wall_seconds']:>8.2f}s {wall_ratio:>6.2f}x "
+            f"{case['peak_rss_kb'] / 1024:>8.0f} {rss_ratio:>6.2f}x{flag}"
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=sorted(SUITES) + ["all"], default="engines")
+    parser.add_argument("--quick", action="store_true", help="timelines pequenas, resolução reduzida")
+    parser.add_argument("--encoder-presets", default="medium", help="lista de presets x264 separados por vírgula")
+    parser.add_argument("--output", default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", help="arquivo de baseline para comparação")
+    parser.add_argument("--save-baseline", action="store_true", help=f"grava o resultado também em {DEFAULT_BASELINE}")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--keep", action="store_true", help="não apaga a pasta de trabalho")
+    args = parser.parse_args(argv)
+
+    presets = [p.strip() for p in args.encoder_presets.split(",") if p.strip()]
+    suites = sorted(SUITES) if args.suite == "all" else [args.suite]
+
+    work = Path(tempfile.mkdtemp(prefix="bench_"))
+    cases: List[Dict] = []
+    try:
+        for name in suites:
+            print(f"Suite '{name}' (work dir {work})")
+            suite_dir = work / name
+            suite_dir.mkdir()
+            cases += SUITES[name](suite_dir, args.quick, presets)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    results = {"environment": environment_info(), "quick": args.quick, "cases": cases}
+    Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        Path(DEFAULT_BASELINE).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {DEFAULT_BASELINE}")
+
+    failed = [c["name"] for c in cases if c["error"]]
+    if failed:
+        print(f"FAILURE: {len(failed)} case(s) failed: {', '.join(failed)}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for r in regressions:
+                print(f"  {r}")
+            return 1
+        print("\nSUCCESS: no regressions against baseline.")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
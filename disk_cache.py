@@ -0,0 +1,217 @@
+"""
+Cache em disco endereçado por conteúdo, com limite de tamanho e despejo LRU.
+Usado pelos caches de segmentos, imagens normalizadas, transcrições e músicas.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+CACHE_ROOT = Path(os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "video_cache")))
+# Contadores (hits, misses, bytes) de cada cache, compartilhados entre processos
+COUNTERS_FILE = ".counters.json"
+
+_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_hash_lock = threading.Lock()
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    sha256 do arquivo, memorizado por (caminho, tamanho, mtime) dentro do processo.
+    """
+    st = os.stat(path)
+    memo_key = (str(Path(path).resolve()), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+
+    value = digest.hexdigest()
+    with _hash_lock:
+        _hash_memo[memo_key] = value
+    return value
+
+
+def make_key(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, name: str, max_mb: int, root: Path = CACHE_ROOT):
+        self.name = name
+        self.root = Path(root) / name
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.meta.json"
+
+    @contextmanager
+    def _counters(self):
+        """
+        Lê e atualiza os contadores do cache, guardados num JSON na pasta do cache e
+        travados com flock: os lookups acontecem nos workers do pool, não no processo da API.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / COUNTERS_FILE, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                counters = json.loads(f.read() or "{}")
+            except ValueError:
+                counters = {}
+            before = dict(counters)
+            yield counters
+            if counters != before:
+                f.truncate(0)
+                f.write(json.dumps(counters))
+        # O flock é liberado ao fechar o arquivo
+
+    def _count(self, field: str):
+        with self._counters() as counters:
+            counters[field] = counters.get(field, 0) + 1
+
+    def lookup(self, key: str, suffix: str) -> Optional[Path]:
+        """
+        Retorna o caminho no cache (ou None). Atualiza o mtime, que é a ordem do LRU.
+        """
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return path
+
+    def fetch(self, key: str, suffix: str, dest: Path) -> bool:
+        path = self.lookup(key, suffix)
+        if path is None:
+            return False
+        try:
+            # Cópia, não hardlink: o arquivo do job pode ser reescrito no lugar (ffmpeg -y
+            # trunca o mesmo inode) e isso corromperia a entrada do cache
+            shutil.copyfile(path, dest)
+        except FileNotFoundError:
+            # Despejado entre o lookup e a cópia
+            return False
+        return True
+
+    def meta(self, key: str) -> Dict:
+        try:
+            return json.loads(self._meta_path(key).read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+
+    def _tmp_path(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _commit(self, tmp: Path, key: str, suffix: str, meta: Optional[Dict]) -> Path:
+        # Troca atômica: leitores nunca veem um arquivo pela metade
+        path = self._path(key, suffix)
+        added = tmp.stat().st_size
+        try:
+            # A chave já existia: o arquivo antigo é substituído
+            added -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+        if meta is not None:
+            meta_tmp = tmp.with_suffix(".meta")
+            meta_tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(meta_tmp, self._meta_path(key))
+
+        # Total corrente em vez de varrer o cache a cada store; a varredura só acontece
+        # na primeira vez e quando o total passa do limite
+        with self._counters() as counters:
+            if "size_bytes" in counters:
+                counters["size_bytes"] += added
+            else:
+                counters["size_bytes"] = sum(size for _, size, _ in self._entries())
+            over = self.max_bytes > 0 and counters["size_bytes"] > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def store(self, key: str, src: Path, suffix: str, meta: Optional[Dict] = None) -> Path:
+        """
+        Copia `src` para o cache e aplica o limite de tamanho.
+        """
+        tmp = self._tmp_path(self._path(key, suffix))
+        # Cópia pelo mesmo motivo do fetch: `src` continua sendo do job
+        shutil.copyfile(Path(src), tmp)
+        return self._commit(tmp, key, suffix, meta)
+
+    def store_bytes(self, key: str, data: bytes, suffix: str, meta: Optional[Dict] = None) -> Path:
+        tmp = self._tmp_path(self._path(key, suffix))
+        tmp.write_bytes(data)
+        return self._commit(tmp, key, suffix, meta)
+
+    def _entries(self):
+        if not self.root.exists():
+            return []
+        entries = []
+        for f in self.root.glob("*/*"):
+            if f.name.startswith(".") or f.name.endswith(".meta.json"):
+                continue
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+        return entries
+
+    def evict(self) -> int:
+        """
+        Remove as entradas menos usadas até caber no limite. Varre o cache e corrige o
+        total corrente (que pode ter desviado com arquivos apagados por fora).
+        """
+        if self.max_bytes <= 0:
+            return 0
+        with self._counters() as counters:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, f in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                key = f.name.split(".", 1)[0]
+                f.unlink(missing_ok=True)
+                self._meta_path(key).unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            counters["size_bytes"] = total
+        return removed
+
+    def stats(self) -> Dict:
+        entries = self._entries()
+        with self._counters() as counters:
+            hits = counters.get("hits", 0)
+            misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "name": self.name,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": (hits / lookups) if lookups else 0.0,
+        }
@@ -0,0 +1,190 @@
+"""
+Downloads HTTP com sessão compartilhada (pool de conexões keep-alive), gravação em
+streaming direto no disco, timeouts e retomada por Range após falhas.
+
+Cada download devolve suas estatísticas (bytes, latência até o primeiro byte,
+throughput, tentativas) e os totais do processo ficam em stats().
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DOWNLOAD_CONNECT_TIMEOUT = float(os.environ.get("DOWNLOAD_CONNECT_TIMEOUT", "10"))
+# Tempo máximo sem receber dados (não é o tempo total do download)
+DOWNLOAD_READ_TIMEOUT = float(os.environ.get("DOWNLOAD_READ_TIMEOUT", "60"))
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", "4"))
+DOWNLOAD_BACKOFF_SECONDS = float(os.environ.get("DOWNLOAD_BACKOFF_SECONDS", "0.5"))
+DOWNLOAD_CHUNK_BYTES = int(os.environ.get("DOWNLOAD_CHUNK_KB", "256")) * 1024
+# Conexões mantidas por host no pool da sessão
+DOWNLOAD_POOL_SIZE = int(os.environ.get("DOWNLOAD_POOL_SIZE", "16"))
+
+# Status que valem nova tentativa (o resto é erro definitivo)
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+_totals = {
+    "downloads": 0,
+    "failures": 0,
+    "bytes": 0,
+    "seconds": 0.0,
+    "retries": 0,
+    "resumed_bytes": 0,
+    "ttfb_seconds": 0.0,
+}
+_totals_lock = threading.Lock()
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+def get_session() -> requests.Session:
+    """
+    Sessão única por processo: reaproveita conexões TCP/TLS entre downloads.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE, pool_maxsize=DOWNLOAD_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _record(stats: Dict, ok: bool):
+    with _totals_lock:
+        if ok:
+            _totals["downloads"] += 1
+            _totals["bytes"] += stats["bytes"]
+            _totals["seconds"] += stats["seconds"]
+            _totals["ttfb_seconds"] += stats["ttfb_seconds"] or 0.0
+        else:
+            _totals["failures"] += 1
+        _totals["retries"] += stats["attempts"] - 1
+        _totals["resumed_bytes"] += stats["resumed_bytes"]
+
+
+def _content_range_total(value: Optional[str]) -> Optional[int]:
+    # "bytes */12345" (resposta 416) ou "bytes 0-99/12345"
+    if not value or "/" not in value:
+        return None
+    total = value.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def download(url: str, dest: Path, session: Optional[requests.Session] = None) -> Dict:
+    """
+    Baixa `url` para `dest` em blocos. Numa falha (conexão, timeout, 5xx) tenta de novo
+    com backoff exponencial, pedindo só o que falta (Range) quando o servidor aceita;
+    se ele ignora o Range (200), recomeça do zero. O arquivo final só aparece completo.
+    """
+    session = session or get_session()
+    dest = Path(dest)
+    part = dest.with_name(f".{dest.name}.part")
+    start = time.perf_counter()
+    stats = {"url": url, "bytes": 0, "seconds": 0.0, "ttfb_seconds": None,
+             "attempts": 0, "resumed_bytes": 0, "throughput_mbps": 0.0}
+    expected: Optional[int] = None
+    last_error: Optional[Exception] = None
+
+    with open(part, "wb") as f:
+        while stats["attempts"] <= DOWNLOAD_RETRIES:
+            if stats["attempts"]:
+                time.sleep(DOWNLOAD_BACKOFF_SECONDS * 2 ** (stats["attempts"] - 1))
+            stats["attempts"] += 1
+            offset = f.tell()
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                with session.get(
+                    url, headers=headers, stream=True,
+                    timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)
+                ) as response:
+                    if response.status_code in RETRY_STATUS:
+                        raise DownloadError(f"HTTP {response.status_code}")
+                    if response.status_code == 416 and offset:
+                        total = _content_range_total(response.headers.get("Content-Range"))
+                        if total is None:
+                            total = expected
+                        if total is not None and offset == total:
+                            # Já estava tudo baixado quando a conexão caiu
+                            expected = total
+                            last_error = None
+                            break
+                        # Tamanho desconhecido ou diferente do .part: recomeça do zero
+                        f.seek(0)
+                        f.truncate()
+                        raise DownloadError(f"HTTP 416 at {offset} bytes (size {total}), restarting")
+                    response.raise_for_status()
+                    if offset and response.status_code == 206:
+                        stats["resumed_bytes"] += offset
+                    elif offset:
+                        # Servidor sem suporte a Range: recomeça
+                        f.seek(0)
+                        f.truncate()
+                    length = response.headers.get("Content-Length")
+                    if length is not None and response.status_code == 200:
+                        expected = int(length)
+                    elif length is not None and expected is None:
+                        expected = f.tell() + int(length)
+
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                        if stats["ttfb_seconds"] is None:
+                            stats["ttfb_seconds"] = time.perf_counter() - start
+                        f.write(chunk)
+
+                if expected is not None and f.tell() < expected:
+                    raise DownloadError(f"connection closed at {f.tell()}/{expected} bytes")
+                last_error = None
+                break
+            except requests.HTTPError as e:
+                # 4xx (exceto os de RETRY_STATUS): não adianta tentar de novo
+                last_error = e
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, DownloadError) as e:
+                last_error = e
+                print(f"Download attempt {stats['attempts']} failed at {f.tell()} bytes: {e}")
+        stats["bytes"] = f.tell()
+
+    stats["seconds"] = time.perf_counter() - start
+    if last_error is not None:
+        part.unlink(missing_ok=True)
+        _record(stats, ok=False)
+        raise DownloadError(f"Download failed after {stats['attempts']} attempt(s): {last_error}") from last_error
+
+    os.replace(part, dest)
+    stats["throughput_mbps"] = (stats["bytes"] * 8 / 1e6 / stats["seconds"]) if stats["seconds"] > 0 else 0.0
+    _record(stats, ok=True)
+    print(
+        f"Downloaded {stats['bytes'] / 1e6:.2f} MB in {stats['seconds']:.2f}s "
+        f"({stats['throughput_mbps']:.1f} Mbit/s, ttfb {stats['ttfb_seconds'] or 0.0:.2f}s, "
+        f"{stats['attempts']} attempt(s))"
+    )
+    return stats
+
+
+def stats() -> Dict:
+    with _totals_lock:
+        totals = dict(_totals)
+    done = totals["downloads"]
+    return {
+        **totals,
+        "avg_ttfb_seconds": (totals["ttfb_seconds"] / done) if done else 0.0,
+        "avg_throughput_mbps": (totals["bytes"] * 8 / 1e6 / totals["seconds"]) if totals["seconds"] > 0 else 0.0,
+    }
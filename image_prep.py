@@ -0,0 +1,118 @@
+"""
+Pré-processamento de imagens: cada imagem é decodificada e redimensionada uma única vez
+para o tamanho que o efeito precisa (a "master"), em vez de cada render decodificar e
+redimensionar o original (em geral bem maior que a saída). As masters ficam num cache
+por conteúdo e são reaproveitadas entre jobs.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import disk_cache
+import video_engine
+
+IMAGE_CACHE_MAX_MB = int(os.environ.get("IMAGE_CACHE_MAX_MB", "2048"))
+# Incrementar quando a forma de gerar as masters mudar
+IMAGE_CACHE_VERSION = 1
+
+image_cache = disk_cache.DiskCache("image_masters", IMAGE_CACHE_MAX_MB)
+
+
+def master_filter(mw: int, mh: int, top_left: bool) -> str:
+    # Mesmo scale/crop que effect_filter faz por frame
+    crop = f"crop={mw}:{mh}:0:0" if top_left else f"crop={mw}:{mh}"
+    return f"scale={mw}:{mh}:force_original_aspect_ratio=increase,{crop}"
+
+
+def build_master(src: Path, dest: Path, mw: int, mh: int, top_left: bool):
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(src),
+        "-vf", master_filter(mw, mh, top_left),
+        "-frames:v", "1",
+        str(dest),
+    ]
+    video_engine.run_ffmpeg(cmd, f"FFmpeg failed to normalize {src.name}")
+
+
+def master_key(src: Path, geometry: Tuple[int, int, bool]) -> str:
+    return disk_cache.make_key(IMAGE_CACHE_VERSION, disk_cache.file_sha256(src), list(geometry))
+
+
+def get_master(src: Path, geometry: Tuple[int, int, bool], work_dir: Path) -> Path:
+    """
+    Retorna a master de `src` dentro de work_dir (cópia do cache ou gerada agora).
+    """
+    key = master_key(src, geometry)
+    dest = work_dir / f"{key}.png"
+    if dest.exists():
+        return dest
+
+    if image_cache.fetch(key, ".png", dest):
+        return dest
+
+    tmp = work_dir / f".{key}.tmp.png"
+    build_master(src, tmp, *geometry)
+    image_cache.store(key, tmp, ".png")
+    os.replace(tmp, dest)
+    return dest
+
+
+def get_derived_master(
+    src: Path,
+    full_geometry: Tuple[int, int, bool],
+    geometry: Tuple[int, int, bool],
+    work_dir: Path
+) -> Path:
+    """
+    Master reduzida (preview) gerada a partir da master em resolução cheia.
+    A master cheia também entra no cache, então o render final não precisa decodificar a origem de novo.
+    """
+    full = get_master(src, full_geometry, work_dir)
+    return get_master(full, geometry, work_dir)
+
+
+def prepare_masters(
+    clips: List[Dict],
+    w: int,
+    h: int,
+    base_dir: Path,
+    full_size: Optional[Tuple[int, int]] = None
+) -> List[Dict]:
+    """
+    Substitui o arquivo de cada clipe pela master normalizada para (w, h).
+    O arquivo original fica em "source_file".
+    Com full_size (preview), as masters de (w, h) são derivadas das masters de full_size.
+    """
+    work_dir = base_dir / "_masters"
+    work_dir.mkdir(exist_ok=True)
+
+    def job_for(clip: Dict):
+        geometry = video_engine.effect_source_geometry(clip["effect"], w, h)
+        if full_size is None:
+            return clip["file"], geometry, None
+        full_effect = clip.get("full_effect", clip["effect"])
+        return clip["file"], geometry, video_engine.effect_source_geometry(full_effect, *full_size)
+
+    jobs: Dict[Tuple, None] = {job_for(clip): None for clip in clips}
+
+    def build(job: Tuple) -> Path:
+        src, geometry, full_geometry = job
+        if full_geometry is None:
+            return get_master(src, geometry, work_dir)
+        return get_derived_master(src, full_geometry, geometry, work_dir)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 2) as pool:
+        futures = {job: pool.submit(build, job) for job in jobs}
+        masters = {job: f.result() for job, f in futures.items()}
+
+    prepared = []
+    for clip in clips:
+        prepared.append({
+            **clip,
+            "source_file": clip["file"],
+            "file": masters[job_for(clip)],
+            "prescaled": True,
+        })
+    return prepared
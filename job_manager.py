@@ -0,0 +1,372 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Quantos renders (ffmpeg) rodam ao mesmo tempo
+VIDEO_WORKERS = int(os.environ.get("VIDEO_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Por quanto tempo (s) um resultado terminado fica disponível para download
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "3600"))
+JOB_CLEANUP_INTERVAL = float(os.environ.get("JOB_CLEANUP_INTERVAL", "60"))
+
+CANCEL_MARKER = "CANCELLED"
+PROGRESS_FILE = "progress.json"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class ProgressWriter:
+    """
+    Callback de progresso usado dentro do worker: grava o último estado em
+    progress.json (troca atômica), no máximo a cada `min_interval` segundos.
+    """
+
+    def __init__(self, job_dir: Path, min_interval: float = 0.25):
+        self.path = Path(job_dir) / PROGRESS_FILE
+        self.min_interval = min_interval
+        self._last = 0.0
+
+    def __call__(self, update: Dict):
+        now = time.monotonic()
+        if update.get("status") != "end" and now - self._last < self.min_interval:
+            return
+        self._last = now
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(update), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+def read_progress(job_dir: Path) -> Optional[Dict]:
+    try:
+        return json.loads((Path(job_dir) / PROGRESS_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _child_pids(pid: int) -> List[int]:
+    """
+    Lista os processos filhos diretos (ex: ffmpeg) lendo /proc. Só funciona em Linux.
+    """
+    children = []
+    proc = Path("/proc")
+    if not proc.exists():
+        return children
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            # O campo comm pode conter espaços; o ppid vem depois do último ')'
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        except Exception:
+            continue
+        if ppid == pid:
+            children.append(int(entry.name))
+    return children
+
+
+def _watch_cancel(job_dir: Path, stop: threading.Event):
+    marker = job_dir / CANCEL_MARKER
+    while not stop.wait(0.5):
+        if marker.exists():
+            for child in _child_pids(os.getpid()):
+                try:
+                    os.kill(child, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            return
+
+
+def _task_result(output) -> Dict:
+    stats = None
+    if isinstance(output, tuple):
+        output, stats = output
+    return {"output": str(output) if output else None, "stats": stats}
+
+
+def _run_in_worker(fn: Callable, job_dir: str, args: tuple, kwargs: Dict) -> Dict:
+    """
+    Executa a tarefa dentro do processo do pool. Uma thread vigia o marcador de
+    cancelamento e mata o ffmpeg em andamento se o job for cancelado.
+    As estatísticas ganham peak_rss_kb: o maior pico de RSS entre os ffmpeg do job.
+    """
+    # Import local: o pico dos ffmpeg é medido no video_engine (o worker é reaproveitado
+    # entre jobs, então o RUSAGE_CHILDREN do processo não serve)
+    import video_engine
+
+    job_path = Path(job_dir)
+    stop = threading.Event()
+    watcher = threading.Thread(target=_watch_cancel, args=(job_path, stop), daemon=True)
+    watcher.start()
+    video_engine.reset_ffmpeg_peak_rss()
+    try:
+        result = _task_result(fn(job_path, *args, **kwargs))
+        result["stats"] = {**(result["stats"] or {}), "peak_rss_kb": video_engine.ffmpeg_peak_rss_kb()}
+        return result
+    except Exception as e:
+        if (job_path / CANCEL_MARKER).exists():
+            return {"cancelled": True}
+        return {"error": str(e), "traceback": traceback.format_exc()}
+    finally:
+        stop.set()
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, job_dir: Path, media_type: str, filename: str):
+        self.id = job_id
+        self.kind = kind
+        self.job_dir = job_dir
+        self.media_type = media_type
+        self.filename = filename
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.result_path: Optional[Path] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        # Tarefas de submit_async: a corrotina rodando no event loop
+        self.task: Optional[asyncio.Task] = None
+        self.uploads: Optional[Dict] = None
+        self.stats: Optional[Dict] = None
+
+    def to_dict(self) -> Dict:
+        status = self.status
+        if status == QUEUED and self.future is not None and self.future.running():
+            status = RUNNING
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if status in (QUEUED, RUNNING):
+            data["progress"] = read_progress(self.job_dir)
+        if self.uploads:
+            data["uploads"] = self.uploads
+        if self.stats:
+            data["stats"] = self.stats
+        if self.finished_at:
+            data["expires_at"] = self.finished_at + JOB_RESULT_TTL
+        return data
+
+
+class JobManager:
+    """
+    Fila de renders: cada job tem sua própria pasta de trabalho, roda num pool
+    de processos limitado e o resultado fica disponível até expirar o TTL.
+    """
+
+    def __init__(self, max_workers: int = VIDEO_WORKERS, result_ttl: float = JOB_RESULT_TTL):
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: não herda threads/estado do uvicorn (fork + threads é inseguro)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """
+        Descarta um pool quebrado (um worker morreu: OOM kill, SIGKILL); a próxima
+        chamada de _get_executor cria outro. Só descarta se ainda for o pool atual,
+        para não derrubar um pool novo criado por outro job.
+        """
+        with self._executor_lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        print("Render pool is broken (a worker died); starting a new one")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def create(self, kind: str, media_type: str = "video/mp4", filename: str = "output.mp4") -> Job:
+        job_id = uuid.uuid4().hex
+        job_dir = Path(tempfile.mkdtemp(prefix=f"job_{job_id[:8]}_"))
+        job = Job(job_id, kind, job_dir, media_type, filename)
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def submit(self, job: Job, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Envia a tarefa ao pool. `fn(job_dir, *args, **kwargs)` deve ser uma função
+        de módulo (picklável) e retornar o caminho do arquivo de saída.
+        """
+        job.started_at = time.time()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_run_in_worker, fn, str(job.job_dir), args, kwargs)
+        except BrokenProcessPool:
+            # O pool quebrou antes deste job: tenta uma vez num pool novo
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(_run_in_worker, fn, str(job.job_dir), args, kwargs)
+        job.future = future
+        future.add_done_callback(lambda f: self._on_done(job, f, executor))
+        return future
+
+    def submit_async(self, job: Job, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Para tarefas que só esperam I/O (ex: APIs externas): `fn(job_dir, *args, **kwargs)`
+        é uma corrotina executada no event loop, sem ocupar um processo do pool.
+        Deve ser chamado de dentro do event loop.
+        """
+        job.started_at = time.time()
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+        job.future = future
+        future.add_done_callback(lambda f: self._on_done(job, f))
+
+        async def runner():
+            try:
+                future.set_result(_task_result(await fn(job.job_dir, *args, **kwargs)))
+            except asyncio.CancelledError:
+                future.set_result({"cancelled": True})
+            except Exception as e:
+                future.set_result({"error": str(e), "traceback": traceback.format_exc()})
+
+        job.task = asyncio.get_running_loop().create_task(runner())
+        return future
+
+    def _on_done(self, job: Job, future: Future, executor: Optional[ProcessPoolExecutor] = None):
+        job.finished_at = time.time()
+        if future.cancelled():
+            job.status = CANCELLED
+            self._remove_dir(job)
+            return
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # Todos os jobs do pool (rodando ou na fila) caem aqui
+            if executor is not None:
+                self._discard_executor(executor)
+            job.status = FAILED
+            job.error = f"Render worker died: {e}"
+            self._remove_dir(job)
+            return
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            self._remove_dir(job)
+            return
+
+        if result.get("cancelled") or job.status == CANCELLED:
+            job.status = CANCELLED
+            self._remove_dir(job)
+        elif result.get("error"):
+            job.status = FAILED
+            job.error = result["error"]
+            print(f"Job {job.id} failed:\n{result.get('traceback', '')}")
+        elif not result.get("output") or not Path(result["output"]).exists():
+            job.status = FAILED
+            job.error = f"{job.kind} failed (no output file created)"
+        else:
+            job.result_path = Path(result["output"])
+            job.stats = result.get("stats")
+            job.status = DONE
+
+    async def wait(self, job: Job) -> Job:
+        if job.future is not None:
+            try:
+                await asyncio.wrap_future(job.future)
+            except Exception:
+                pass
+            # O callback de conclusão roda em outra thread; garante que já rodou
+            while job.status not in FINISHED_STATES:
+                await asyncio.sleep(0.01)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        if job.future is not None and job.future.cancel():
+            return job
+        # Já está rodando: sinaliza o worker, que mata o ffmpeg
+        job.status = CANCELLED
+        if job.task is not None:
+            # cancel() pode ser chamado de uma thread do threadpool
+            job.task.get_loop().call_soon_threadsafe(job.task.cancel)
+            return job
+        try:
+            (job.job_dir / CANCEL_MARKER).touch()
+        except FileNotFoundError:
+            pass
+        return job
+
+    def fail(self, job: Job, error: str):
+        job.status = FAILED
+        job.error = error
+        job.finished_at = time.time()
+        self._remove_dir(job)
+
+    def _remove_dir(self, job: Job):
+        shutil.rmtree(job.job_dir, ignore_errors=True)
+
+    def cleanup_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [
+                j for j in self._jobs.values()
+                if j.status in FINISHED_STATES and j.finished_at and now - j.finished_at > self.result_ttl
+            ]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            self._remove_dir(job)
+        return len(expired)
+
+    async def run_cleanup_loop(self, interval: float = JOB_CLEANUP_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self.cleanup_expired()
+                if removed:
+                    print(f"Cleaned up {removed} expired job(s)")
+            except Exception as e:
+                print(f"Error cleaning up jobs: {e}")
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+        for job in jobs:
+            self._remove_dir(job)
@@ -1,21 +1,49 @@
 from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks
-from typing import Optional
+from typing import Dict, Optional
 from enum import Enum
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import uvicorn
-import io
-import wave
+import asyncio
 import json
 import shutil
 import tempfile
 import os
 from pathlib import Path
-import zipfile
 import video_engine
 import music_engine
+import downloader
+import model_registry
+import job_manager
+import render_tasks
+import upload_handler
+import segment_renderer
+import stream_package
+import image_prep
+import media_probe
+import audio_ingest
+import transcription
 from starlette.concurrency import run_in_threadpool
 
 app = FastAPI()
+# Limites de upload aplicados enquanto o corpo chega (antes do multipart ir para o disco)
+app.add_middleware(upload_handler.UploadLimitMiddleware)
+jobs = job_manager.JobManager()
+
+@app.on_event("startup")
+async def start_job_cleanup():
+    # Remove resultados expirados (JOB_RESULT_TTL) em segundo plano
+    asyncio.create_task(jobs.run_cleanup_loop())
+
+@app.on_event("shutdown")
+def stop_job_manager():
+    jobs.shutdown()
+    transcription.shutdown()
+    downloader.close_session()
+
+@app.on_event("startup")
+async def warm_whisper_models():
+    # Pré-carrega os modelos de WHISPER_WARM_MODELS sem travar o event loop
+    await run_in_threadpool(model_registry.warm_default_models)
 
 @app.get("/")
 def read_root():
@@ -23,130 +51,284 @@ def read_root():
 
 @app.post("/get-duration")
 async def get_audio_duration(file: UploadFile = File(...)):
-    # Lê o arquivo de áudio da memória
-    file_bytes = await file.read()
-    audio_file = io.BytesIO(file_bytes)
-    
     try:
-        with wave.open(audio_file, 'rb') as wav:
-            frames = wav.getnframes()
-            rate = wav.getframerate()
-            duration = frames / float(rate)
-            return {
-                "filename": file.filename,
-                "duration_seconds": duration,
-                "duration_formatted": f"{duration:.2f}s"
-            }
+        # O UploadFile já está em disco: hash medido na chegada e leitura só dos cabeçalhos
+        result = await upload_handler.hash_upload(file, upload_handler.UploadBudget())
+        suffix = os.path.splitext(file.filename or "")[1]
+        info = await run_in_threadpool(media_probe.probe_fileobj, file.file, result.sha256, suffix)
+        if info.duration is None:
+            return {"error": f"Could not determine duration of '{file.filename}'"}
+
+        return {
+            "filename": file.filename,
+            "duration_seconds": info.duration,
+            "duration_formatted": f"{info.duration:.2f}s",
+            "media": info.to_dict(),
+        }
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/whisper-cache/stats")
+def whisper_cache_stats():
+    return model_registry.registry.stats()
+
+@app.get("/downloads/stats")
+def downloads_stats():
+    return downloader.stats()
+
+@app.get("/music/stats")
+def music_stats():
+    return {**music_engine.concurrency_stats(), "cache": music_engine.music_cache.stats()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "segments": segment_renderer.segment_cache.stats(),
+        "image_masters": image_prep.image_cache.stats(),
+        "transcripts": transcription.transcript_cache.stats(),
+        "music": music_engine.music_cache.stats(),
+    }
+
 def cleanup_temp_dir(path: str):
     try:
         shutil.rmtree(path)
     except Exception as e:
         print(f"Error cleaning up {path}: {e}")
 
+def job_response(job):
+    return {
+        **job.to_dict(),
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result",
+    }
+
+async def finish_job(job, async_job: bool):
+    """
+    Modo assíncrono: devolve o job_id na hora.
+    Modo síncrono: aguarda o pool sem travar o event loop e devolve o arquivo.
+    """
+    if async_job:
+        return job_response(job)
+
+    await jobs.wait(job)
+    if job.status != job_manager.DONE:
+        return {"error": job.error or f"Job {job.status}"}
+
+    return FileResponse(
+        str(job.result_path),
+        media_type=job.media_type,
+        filename=job.filename,
+        headers={"X-Job-Id": job.id}
+    )
+
+def package_request(output_format: str, segment_seconds: Optional[float], ladder: Optional[str]) -> Optional[Dict]:
+    """
+    Campos output_format/segment_seconds/ladder -> opções do stream_package (None = MP4).
+    """
+    if not output_format or output_format.lower() == "mp4":
+        return None
+    return stream_package.package_options({
+        "format": output_format,
+        "segment_seconds": segment_seconds or stream_package.PACKAGE_SEGMENT_SECONDS,
+        "ladder": ladder,
+    })
+
+def use_package_result(job, package: Dict, name: str):
+    job.media_type = "application/zip"
+    job.filename = f"{name}_{package['format']}.zip"
+
+# Leitura do pipe do modo streaming
+STREAM_CHUNK_BYTES = 64 * 1024
+STREAM_POLL_SECONDS = 0.05
+
+def create_stream_pipe(job, name: str) -> Path:
+    """
+    Cria o pipe (FIFO) no lugar do arquivo de saída do job: o ffmpeg escreve nele
+    e o endpoint repassa os bytes ao cliente, sem gravar o vídeo em disco.
+    """
+    pipe_path = Path(job.job_dir) / name
+    os.mkfifo(pipe_path)
+    return pipe_path
+
+async def read_stream_pipe(job, pipe_path: Path):
+    """
+    Bytes do MP4 fragmentado conforme o ffmpeg produz. Termina quando o job acaba e
+    o pipe esvazia; se o job falhar, levanta RuntimeError.
+    """
+    # Não bloqueia esperando o escritor: o worker pode ainda estar preparando as imagens
+    fd = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        while True:
+            try:
+                chunk = os.read(fd, STREAM_CHUNK_BYTES)
+            except BlockingIOError:
+                chunk = None
+            if chunk:
+                yield chunk
+                continue
+            if job.status in job_manager.FINISHED_STATES:
+                # chunk == b"": sem escritor e nada pendente no pipe
+                if chunk is None:
+                    await asyncio.sleep(STREAM_POLL_SECONDS)
+                    continue
+                break
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+    finally:
+        os.close(fd)
+
+    if job.status != job_manager.DONE:
+        raise RuntimeError(job.error or f"Job {job.status}")
+
+async def stream_job(job, pipe_path: Path):
+    """
+    Resposta do modo streaming. Erros antes do primeiro byte voltam como JSON;
+    depois disso a conexão é abortada (o cliente recebe um corpo chunked incompleto)
+    e o erro fica em /jobs/{job_id}.
+    """
+    chunks = read_stream_pipe(job, pipe_path)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return {"error": "Stream ended without output"}
+    except RuntimeError as e:
+        return {"error": str(e)}
+
+    async def body():
+        finished = False
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+            finished = True
+        except RuntimeError as e:
+            print(f"Job {job.id} failed mid-stream: {e}")
+            raise
+        finally:
+            await chunks.aclose()
+            if not finished and job.status not in job_manager.FINISHED_STATES:
+                # Cliente desconectou: não deixa o ffmpeg preso no pipe
+                jobs.cancel(job.id)
+
+    return StreamingResponse(
+        body(),
+        media_type=job.media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{job.filename}"',
+            "X-Job-Id": job.id,
+        }
+    )
+
 @app.post("/generate-video")
 async def generate_video(
-    background_tasks: BackgroundTasks,
     config: str = Form(...),
     cover_file: UploadFile = File(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    async_job: bool = Form(False),
+    preview: bool = Form(False),
+    streaming: bool = Form(False),
+    output_format: str = Form("mp4"), # mp4 | hls | dash
+    segment_seconds: Optional[float] = Form(None),
+    ladder: Optional[str] = Form(None) # ex: "1080,720,480"
 ):
     try:
         config_data = json.loads(config)
     except json.JSONDecodeError:
         return {"error": "Invalid JSON in 'config' field"}
+    if preview:
+        config_data.setdefault("video", {})["preview"] = True
+    if streaming:
+        config_data.setdefault("video", {})["streaming"] = True
+    try:
+        package = package_request(output_format, segment_seconds, ladder)
+    except ValueError as e:
+        return {"error": str(e)}
+    if package:
+        if streaming:
+            return {"error": "streaming only supports output_format=mp4"}
+        config_data.setdefault("video", {})["package"] = package
+    multi_output = video_engine.is_multi_output(config_data)
+    if multi_output and (streaming or package):
+        return {"error": "video.resolutions (multiple outputs) only supports output_format=mp4 without streaming"}
 
-    # Create temp dir
-    temp_dir = tempfile.mkdtemp()
+    job = jobs.create("generate-video", media_type="video/mp4", filename="generated_video.mp4")
+    if package:
+        use_package_result(job, package, "generated_video")
+    elif multi_output:
+        job.media_type = "application/zip"
+        job.filename = "generated_videos.zip"
+    temp_dir = str(job.job_dir)
     
     try:
         # Save cover file
         # Usamos o nome original do arquivo para que o JSON possa referenciá-lo corretamente
         # ou, se o usuário preferir, poderíamos renomear para 'cover.jpg'.
         # Vou manter o nome original para flexibilidade, mas certifique-se que o JSON usa esse nome.
-        cover_path = os.path.join(temp_dir, cover_file.filename)
-        with open(cover_path, "wb") as f:
-            f.write(await cover_file.read())
-
-        # Save zip
-        zip_path = os.path.join(temp_dir, "data.zip")
-        with open(zip_path, "wb") as f:
-            f.write(await file.read())
-        
-        # Extract zip
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-            
-        # Define output path
-        output_filename = "output.mp4"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        # Run engine
-        # base_dir is where the images are extracted (temp_dir)
-        video_engine.generate_video_from_config(config_data, Path(temp_dir), Path(output_path))
-        
-        if not os.path.exists(output_path):
-             shutil.rmtree(temp_dir)
-             return {"error": "Video generation failed (no output file created)"}
+        budget = upload_handler.UploadBudget()
+        cover_name = upload_handler.safe_filename(cover_file.filename, "cover.jpg")
+        await upload_handler.save_upload(cover_file, Path(temp_dir) / cover_name, budget)
 
-        # Return file and schedule cleanup
-        background_tasks.add_task(cleanup_temp_dir, temp_dir)
-        return FileResponse(
-            output_path, 
-            media_type="video/mp4", 
-            filename="generated_video.mp4"
-        )
+        # Extrai o zip direto do upload (sem gravar data.zip)
+        await upload_handler.extract_zip_upload(file, Path(temp_dir), budget)
+        job.uploads = budget.to_dict()
+
+        if streaming:
+            pipe_path = create_stream_pipe(job, render_tasks.GENERATE_VIDEO_OUTPUT)
+            jobs.submit(job, render_tasks.generate_video_task, config_data)
+            return await stream_job(job, pipe_path)
+
+        jobs.submit(job, render_tasks.generate_video_task, config_data)
+        return await finish_job(job, async_job)
 
     except Exception as e:
-        shutil.rmtree(temp_dir)
+        jobs.fail(job, str(e))
         return {"error": str(e)}
 
 @app.post("/generate-music")
 async def generate_music(
-    background_tasks: BackgroundTasks,
     prompt: str = Form(...),
-    duration: int = Form(25)
+    duration: int = Form(25),
+    backend: Optional[str] = Form(None),
+    async_job: bool = Form(False)
 ):
-    temp_dir = tempfile.mkdtemp()
+    job = jobs.create("generate-music", media_type="audio/mpeg", filename="generated_music.mp3")
     try:
-        output_filename = "generated_music.mp3"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        music_engine.generate_music(prompt, duration, Path(output_path))
-        
-        if not os.path.exists(output_path):
-             shutil.rmtree(temp_dir)
-             return {"error": "Music generation failed"}
-
-        background_tasks.add_task(cleanup_temp_dir, temp_dir)
-        return FileResponse(
-            output_path, 
-            media_type="audio/mpeg", 
-            filename="generated_music.mp3"
-        )
+        # Roda no event loop (polling da predição), limitado por MUSIC_MAX_CONCURRENT
+        jobs.submit_async(job, render_tasks.generate_music_task, prompt, duration, backend)
+        return await finish_job(job, async_job)
 
     except Exception as e:
-        shutil.rmtree(temp_dir)
+        jobs.fail(job, str(e))
         return {"error": str(e)}
 
 @app.post("/merge-video-audio")
 async def merge_video_audio_endpoint(
-    background_tasks: BackgroundTasks,
     video_file: UploadFile = File(...),
     narration_file: Optional[UploadFile] = File(None),
     background_file: Optional[UploadFile] = File(None),
     vol_narration: float = Form(1.0),
     vol_background: float = Form(0.1),
-    fade_duration: float = Form(2.0)
+    fade_duration: float = Form(2.0),
+    async_job: bool = Form(False),
+    smart_render: Optional[bool] = Form(None),
+    output_format: str = Form("mp4"), # mp4 | hls | dash
+    segment_seconds: Optional[float] = Form(None),
+    ladder: Optional[str] = Form(None) # ex: "1080,720,480"
 ):
-    temp_dir = tempfile.mkdtemp()
     try:
+        package = package_request(output_format, segment_seconds, ladder)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    job = jobs.create("merge-video-audio", media_type="video/mp4", filename="merged_video.mp4")
+    if package:
+        use_package_result(job, package, "merged_video")
+    temp_dir = str(job.job_dir)
+    try:
+        budget = upload_handler.UploadBudget()
+
         # Save video file
         video_path = os.path.join(temp_dir, "input_video.mp4")
-        with open(video_path, "wb") as f:
-            f.write(await video_file.read())
+        await upload_handler.save_upload(video_file, Path(video_path), budget)
             
         narration_path = None
         if narration_file:
@@ -155,109 +337,252 @@ async def merge_video_audio_endpoint(
             original_ext = os.path.splitext(narration_file.filename)[1] if narration_file.filename else ""
             ext = original_ext or ".wav"
             narration_path = os.path.join(temp_dir, f"narration{ext}")
-            with open(narration_path, "wb") as f:
-                f.write(await narration_file.read())
+            await upload_handler.save_upload(narration_file, Path(narration_path), budget)
                 
         background_path = None
         if background_file:
             original_ext = os.path.splitext(background_file.filename)[1] if background_file.filename else ""
             ext = original_ext or ".mp3"
             background_path = os.path.join(temp_dir, f"background{ext}")
-            with open(background_path, "wb") as f:
-                f.write(await background_file.read())
-                
-        output_filename = "merged_output.mp4"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        video_engine.merge_video_audio(
-            video_input=Path(video_path),
-            output_file=Path(output_path),
-            narration_input=Path(narration_path) if narration_path else None,
-            background_input=Path(background_path) if background_path else None,
-            vol_narration=vol_narration,
-            vol_background=vol_background,
-            fade_duration=fade_duration
-        )
-        
-        if not os.path.exists(output_path):
-             shutil.rmtree(temp_dir)
-             return {"error": "Merge failed (no output file created)"}
+            await upload_handler.save_upload(background_file, Path(background_path), budget)
+        job.uploads = budget.to_dict()
 
-        background_tasks.add_task(cleanup_temp_dir, temp_dir)
-        return FileResponse(
-            output_path, 
-            media_type="video/mp4", 
-            filename="merged_video.mp4"
+        jobs.submit(
+            job,
+            render_tasks.merge_video_audio_task,
+            video_path,
+            narration_path,
+            background_path,
+            vol_narration,
+            vol_background,
+            fade_duration,
+            smart_render,
+            package
         )
+        return await finish_job(job, async_job)
 
     except Exception as e:
-        shutil.rmtree(temp_dir)
+        jobs.fail(job, str(e))
         return {"error": str(e)}
 
 @app.post("/add-subtitles")
 async def add_subtitles_endpoint(
-    background_tasks: BackgroundTasks,
     video_file: UploadFile = File(...),
     subtitle_content: str = Form(...),
     position_y: int = Form(0), # 0 = Base Absoluta, Valor Positivo = Sobe em direção ao topo
     font_color: str = Form("#FFFFFF"),
     outline_color: str = Form("#000000"),
     font_size: int = Form(24),
-    output_name: str = Form("video_subbed")
+    output_name: str = Form("video_subbed"),
+    async_job: bool = Form(False),
+    subtitle_mode: Optional[str] = Form(None) # burn | partial | soft
 ):
-    temp_dir = tempfile.mkdtemp()
+    # Ensure output name ends with .mp4
+    if not output_name.lower().endswith(".mp4"):
+        output_name += ".mp4"
+
+    job = jobs.create("add-subtitles", media_type="video/mp4", filename=output_name)
+    temp_dir = str(job.job_dir)
     try:
         # Save video
         # We try to keep original extension or default to mp4
         orig_ext = os.path.splitext(video_file.filename)[1] if video_file.filename else ".mp4"
         video_path = os.path.join(temp_dir, f"input_video{orig_ext}")
-        with open(video_path, "wb") as f:
-            f.write(await video_file.read())
+        budget = upload_handler.UploadBudget()
+        await upload_handler.save_upload(video_file, Path(video_path), budget)
+        job.uploads = budget.to_dict()
             
         # Save SRT
         srt_path = os.path.join(temp_dir, "subtitles.srt")
         with open(srt_path, "w", encoding="utf-8") as f:
             f.write(subtitle_content)
-            
-        # Ensure output name ends with .mp4
-        if not output_name.lower().endswith(".mp4"):
-            output_name += ".mp4"
-            
-        output_filename = "video_with_subs.mp4" # Internal name
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        # --- A CORREÇÃO ESTÁ AQUI ---
-        video_engine.add_subtitles(
-            video_input=Path(video_path),
-            srt_input=Path(srt_path),
-            output_file=Path(output_path),
-            position_y=position_y,      # <--- Corrigido de vertical_pos para position_y
-            font_color=font_color,
-            outline_color=outline_color,
-            font_size=font_size
+
+        jobs.submit(
+            job,
+            render_tasks.add_subtitles_task,
+            video_path,
+            srt_path,
+            position_y,
+            font_color,
+            outline_color,
+            font_size,
+            subtitle_mode
         )
-        # ----------------------------
-        
-        if not os.path.exists(output_path):
-             shutil.rmtree(temp_dir)
-             return {"error": "Subtitle addition failed (no output file created)"}
+        return await finish_job(job, async_job)
 
-        background_tasks.add_task(cleanup_temp_dir, temp_dir)
-        return FileResponse(
-            output_path, 
-            media_type="video/mp4", 
-            filename=output_name
+    except Exception as e:
+        jobs.fail(job, str(e))
+        return {"error": str(e)}
+
+@app.post("/render-full")
+async def render_full_endpoint(
+    config: str = Form(...),
+    cover_file: UploadFile = File(...),
+    file: UploadFile = File(...),
+    narration_file: Optional[UploadFile] = File(None),
+    background_file: Optional[UploadFile] = File(None),
+    vol_narration: float = Form(1.0),
+    vol_background: float = Form(0.1),
+    fade_duration: float = Form(2.0),
+    subtitle_content: Optional[str] = Form(None),
+    position_y: int = Form(0),
+    font_color: str = Form("#FFFFFF"),
+    outline_color: str = Form("#000000"),
+    font_size: int = Form(24),
+    output_name: str = Form("video_final"),
+    async_job: bool = Form(False),
+    preview: bool = Form(False),
+    streaming: bool = Form(False)
+):
+    """
+    /generate-video + /merge-video-audio + /add-subtitles num único encode.
+    streaming=true devolve o MP4 fragmentado enquanto o encode roda.
+    """
+    try:
+        config_data = json.loads(config)
+    except json.JSONDecodeError:
+        return {"error": "Invalid JSON in 'config' field"}
+    if preview:
+        config_data.setdefault("video", {})["preview"] = True
+    if streaming:
+        config_data.setdefault("video", {})["streaming"] = True
+
+    if not output_name.lower().endswith(".mp4"):
+        output_name += ".mp4"
+
+    job = jobs.create("render-full", media_type="video/mp4", filename=output_name)
+    temp_dir = Path(job.job_dir)
+    try:
+        budget = upload_handler.UploadBudget()
+        cover_name = upload_handler.safe_filename(cover_file.filename, "cover.jpg")
+        await upload_handler.save_upload(cover_file, temp_dir / cover_name, budget)
+        await upload_handler.extract_zip_upload(file, temp_dir, budget)
+
+        narration_path = None
+        if narration_file:
+            ext = os.path.splitext(narration_file.filename or "")[1] or ".wav"
+            narration_path = temp_dir / f"narration{ext}"
+            await upload_handler.save_upload(narration_file, narration_path, budget)
+
+        background_path = None
+        if background_file:
+            ext = os.path.splitext(background_file.filename or "")[1] or ".mp3"
+            background_path = temp_dir / f"background{ext}"
+            await upload_handler.save_upload(background_file, background_path, budget)
+        job.uploads = budget.to_dict()
+
+        srt_path = None
+        if subtitle_content:
+            srt_path = temp_dir / "subtitles.srt"
+            srt_path.write_text(subtitle_content, encoding="utf-8")
+
+        pipe_path = create_stream_pipe(job, render_tasks.RENDER_FULL_OUTPUT) if streaming else None
+        jobs.submit(
+            job,
+            render_tasks.render_full_task,
+            config_data,
+            str(narration_path) if narration_path else None,
+            str(background_path) if background_path else None,
+            vol_narration,
+            vol_background,
+            fade_duration,
+            str(srt_path) if srt_path else None,
+            position_y,
+            font_color,
+            outline_color,
+            font_size
         )
+        if pipe_path is not None:
+            return await stream_job(job, pipe_path)
+        return await finish_job(job, async_job)
 
     except Exception as e:
-        shutil.rmtree(temp_dir)
+        jobs.fail(job, str(e))
         return {"error": str(e)}
 
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job_response(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events com o progresso do job (frame, fps, out_time, speed, percent, eta_seconds).
+    O stream termina quando o job acaba.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+
+    async def event_stream():
+        last = None
+        while True:
+            data = job_response(job)
+            payload = json.dumps(data)
+            if payload != last:
+                last = payload
+                yield f"event: {data['status']}\ndata: {payload}\n\n"
+            if data["status"] in job_manager.FINISHED_STATES:
+                break
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    if job.status != job_manager.DONE:
+        return JSONResponse(job_response(job), status_code=409)
+    if not job.result_path.is_file():
+        # Modo streaming: o resultado foi entregue pelo pipe e não fica em disco
+        return JSONResponse({"error": "Result was streamed and is not stored"}, status_code=410)
+    return FileResponse(str(job.result_path), media_type=job.media_type, filename=job.filename)
+
+@app.get("/jobs/{job_id}/package/{path:path}")
+def get_job_package_file(job_id: str, path: str):
+    """
+    Arquivos do pacote HLS/DASH (manifestos e segmentos) conforme são gravados,
+    antes do job terminar. Depois, o pacote completo vem em /jobs/{job_id}/result (zip).
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    root = (Path(job.job_dir) / stream_package.PACKAGE_DIR).resolve()
+    target = (root / path).resolve()
+    if root not in target.parents or not target.is_file() or target.name.endswith(".tmp"):
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    media_types = {
+        ".m3u8": "application/vnd.apple.mpegurl",
+        ".mpd": "application/dash+xml",
+        ".ts": "video/mp2t",
+        ".m4s": "video/iso.segment",
+    }
+    # Playlists mudam a cada segmento enquanto o job roda
+    headers = {"Cache-Control": "no-cache"} if target.suffix in (".m3u8", ".mpd") else {}
+    return FileResponse(str(target), media_type=media_types.get(target.suffix, "application/octet-stream"), headers=headers)
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job_response(job)
+
 @app.post("/auto-subtitles")
 async def auto_subtitles_endpoint(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    words_per_line: int = Form(5)
+    words_per_line: int = Form(5),
+    chunked: Optional[bool] = Form(None)
 ):
     temp_dir = tempfile.mkdtemp()
     try:
@@ -265,24 +590,40 @@ async def auto_subtitles_endpoint(
         orig_ext = os.path.splitext(file.filename)[1] if file.filename else ".mp3"
         # Generate generic name but keep extension
         input_path = os.path.join(temp_dir, f"input_media{orig_ext}")
-        with open(input_path, "wb") as f:
-            f.write(await file.read())
+        upload = await upload_handler.save_upload(file, Path(input_path), upload_handler.UploadBudget())
             
+        # Decodifica o áudio uma vez (PCM 16 kHz), só num miss do cache de transcrições;
+        # Whisper e análise usam o mesmo buffer
+        ingested = {}
+
+        def load_audio():
+            ingested["audio"] = audio_ingest.ingest(Path(input_path), Path(temp_dir), upload.sha256)
+            return ingested["audio"]
+
         # Generate subtitles using Whisper
         try:
             srt_content = await run_in_threadpool(
                 video_engine.generate_subtitles,
                 audio_path=Path(input_path),
                 output_srt_path=None, # Don't need file output
-                words_per_line=words_per_line
+                words_per_line=words_per_line,
+                chunked=chunked,
+                audio_sha256=upload.sha256,
+                audio_loader=load_audio
             )
         except Exception as e:
             raise RuntimeError(f"Subtitle generation failed: {e}")
+        if "audio" in ingested:
+            audio_info = await run_in_threadpool(ingested["audio"].to_dict)
+            transcription.store_audio_info(upload.sha256, audio_info)
+        else:
+            # Cache hit: estatísticas guardadas junto com a transcrição (None se não houver)
+            audio_info = transcription.cached_audio_info(upload.sha256)
 
         background_tasks.add_task(cleanup_temp_dir, temp_dir)
         
         # Return the content directly
-        return {"subtitles": srt_content}
+        return {"subtitles": srt_content, "audio": audio_info}
 
     except Exception as e:
         shutil.rmtree(temp_dir)
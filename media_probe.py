@@ -0,0 +1,578 @@
+"""
+Probe de mídia: duração, dimensões, codecs e sample rate de WAV/MP3/MP4/MOV e imagens.
+
+Lê os cabeçalhos do container direto do arquivo quando conhece o formato e só cai para
+uma única chamada de ffprobe (formato + streams de uma vez) nos outros casos.
+Os resultados são memorizados por (caminho, tamanho, mtime), sem ler o arquivo inteiro;
+uploads ainda abertos (probe_fileobj) usam o sha256 medido na chegada.
+"""
+import json
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+PROBE_MEMO_SIZE = int(os.environ.get("PROBE_MEMO_SIZE", "1024"))
+
+
+class MediaInfo:
+    def __init__(
+        self,
+        format_name: str,
+        duration: Optional[float] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        video_codec: Optional[str] = None,
+        audio_codec: Optional[str] = None,
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        source: str = "header"
+    ):
+        self.format_name = format_name
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.video_codec = video_codec
+        self.audio_codec = audio_codec
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # "header" (leitura direta do container) ou "ffprobe"
+        self.source = source
+
+    def to_dict(self) -> Dict:
+        return {
+            "format": self.format_name,
+            "duration": self.duration,
+            "width": self.width,
+            "height": self.height,
+            "video_codec": self.video_codec,
+            "audio_codec": self.audio_codec,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "source": self.source,
+        }
+
+
+# Chave: file_key ou sha256 do upload (probe), "<tipo>:<file_key>" (stream de vídeo, keyframes)
+_memo: "OrderedDict[str, Any]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def file_key(path: Path) -> str:
+    """
+    Chave do memo para um arquivo em disco: caminho + tamanho + mtime. Não lê o conteúdo
+    (o sha256 leria o vídeo inteiro antes de cada probe de poucos KB).
+    """
+    st = os.stat(path)
+    return f"{Path(path).resolve()}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _memo_get(key: str) -> Optional[Any]:
+    with _memo_lock:
+        info = _memo.get(key)
+        if info is not None:
+            _memo.move_to_end(key)
+        return info
+
+
+def _memo_put(key: str, info: Any):
+    with _memo_lock:
+        _memo[key] = info
+        _memo.move_to_end(key)
+        while len(_memo) > PROBE_MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+# --- WAV ----------------------------------------------------------------------------
+
+def _wav_codec(audio_format: int, bits: int) -> Optional[str]:
+    if audio_format == 1:
+        return "pcm_u8" if bits == 8 else f"pcm_s{bits}le"
+    if audio_format == 3:
+        return f"pcm_f{bits}le"
+    return {6: "pcm_alaw", 7: "pcm_mulaw"}.get(audio_format)
+
+
+def _parse_wav(f: BinaryIO, size: int) -> Optional[MediaInfo]:
+    f.seek(12)
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", header)
+        data_start = f.tell()
+
+        if chunk_id == b"fmt ":
+            raw = f.read(min(chunk_size, 40))
+            if len(raw) < 16:
+                return None
+            audio_format, channels, sample_rate, byte_rate, _, bits = struct.unpack("<HHIIHH", raw[:16])
+            if audio_format == 0xFFFE and len(raw) >= 26:
+                # WAVE_FORMAT_EXTENSIBLE: o formato real está no início do SubFormat GUID
+                audio_format = struct.unpack("<H", raw[24:26])[0]
+            fmt = (audio_format, channels, sample_rate, byte_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None or not fmt[3]:
+                return None
+            audio_format, channels, sample_rate, byte_rate, bits = fmt
+            # 0xFFFFFFFF = tamanho desconhecido (gravado em streaming): vai até o fim do arquivo
+            data_size = size - data_start if chunk_size == 0xFFFFFFFF else min(chunk_size, size - data_start)
+            return MediaInfo(
+                "wav",
+                duration=data_size / float(byte_rate),
+                audio_codec=_wav_codec(audio_format, bits),
+                sample_rate=sample_rate,
+                channels=channels,
+            )
+
+        # Chunks têm tamanho par (byte de padding)
+        f.seek(data_start + chunk_size + (chunk_size & 1))
+
+
+# --- MP3 ----------------------------------------------------------------------------
+
+_MP3_BITRATES = {
+    # (MPEG1?, layer) -> kbps por índice
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _mp3_frame(header: bytes) -> Optional[Dict]:
+    """
+    Decodifica o cabeçalho de 4 bytes de um frame MPEG audio (None se inválido).
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_idx = header[2] >> 4
+    sr_idx = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_idx in (0, 15) or sr_idx == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_idx] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sr_idx]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "samples": samples,
+        "length": length,
+        "channels": 1 if (header[3] >> 6) == 3 else 2,
+    }
+
+
+def _parse_mp3(f: BinaryIO, size: int) -> Optional[MediaInfo]:
+    f.seek(0)
+    start = 0
+    head = f.read(10)
+    if head[:3] == b"ID3" and len(head) == 10:
+        # Tamanho syncsafe (7 bits por byte) + rodapé opcional
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+
+    f.seek(start)
+    window = f.read(64 * 1024)
+    frame = None
+    pos = 0
+    while pos < len(window) - 4:
+        frame = _mp3_frame(window[pos:pos + 4])
+        if frame:
+            # Confirma com o frame seguinte para não aceitar um falso sync
+            f.seek(start + pos + frame["length"])
+            if _mp3_frame(f.read(4)):
+                break
+        frame = None
+        pos += 1
+    if frame is None:
+        return None
+
+    frame_start = start + pos
+    f.seek(frame_start)
+    first = f.read(min(frame["length"], 256))
+    codec = {1: "mp1", 2: "mp2", 3: "mp3"}[frame["layer"]]
+    info = MediaInfo(codec, audio_codec=codec, sample_rate=frame["sample_rate"], channels=frame["channels"])
+
+    # VBR: frame Xing/Info (ou VBRI) com o total de frames
+    side_info = (32 if frame["channels"] == 2 else 17) if frame["mpeg1"] else (17 if frame["channels"] == 2 else 9)
+    xing = 4 + side_info
+    if first[xing:xing + 4] in (b"Xing", b"Info") and len(first) >= xing + 12:
+        flags = struct.unpack(">I", first[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", first[xing + 8:xing + 12])[0]
+            info.duration = frames * frame["samples"] / float(frame["sample_rate"])
+            return info
+    if first[36:40] == b"VBRI" and len(first) >= 54:
+        frames = struct.unpack(">I", first[50:54])[0]
+        info.duration = frames * frame["samples"] / float(frame["sample_rate"])
+        return info
+
+    # CBR: bytes de áudio / bitrate (sem a tag ID3v1 do final)
+    audio_bytes = size - frame_start
+    f.seek(max(0, size - 128))
+    if f.read(3) == b"TAG":
+        audio_bytes -= 128
+    info.duration = audio_bytes * 8 / float(frame["bitrate"])
+    return info
+
+
+# --- MP4 / MOV ----------------------------------------------------------------------
+
+_MP4_CODECS = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "av01": "av1",
+    "vp09": "vp9", "mp4v": "mpeg4", "mp4a": "aac", "Opus": "opus", "fLaC": "flac",
+    "ac-3": "ac3", "ec-3": "eac3", ".mp3": "mp3", "lpcm": "pcm", "sowt": "pcm_s16le",
+}
+
+
+def _boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[str, int, int]]:
+    """
+    Percorre as caixas ISO-BMFF em [start, end): (tipo, início do conteúdo, fim).
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type.decode("latin-1"), pos + header, pos + size
+        pos += size
+
+
+def _find_box(f: BinaryIO, start: int, end: int, box_type: str) -> Optional[Tuple[int, int]]:
+    for name, content, box_end in _boxes(f, start, end):
+        if name == box_type:
+            return content, box_end
+    return None
+
+
+def _parse_track(f: BinaryIO, start: int, end: int, info: MediaInfo):
+    mdia = _find_box(f, start, end, "mdia")
+    if not mdia:
+        return
+    hdlr = _find_box(f, *mdia, "hdlr")
+    stbl = None
+    minf = _find_box(f, *mdia, "minf")
+    if minf:
+        stbl = _find_box(f, *minf, "stbl")
+    stsd = _find_box(f, *stbl, "stsd") if stbl else None
+    if not hdlr or not stsd:
+        return
+
+    f.seek(hdlr[0] + 8)
+    handler = f.read(4)
+    # stsd: versão/flags + contagem, depois a primeira sample entry
+    f.seek(stsd[0] + 8)
+    entry = f.read(36)
+    if len(entry) < 36:
+        return
+    fourcc = entry[4:8].decode("latin-1")
+    codec = _MP4_CODECS.get(fourcc, fourcc.strip())
+
+    if handler == b"vide" and info.video_codec is None:
+        info.video_codec = codec
+        info.width, info.height = struct.unpack(">HH", entry[32:36])
+    elif handler == b"soun" and info.audio_codec is None:
+        info.audio_codec = codec
+        info.channels = struct.unpack(">H", entry[24:26])[0]
+        # Sample rate em ponto fixo 16.16
+        info.sample_rate = struct.unpack(">H", entry[32:34])[0]
+
+
+def _parse_mp4(f: BinaryIO, size: int) -> Optional[MediaInfo]:
+    moov = _find_box(f, 0, size, "moov")
+    if not moov:
+        return None
+    mvhd = _find_box(f, *moov, "mvhd")
+    if not mvhd:
+        return None
+
+    f.seek(mvhd[0])
+    version = f.read(1)[0]
+    f.seek(mvhd[0] + (20 if version == 1 else 12))
+    if version == 1:
+        timescale, duration = struct.unpack(">IQ", f.read(12))
+    else:
+        timescale, duration = struct.unpack(">II", f.read(8))
+    if not timescale or not duration:
+        # MP4 fragmentado: a duração está nos fragmentos, deixa para o ffprobe
+        return None
+
+    f.seek(0)
+    brand = f.read(12)[8:12]
+    info = MediaInfo("mov" if brand == b"qt  " else "mp4", duration=duration / float(timescale))
+    for name, content, box_end in _boxes(f, *moov):
+        if name == "trak":
+            _parse_track(f, content, box_end, info)
+    return info
+
+
+# --- Imagens ------------------------------------------------------------------------
+
+def _parse_png(f: BinaryIO, size: int) -> Optional[MediaInfo]:
+    f.seek(12)
+    data = f.read(12)
+    if data[:4] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", data[4:12])
+    return MediaInfo("png", width=width, height=height, video_codec="png")
+
+
+def _parse_jpeg(f: BinaryIO, size: int) -> Optional[MediaInfo]:
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length_raw = f.read(2)
+        if len(length_raw) < 2:
+            return None
+        length = struct.unpack(">H", length_raw)[0]
+        # SOF0..SOF15, exceto DHT (C4), JPG (C8) e DAC (CC)
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return MediaInfo("jpeg", width=width, height=height, video_codec="mjpeg")
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _parse_webp(f: BinaryIO, size: int) -> Optional[MediaInfo]:
+    f.seek(12)
+    data = f.read(18)
+    chunk = data[:4]
+    if chunk == b"VP8 " and data[11:14] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", data[14:18])
+        width, height = width & 0x3FFF, height & 0x3FFF
+    elif chunk == b"VP8L" and data[8] == 0x2F:
+        bits = struct.unpack("<I", data[9:13])[0]
+        width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    elif chunk == b"VP8X":
+        width = int.from_bytes(data[12:15], "little") + 1
+        height = int.from_bytes(data[15:18], "little") + 1
+    else:
+        return None
+    return MediaInfo("webp", width=width, height=height, video_codec="webp")
+
+
+# --- Detecção e ffprobe -------------------------------------------------------------
+
+def _sniff(head: bytes) -> Optional[Callable[[BinaryIO, int], Optional[MediaInfo]]]:
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return _parse_wav
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return _parse_webp
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return _parse_png
+    if head[:3] == b"\xff\xd8\xff":
+        return _parse_jpeg
+    if head[4:8] == b"ftyp":
+        return _parse_mp4
+    if head[:3] == b"ID3" or _mp3_frame(head[:4]):
+        return _parse_mp3
+    return None
+
+
+def parse_headers(f: BinaryIO, size: int) -> Optional[MediaInfo]:
+    """
+    Lê os metadados direto dos cabeçalhos. None se o formato não é conhecido ou o
+    arquivo está fora do esperado (o chamador usa o ffprobe).
+    """
+    f.seek(0)
+    parser = _sniff(f.read(16))
+    if parser is None:
+        return None
+    try:
+        return parser(f, size)
+    except (struct.error, IndexError, KeyError, ValueError, ZeroDivisionError, OSError):
+        return None
+
+
+def ffprobe(path: Path) -> MediaInfo:
+    """
+    Uma única chamada de ffprobe com formato e streams.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", str(path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed with exit code {result.returncode}.\nStderr: {result.stderr}")
+
+    data = json.loads(result.stdout or "{}")
+    fmt = data.get("format", {})
+    info = MediaInfo(fmt.get("format_name", "unknown").split(",")[0], source="ffprobe")
+    if fmt.get("duration") not in (None, "N/A"):
+        info.duration = float(fmt["duration"])
+
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and info.video_codec is None:
+            info.video_codec = stream.get("codec_name")
+            info.width, info.height = stream.get("width"), stream.get("height")
+        elif stream.get("codec_type") == "audio" and info.audio_codec is None:
+            info.audio_codec = stream.get("codec_name")
+            info.sample_rate = int(stream["sample_rate"]) if stream.get("sample_rate") else None
+            info.channels = stream.get("channels")
+    return info
+
+
+# --- API ----------------------------------------------------------------------------
+
+def probe(path: Path, sha256: Optional[str] = None) -> MediaInfo:
+    """
+    Metadados do arquivo. Com `sha256` (uploads), o resultado é compartilhado com o
+    probe_fileobj do mesmo conteúdo.
+    """
+    key = sha256 or file_key(path)
+    info = _memo_get(key)
+    if info is not None:
+        return info
+
+    with open(path, "rb") as f:
+        info = parse_headers(f, os.fstat(f.fileno()).st_size)
+    if info is None:
+        info = ffprobe(path)
+    _memo_put(key, info)
+    return info
+
+
+def probe_fileobj(fileobj: BinaryIO, sha256: str, suffix: str = "") -> MediaInfo:
+    """
+    Probe de um arquivo aberto (ex.: o temporário de um UploadFile) sem carregá-lo na memória.
+    Só copia para o disco se precisar do ffprobe.
+    """
+    info = _memo_get(sha256)
+    if info is not None:
+        return info
+
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    info = parse_headers(fileobj, size)
+    if info is None:
+        fd, tmp = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                fileobj.seek(0)
+                shutil.copyfileobj(fileobj, out, 1024 * 1024)
+            info = ffprobe(Path(tmp))
+        finally:
+            os.unlink(tmp)
+    _memo_put(sha256, info)
+    return info
+
+
+def get_duration(path: Path) -> float:
+    info = probe(path)
+    if info.duration is None:
+        raise ValueError(f"Não foi possível obter a duração de {Path(path).name}")
+    return info.duration
+
+
+def get_dimensions(path: Path) -> Tuple[int, int]:
+    info = probe(path)
+    if not info.width or not info.height:
+        raise ValueError(f"Não foi possível obter as dimensões de {Path(path).name}")
+    return info.width, info.height
+
+
+def video_stream_params(path: Path) -> Dict:
+    """
+    Parâmetros de codificação do primeiro stream de vídeo (codec, profile, level,
+    pix_fmt, tamanho, frame rate, start_time), usados para casar um re-encode parcial.
+    """
+    key = f"stream:{file_key(path)}"
+    params = _memo_get(key)
+    if params is not None:
+        return params
+
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries",
+         "stream=codec_name,profile,level,pix_fmt,width,height,r_frame_rate,avg_frame_rate,"
+         "start_time,sample_aspect_ratio",
+         "-of", "json", str(path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed with exit code {result.returncode}.\nStderr: {result.stderr}")
+    streams = json.loads(result.stdout or "{}").get("streams", [])
+    params = streams[0] if streams else {}
+    _memo_put(key, params)
+    return params
+
+
+def get_keyframe_times(path: Path) -> List[float]:
+    """
+    Tempos (pts, em segundos) dos keyframes do primeiro stream de vídeo.
+    Lê só as flags dos pacotes, sem decodificar.
+    """
+    key = f"keyframes:{file_key(path)}"
+    times = _memo_get(key)
+    if times is not None:
+        return times
+
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=print_section=0", str(path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed with exit code {result.returncode}.\nStderr: {result.stderr}")
+
+    times = []
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            times.append(float(pts))
+    times.sort()
+    _memo_put(key, times)
+    return times
+
+
+def count_video_frames(path: Path) -> Tuple[int, float]:
+    """
+    Frames (pacotes, sem decodificar) e duração do primeiro stream de vídeo.
+    Sem memo: serve para conferir saídas recém-geradas.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+         "-show_entries", "stream=nb_read_packets,duration", "-of", "json", str(path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed with exit code {result.returncode}.\nStderr: {result.stderr}")
+    streams = json.loads(result.stdout or "{}").get("streams", [])
+    if not streams:
+        return 0, 0.0
+    duration = streams[0].get("duration")
+    return int(streams[0].get("nb_read_packets") or 0), float(duration) if duration not in (None, "N/A") else 0.0
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Orçamento de memória para modelos residentes (MB). 0 = sem limite.
+# Vale por processo: os workers da transcrição em trechos (transcription.WHISPER_WORKERS)
+# têm cada um seu registro e sua cópia do modelo. A transcrição só usa esse pool quando
+# as cópias dos workers cabem no que sobra deste orçamento (ver transcription._pool_fits).
+WHISPER_CACHE_MAX_MB = int(os.environ.get("WHISPER_CACHE_MAX_MB", "0"))
+# Modelos para pré-carregar no startup, ex: "medium" ou "tiny,medium:cuda"
+WHISPER_WARM_MODELS = os.environ.get("WHISPER_WARM_MODELS", "")
+
+
+def default_device() -> str:
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+def estimate_model_bytes(model) -> int:
+    """
+    Soma o tamanho dos parâmetros e buffers do modelo (aproximação da memória residente).
+    """
+    total = 0
+    try:
+        for p in model.parameters():
+            total += p.numel() * p.element_size()
+        for b in model.buffers():
+            total += b.numel() * b.element_size()
+    except Exception:
+        pass
+    return total
+
+
+class _Entry:
+    def __init__(self, model, size_bytes: int):
+        self.model = model
+        self.size_bytes = size_bytes
+        # Whisper não é seguro para transcrições concorrentes no mesmo modelo,
+        # então cada modelo tem seu próprio lock de uso.
+        self.use_lock = threading.Lock()
+        self.in_use = 0
+
+
+class WhisperModelRegistry:
+    """
+    Registro global de modelos Whisper carregados, indexado por (model_size, device).
+    Cada modelo é carregado uma única vez e compartilhado entre requisições.
+    Quando o orçamento de memória é excedido, os modelos menos usados
+    recentemente (e que não estão em uso) são descarregados.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "evictions": 0,
+            "load_seconds_total": 0.0,
+            "last_load_seconds": 0.0,
+        }
+
+    def _key(self, model_size: str, device: Optional[str]) -> Tuple[str, str]:
+        return (model_size, device or default_device())
+
+    def _load(self, model_size: str, device: str):
+        # Import tardio: processos que só renderizam vídeo não precisam carregar torch.
+        import whisper
+        return whisper.load_model(model_size, device=device)
+
+    def _get_entry(self, model_size: str, device: Optional[str], reserve: bool = False) -> _Entry:
+        """
+        Com reserve=True, o in_use é incrementado sob o mesmo lock da busca, para que
+        nenhum despejo aconteça entre achar o modelo e reservá-lo.
+        """
+        key = self._key(model_size, device)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                entry.in_use += int(reserve)
+                return entry
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Só uma thread carrega cada modelo; as outras esperam e reaproveitam.
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    entry.in_use += int(reserve)
+                    return entry
+                self._stats["misses"] += 1
+
+            print(f"Loading Whisper model ({key[0]} on {key[1]})...")
+            start = time.perf_counter()
+            model = self._load(key[0], key[1])
+            elapsed = time.perf_counter() - start
+            entry = _Entry(model, estimate_model_bytes(model))
+
+            entry.in_use += int(reserve)
+
+            with self._lock:
+                self._entries[key] = entry
+                self._stats["loads"] += 1
+                self._stats["load_seconds_total"] += elapsed
+                self._stats["last_load_seconds"] = elapsed
+                self._evict_locked(keep=key)
+
+            print(f"Whisper model {key[0]} loaded in {elapsed:.2f}s")
+            return entry
+
+    def _evict_locked(self, keep: Optional[Tuple[str, str]] = None):
+        if self.max_bytes <= 0:
+            return
+        # O modelo mais recente nunca é despejado, mesmo que sozinho exceda o orçamento
+        for key in list(self._entries.keys())[:-1]:
+            if self._used_bytes_locked() <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if key == keep or entry.in_use > 0:
+                continue
+            del self._entries[key]
+            self._stats["evictions"] += 1
+            print(f"Evicting Whisper model {key[0]} ({key[1]})")
+        self._release_cuda_cache()
+
+    def _used_bytes_locked(self) -> int:
+        return sum(e.size_bytes for e in self._entries.values())
+
+    def _release_cuda_cache(self):
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+
+    @contextmanager
+    def use(self, model_size: str, device: Optional[str] = None) -> Iterator:
+        """
+        Empresta o modelo com acesso exclusivo. Enquanto emprestado, ele não é despejado.
+        """
+        entry = self._get_entry(model_size, device, reserve=True)
+        try:
+            with entry.use_lock:
+                yield entry.model
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                self._evict_locked()
+
+    def model_bytes(self, model_size: str, device: Optional[str] = None) -> int:
+        """
+        Tamanho estimado do modelo (carregado se ainda não estiver residente).
+        """
+        return self._get_entry(model_size, device).size_bytes
+
+    def used_bytes(self) -> int:
+        with self._lock:
+            return self._used_bytes_locked()
+
+    def get_model(self, model_size: str, device: Optional[str] = None):
+        """
+        Retorna o modelo compartilhado (sem lock de uso).
+        """
+        return self._get_entry(model_size, device).model
+
+    def warm(self, specs: List[str]):
+        """
+        Pré-carrega modelos. Cada spec é "model_size" ou "model_size:device".
+        """
+        for spec in specs:
+            spec = spec.strip()
+            if not spec:
+                continue
+            model_size, _, device = spec.partition(":")
+            try:
+                self._get_entry(model_size, device or None)
+            except Exception as e:
+                print(f"Error warming Whisper model {spec}: {e}")
+
+    def clear(self):
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.in_use == 0]:
+                del self._entries[key]
+            self._release_cuda_cache()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": (self._stats["hits"] / lookups) if lookups else 0.0,
+                "max_bytes": self.max_bytes,
+                "used_bytes": self._used_bytes_locked(),
+                "models": [
+                    {
+                        "model_size": k[0],
+                        "device": k[1],
+                        "size_bytes": e.size_bytes,
+                        "in_use": e.in_use,
+                    }
+                    for k, e in self._entries.items()
+                ],
+            }
+
+
+registry = WhisperModelRegistry(max_bytes=WHISPER_CACHE_MAX_MB * 1024 * 1024)
+
+
+def warm_default_models():
+    specs = [s for s in WHISPER_WARM_MODELS.split(",") if s.strip()]
+    if specs:
+        registry.warm(specs)
@@ -1,52 +1,325 @@
-import replicate
+import asyncio
+import hashlib
 import os
-import requests
+import subprocess
+import time
+from abc import ABC, abstractmethod
 from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import disk_cache
+import downloader
 
 # Ensure token is set from Easypanel variable
 if "MUSIC_API_TOKEN" in os.environ:
     os.environ["REPLICATE_API_TOKEN"] = os.environ["MUSIC_API_TOKEN"]
 
+# Backend padrão: "replicate" (MusicGen) ou "local" (faixa sintetizada, sem rede)
+MUSIC_BACKEND = os.environ.get("MUSIC_BACKEND", "replicate")
+
 # Default to the one provided if not set (fallback, but ideally should be env only)
 # Removing hardcoded token to avoid git push rejection (Secret Scanning)
-if "REPLICATE_API_TOKEN" not in os.environ:
+if "REPLICATE_API_TOKEN" not in os.environ and MUSIC_BACKEND == "replicate":
     print("WARNING: REPLICATE_API_TOKEN or MUSIC_API_TOKEN not set in environment.")
 
 # Use variable for model version, fallback to default
 DEFAULT_MODEL = "meta/musicgen:671ac645ce5e552cc63a54a2bbff63fcf798043055d2dac5fc9e36a837eedcfb"
 MODEL_VERSION = os.environ.get("MUSIC_MODEL_VERSION", DEFAULT_MODEL)
+MUSICGEN_VARIANT = "stereo-large"
+OUTPUT_FORMAT = "mp3"
+
+# Cache das faixas geradas (prompt + duração + modelo + formato)
+MUSIC_CACHE_ENABLED = os.environ.get("MUSIC_CACHE", "1") == "1"
+MUSIC_CACHE_MAX_MB = int(os.environ.get("MUSIC_CACHE_MAX_MB", "1024"))
+# Incrementar quando a geração ou o formato de saída mudar
+MUSIC_CACHE_VERSION = 1
+
+# Latência simulada do backend local (s), para testes de carga parecidos com a API
+MUSIC_LOCAL_LATENCY = float(os.environ.get("MUSIC_LOCAL_LATENCY", "0"))
+
+# Predições em andamento ao mesmo tempo no caminho assíncrono (as demais esperam na fila)
+MUSIC_MAX_CONCURRENT = int(os.environ.get("MUSIC_MAX_CONCURRENT", "4"))
+# Polling da predição: intervalo inicial, máximo (backoff x1.5) e tempo limite (s)
+MUSIC_POLL_INITIAL = float(os.environ.get("MUSIC_POLL_INITIAL", "1.0"))
+MUSIC_POLL_MAX = float(os.environ.get("MUSIC_POLL_MAX", "10.0"))
+MUSIC_PREDICTION_TIMEOUT = float(os.environ.get("MUSIC_PREDICTION_TIMEOUT", "600"))
 
-def generate_music(prompt: str, duration: int, output_path: Path) -> Path:
+music_cache = disk_cache.DiskCache("music", MUSIC_CACHE_MAX_MB)
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_active = {"running": 0, "waiting": 0}
+
+
+class MusicBackend(ABC):
     """
-    Generates music using Replicate's MusicGen model.
+    Gera uma faixa para (prompt, duração) em output_path.
+    `version` identifica o modelo e entra na chave do cache.
+    Um backend sem version ou generate falha ao ser instanciado, não no meio da requisição.
     """
-    print(f"🎵 Starting music generation for prompt: '{prompt}' ({duration}s)")
-    
-    try:
+    name = ""
+
+    @property
+    @abstractmethod
+    def version(self) -> str:
+        ...
+
+    @abstractmethod
+    def generate(self, prompt: str, duration: int, output_path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+        ...
+
+    async def generate_async(self, prompt: str, duration: int, output_path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+        # Padrão: a versão bloqueante numa thread, fora do event loop
+        return await asyncio.to_thread(self.generate, prompt, duration, output_path, output_format)
+
+
+class ReplicateBackend(MusicBackend):
+    name = "replicate"
+
+    @property
+    def version(self) -> str:
+        return f"{MODEL_VERSION}/{MUSICGEN_VARIANT}"
+
+    def generate(self, prompt: str, duration: int, output_path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+        # Import local: o backend "local" não precisa do cliente do Replicate instalado
+        import replicate
+
         output = replicate.run(
             MODEL_VERSION,
             input={
                 "prompt": prompt,
-                "model_version": "stereo-large",
+                "model_version": MUSICGEN_VARIANT,
                 "duration": duration,
-                "output_format": "mp3"
+                "output_format": output_format
             }
         )
-        
+
         # replicate returns a string URL or list of URLs
         audio_url = output[0] if isinstance(output, list) else output
         print(f"✅ Generated! URL: {audio_url}")
-        
+
         print("⬇️ Downloading file...")
-        response = requests.get(audio_url)
-        response.raise_for_status()
-        
-        with open(output_path, "wb") as file:
-            file.write(response.content)
-            
-        print(f"🎉 Saved to {output_path}")
+        # Sessão compartilhada, streaming para o disco, retomada por Range
+        downloader.download(audio_url, output_path)
         return output_path
 
+    async def generate_async(self, prompt: str, duration: int, output_path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+        """
+        Cria a predição e consulta o status com backoff (asyncio.sleep entre as consultas),
+        sem manter uma thread presa durante a geração.
+        """
+        import replicate
+
+        prediction = await asyncio.to_thread(
+            replicate.predictions.create,
+            version=MODEL_VERSION.rsplit(":", 1)[-1],
+            input={
+                "prompt": prompt,
+                "model_version": MUSICGEN_VARIANT,
+                "duration": duration,
+                "output_format": output_format
+            }
+        )
+        print(f"⏳ Prediction {prediction.id} created")
+
+        deadline = time.monotonic() + MUSIC_PREDICTION_TIMEOUT
+        interval = MUSIC_POLL_INITIAL
+        try:
+            while prediction.status not in ("succeeded", "failed", "canceled"):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"prediction {prediction.id} timed out after {MUSIC_PREDICTION_TIMEOUT:.0f}s")
+                await asyncio.sleep(interval)
+                interval = min(interval * 1.5, MUSIC_POLL_MAX)
+                await asyncio.to_thread(prediction.reload)
+        except (asyncio.CancelledError, RuntimeError):
+            # Job cancelado ou tempo esgotado: não deixa a predição rodando (e cobrando)
+            await asyncio.shield(asyncio.to_thread(prediction.cancel))
+            raise
+
+        if prediction.status != "succeeded":
+            raise RuntimeError(f"prediction {prediction.id} {prediction.status}: {prediction.error}")
+
+        output = prediction.output
+        audio_url = output[0] if isinstance(output, list) else output
+        print(f"✅ Generated! URL: {audio_url}")
+        await asyncio.to_thread(downloader.download, audio_url, output_path)
+        return output_path
+
+
+class LocalSynthBackend(MusicBackend):
+    """
+    Faixa determinística sintetizada pelo ffmpeg: acorde e andamento derivados
+    do hash do prompt. Mesmo prompt e duração geram os mesmos bytes, sem rede.
+    Serve para testes de carga e benchmarks do pipeline completo.
+    """
+    name = "local"
+    # Frequências (Hz) da escala pentatônica de Lá
+    SCALE = [220.0, 246.94, 277.18, 329.63, 369.99, 440.0, 493.88, 554.37]
+
+    @property
+    def version(self) -> str:
+        return "local-synth:1"
+
+    def expression(self, prompt: str) -> str:
+        seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+        root = seed[0] % len(self.SCALE)
+        notes = [self.SCALE[(root + 2 * k) % len(self.SCALE)] for k in range(3)]
+        # Pulso de 60 a 140 bpm modulando a amplitude
+        bpm = 60 + seed[3] % 81
+        pulse = f"(0.6+0.4*sin(2*PI*{bpm / 60.0:.4f}*t))"
+        voices = "+".join(f"sin(2*PI*{f:.2f}*t)" for f in notes)
+        return f"0.2*{pulse}*({voices})"
+
+    def generate(self, prompt: str, duration: int, output_path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+        if MUSIC_LOCAL_LATENCY > 0:
+            time.sleep(MUSIC_LOCAL_LATENCY)
+        return self.synth(prompt, duration, output_path, output_format)
+
+    async def generate_async(self, prompt: str, duration: int, output_path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+        # A latência simulada espera no event loop, como o polling do Replicate
+        if MUSIC_LOCAL_LATENCY > 0:
+            await asyncio.sleep(MUSIC_LOCAL_LATENCY)
+        return await asyncio.to_thread(self.synth, prompt, duration, output_path, output_format)
+
+    def synth(self, prompt: str, duration: int, output_path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+        expr = self.expression(prompt)
+        cmd = [
+            "ffmpeg", "-nostdin", "-y", "-v", "error",
+            "-f", "lavfi",
+            "-i", f"aevalsrc='{expr}|{expr}':s=44100:d={duration}",
+            "-af", f"afade=t=in:d=0.5,afade=t=out:st={max(0.0, duration - 1.0)}:d=1",
+            # Saída reprodutível: sem metadados de versão/data
+            "-map_metadata", "-1",
+            "-fflags", "+bitexact",
+            "-flags:a", "+bitexact",
+            "-f", output_format,
+            str(output_path),
+        ]
+        try:
+            subprocess.run(cmd, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"FFmpeg local music synth failed with exit code {e.returncode}.\nStderr: {e.stderr}") from e
+        return output_path
+
+
+BACKENDS = {
+    ReplicateBackend.name: ReplicateBackend,
+    LocalSynthBackend.name: LocalSynthBackend,
+}
+
+
+def get_backend(name: Optional[str] = None) -> MusicBackend:
+    name = name or MUSIC_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown music backend '{name}'. Options: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name]()
+
+
+def music_key(backend: MusicBackend, prompt: str, duration: int, output_format: str = OUTPUT_FORMAT) -> str:
+    return disk_cache.make_key(MUSIC_CACHE_VERSION, backend.version, prompt, int(duration), output_format)
+
+
+def _cache_lookup(music_backend: MusicBackend, prompt: str, duration: int, output_path: Path) -> Tuple[Optional[str], bool]:
+    """
+    (chave, acerto). No acerto a faixa já foi copiada para output_path.
+    """
+    if not MUSIC_CACHE_ENABLED:
+        return None, False
+    key = music_key(music_backend, prompt, duration)
+    return key, music_cache.fetch(key, f".{OUTPUT_FORMAT}", Path(output_path))
+
+
+def _cache_store(key: Optional[str], music_backend: MusicBackend, prompt: str, duration: int, output_path: Path):
+    if key is None:
+        return
+    music_cache.store(key, Path(output_path), f".{OUTPUT_FORMAT}", {
+        "backend": music_backend.name,
+        "version": music_backend.version,
+        "prompt": prompt,
+        "duration": int(duration),
+    })
+
+
+def generate_music(prompt: str, duration: int, output_path: Path, backend: Optional[str] = None) -> Path:
+    """
+    Generates music for the prompt with the selected backend (MUSIC_BACKEND by default).
+    Tracks are cached on disk by prompt, duration, model version and output format.
+    """
+    music_backend = get_backend(backend)
+    print(f"🎵 Starting music generation for prompt: '{prompt}' ({duration}s, {music_backend.name})")
+
+    key, hit = _cache_lookup(music_backend, prompt, duration, output_path)
+    if hit:
+        print(f"🎉 Music cache hit, saved to {output_path}")
+        return output_path
+
+    try:
+        start = time.perf_counter()
+        music_backend.generate(prompt, duration, Path(output_path), OUTPUT_FORMAT)
+        print(f"🎉 Saved to {output_path} ({time.perf_counter() - start:.1f}s)")
     except Exception as e:
         print(f"❌ Error generating music: {e}")
         raise RuntimeError(f"Music generation failed: {e}") from e
+
+    _cache_store(key, music_backend, prompt, duration, output_path)
+    return output_path
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    # Criado no primeiro uso, dentro do event loop do servidor
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, MUSIC_MAX_CONCURRENT))
+    return _semaphore
+
+
+async def generate_music_async(
+    prompt: str,
+    duration: int,
+    output_path: Path,
+    backend: Optional[str] = None
+) -> Tuple[Path, Dict]:
+    """
+    Versão para o event loop de generate_music: no máximo MUSIC_MAX_CONCURRENT
+    gerações em andamento, as demais esperam sua vez sem bloquear o servidor.
+    Retorna (caminho, estatísticas).
+    """
+    music_backend = get_backend(backend)
+    stats = {"backend": music_backend.name, "cached": False, "queue_seconds": 0.0, "generate_seconds": 0.0}
+    print(f"🎵 Starting music generation for prompt: '{prompt}' ({duration}s, {music_backend.name})")
+
+    key, hit = await asyncio.to_thread(_cache_lookup, music_backend, prompt, duration, output_path)
+    if hit:
+        print(f"🎉 Music cache hit, saved to {output_path}")
+        stats["cached"] = True
+        return output_path, stats
+
+    queued = time.perf_counter()
+    acquired = False
+    _active["waiting"] += 1
+    try:
+        async with _get_semaphore():
+            acquired = True
+            _active["waiting"] -= 1
+            _active["running"] += 1
+            start = time.perf_counter()
+            stats["queue_seconds"] = start - queued
+            try:
+                await music_backend.generate_async(prompt, duration, Path(output_path), OUTPUT_FORMAT)
+            finally:
+                _active["running"] -= 1
+    except Exception as e:
+        print(f"❌ Error generating music: {e}")
+        raise RuntimeError(f"Music generation failed: {e}") from e
+    finally:
+        if not acquired:
+            # Cancelado enquanto esperava na fila
+            _active["waiting"] -= 1
+    stats["generate_seconds"] = time.perf_counter() - start
+    print(f"🎉 Saved to {output_path} ({stats['generate_seconds']:.1f}s)")
+
+    await asyncio.to_thread(_cache_store, key, music_backend, prompt, duration, output_path)
+    return output_path, stats
+
+
+def concurrency_stats() -> Dict:
+    return {"max_concurrent": MUSIC_MAX_CONCURRENT, **_active}
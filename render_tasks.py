@@ -0,0 +1,130 @@
+"""
+Tarefas executadas pelos workers do JobManager.
+Cada função recebe a pasta do job como primeiro argumento e retorna o caminho do
+resultado, ou uma tupla (caminho, estatísticas).
+As corrotinas (async def) vão pelo JobManager.submit_async e rodam no event loop.
+"""
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import music_engine
+import stream_package
+import video_engine
+from job_manager import ProgressWriter
+
+# Nomes dos arquivos de saída (no modo streaming o endpoint cria um pipe com este nome)
+GENERATE_VIDEO_OUTPUT = "output.mp4"
+RENDER_FULL_OUTPUT = "full_output.mp4"
+MULTI_OUTPUT_DIR = "outputs"
+
+
+def generate_video_task(job_dir: Path, config_data: Dict) -> Tuple[Path, Dict]:
+    if video_engine.is_multi_output(config_data):
+        # Todas as resoluções numa passada; o resultado é um zip com um MP4 por saída
+        outputs_dir = job_dir / MULTI_OUTPUT_DIR
+        stats = video_engine.generate_video_outputs(
+            config_data, job_dir, outputs_dir, progress_callback=ProgressWriter(job_dir)
+        )
+        return stream_package.zip_package(outputs_dir, job_dir / f"{MULTI_OUTPUT_DIR}.zip"), stats
+
+    output_path = job_dir / GENERATE_VIDEO_OUTPUT
+    # base_dir is where the images are extracted (job_dir)
+    stats = video_engine.generate_video_from_config(
+        config_data, job_dir, output_path, progress_callback=ProgressWriter(job_dir)
+    )
+    package = stream_package.package_options(config_data.get("video", {}).get("package"))
+    if package:
+        zip_path, package_stats = stream_package.package_job_output(job_dir, output_path, package, ProgressWriter(job_dir))
+        return zip_path, {**stats, **package_stats}
+    return output_path, stats
+
+
+def merge_video_audio_task(
+    job_dir: Path,
+    video_path: str,
+    narration_path: Optional[str],
+    background_path: Optional[str],
+    vol_narration: float,
+    vol_background: float,
+    fade_duration: float,
+    smart_render: Optional[bool] = None,
+    package: Optional[Dict] = None
+) -> Tuple[Path, Dict]:
+    output_path = job_dir / "merged_output.mp4"
+    stats = video_engine.merge_video_audio(
+        video_input=Path(video_path),
+        output_file=output_path,
+        narration_input=Path(narration_path) if narration_path else None,
+        background_input=Path(background_path) if background_path else None,
+        vol_narration=vol_narration,
+        vol_background=vol_background,
+        fade_duration=fade_duration,
+        progress_callback=ProgressWriter(job_dir),
+        smart_render=smart_render
+    )
+    if package:
+        zip_path, package_stats = stream_package.package_job_output(job_dir, output_path, package, ProgressWriter(job_dir))
+        return zip_path, {**stats, **package_stats}
+    return output_path, stats
+
+
+def add_subtitles_task(
+    job_dir: Path,
+    video_path: str,
+    srt_path: str,
+    position_y: int,
+    font_color: str,
+    outline_color: str,
+    font_size: int,
+    subtitle_mode: Optional[str] = None
+) -> Tuple[Path, Dict]:
+    output_path = job_dir / "video_with_subs.mp4"
+    stats = video_engine.add_subtitles(
+        video_input=Path(video_path),
+        srt_input=Path(srt_path),
+        output_file=output_path,
+        position_y=position_y,
+        font_color=font_color,
+        outline_color=outline_color,
+        font_size=font_size,
+        progress_callback=ProgressWriter(job_dir),
+        mode=subtitle_mode
+    )
+    return output_path, stats
+
+
+def render_full_task(
+    job_dir: Path,
+    config_data: Dict,
+    narration_path: Optional[str],
+    background_path: Optional[str],
+    vol_narration: float,
+    vol_background: float,
+    fade_duration: float,
+    srt_path: Optional[str],
+    position_y: int,
+    font_color: str,
+    outline_color: str,
+    font_size: int
+) -> Tuple[Path, Dict]:
+    output_path = job_dir / RENDER_FULL_OUTPUT
+    stats = video_engine.render_full(
+        config_data,
+        job_dir,
+        output_path,
+        narration_input=Path(narration_path) if narration_path else None,
+        background_input=Path(background_path) if background_path else None,
+        vol_narration=vol_narration,
+        vol_background=vol_background,
+        fade_duration=fade_duration,
+        srt_input=Path(srt_path) if srt_path else None,
+        position_y=position_y,
+        font_color=font_color,
+        outline_color=outline_color,
+        font_size=font_size,
+        progress_callback=ProgressWriter(job_dir)
+    )
+    return output_path, stats
+
+
+async def generate_music_task(job_dir: Path, prompt: str, duration: int, backend: Optional[str] = None) -> Tuple[Path, Dict]:
+    return await music_engine.generate_music_async(prompt, duration, job_dir / "generated_music.mp3", backend)
@@ -0,0 +1,264 @@
+"""
+Renderização paralela por segmentos.
+
+Em vez de um único filter_complex com todos os clipes, cada clipe vira um segmento
+independente (só o "miolo", sem as janelas de transição) e cada transição vira um
+segmento curto com os dois clipes vizinhos. Os segmentos são codificados em paralelo
+com os mesmos parâmetros e depois concatenados com stream copy.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import disk_cache
+import job_manager
+import video_engine
+
+# CPUs de um job: até VIDEO_WORKERS jobs rodam ao mesmo tempo, cada um com sua fatia
+JOB_CPUS = max(1, (os.cpu_count() or 2) // job_manager.VIDEO_WORKERS)
+DEFAULT_PARALLELISM = int(os.environ.get("RENDER_PARALLELISM", str(JOB_CPUS)))
+SEGMENT_CACHE_ENABLED = os.environ.get("SEGMENT_CACHE", "1") == "1"
+SEGMENT_CACHE_MAX_MB = int(os.environ.get("SEGMENT_CACHE_MAX_MB", "4096"))
+# Incrementar quando a geração dos filtros mudar, para invalidar segmentos antigos
+SEGMENT_CACHE_VERSION = 4
+
+segment_cache = disk_cache.DiskCache("segments", SEGMENT_CACHE_MAX_MB)
+
+
+def get_parallelism(cfg: Dict) -> int:
+    return max(1, int(cfg.get("video", {}).get("parallelism", DEFAULT_PARALLELISM)))
+
+
+def use_segment_cache(cfg: Dict) -> bool:
+    return bool(cfg.get("video", {}).get("segment_cache", SEGMENT_CACHE_ENABLED))
+
+
+def plan_segments(clips: List[Dict], fps: int) -> Optional[List[Dict]]:
+    """
+    Divide a timeline em segmentos de clipe e de transição, na ordem de saída.
+
+    Para o clipe i (tempos locais): o miolo vai de td(i-1) até dur(i) - td(i).
+    A transição i mistura [dur(i) - td(i), dur(i)) do clipe i com [0, td(i)) do clipe i+1,
+    exatamente a janela que o xfade do grafo único usa.
+    Retorna None se as janelas de transição se sobrepõem (o grafo único é usado).
+    """
+    segments: List[Dict] = []
+
+    for i, clip in enumerate(clips):
+        is_last = i == len(clips) - 1
+        head = clips[i - 1]["transition_duration"] if i > 0 else 0.0
+        td = 0.0 if is_last else clip["transition_duration"]
+        tail = clip["duration"] - td
+
+        # Trabalhamos em frames para que a soma dos segmentos bata com a saída do grafo único
+        start_frame = int(round(head * fps))
+        end_frame = int(round(tail * fps))
+        if end_frame < start_frame:
+            return None
+
+        if end_frame > start_frame:
+            segments.append({
+                "kind": "clip",
+                "clips": [clip],
+                "start_frame": start_frame,
+                "end_frame": end_frame,
+            })
+
+        if not is_last and td > 0:
+            segments.append({
+                "kind": "transition",
+                "clips": [clip, clips[i + 1]],
+                "start_frame": end_frame,
+                "frames": int(round(td * fps)),
+                "transition": clip["transition"],
+                "duration": td,
+            })
+
+    return segments
+
+
+def segment_cache_key(segment: Dict, w: int, h: int, fps: int, encoder_args: List[str]) -> str:
+    """
+    Chave do segmento: conteúdo das imagens + efeito + duração + janela em frames +
+    resolução/fps/encoder. A posição do clipe na timeline não entra, então mudar a
+    duração de um clipe não invalida os outros.
+    """
+    clips = [
+        {
+            "image": disk_cache.file_sha256(clip.get("source_file", clip["file"])),
+            "prescaled": clip.get("prescaled", False),
+            "effect": clip["effect"],
+            "duration": clip["duration"],
+        }
+        for clip in segment["clips"]
+    ]
+    window = {k: segment[k] for k in ("kind", "start_frame", "end_frame", "frames", "transition", "duration") if k in segment}
+    return disk_cache.make_key(SEGMENT_CACHE_VERSION, clips, window, w, h, fps, encoder_args)
+
+
+def build_segment_command(
+    segment: Dict,
+    w: int,
+    h: int,
+    fps: int,
+    encoder_args: List[str],
+    out_path: Path,
+    threads: int = 0
+) -> List[str]:
+    cmd = ["ffmpeg", "-y"]
+
+    if segment["kind"] == "clip":
+        clip = segment["clips"][0]
+        cmd += video_engine.clip_input_args(clip, fps)
+        filter_complex = (
+            f"[0:v]{video_engine.clip_filter(clip, w, h, fps)},"
+            f"trim=start_frame={segment['start_frame']}:end_frame={segment['end_frame']},"
+            f"setpts=PTS-STARTPTS[out]"
+        )
+    else:
+        a, b = segment["clips"]
+        n = segment["frames"]
+        for clip in (a, b):
+            cmd += video_engine.clip_input_args(clip, fps)
+        filter_complex = (
+            f"[0:v]{video_engine.clip_filter(a, w, h, fps)},"
+            f"trim=start_frame={segment['start_frame']}:end_frame={segment['start_frame'] + n},"
+            f"setpts=PTS-STARTPTS[a];"
+            f"[1:v]{video_engine.clip_filter(b, w, h, fps)},"
+            f"trim=end_frame={n},setpts=PTS-STARTPTS[b];"
+            # Duração do xfade = frames cortados, senão a mistura não bate com a janela
+            f"[a][b]xfade=transition={segment['transition']}:duration={n / fps}:offset=0,"
+            f"format=yuv420p[out]"
+        )
+
+    cmd += [
+        "-filter_complex", filter_complex,
+        "-map", "[out]",
+        "-r", str(fps),
+        "-pix_fmt", "yuv420p",
+        *encoder_args,
+    ]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    cmd += ["-an", str(out_path)]
+    return cmd
+
+
+def concat_segments(segment_files: List[Path], output_file: Path, work_dir: Path, container_args: Optional[List[str]] = None):
+    list_file = work_dir / "segments.txt"
+    with open(list_file, "w", encoding="utf-8") as f:
+        for seg in segment_files:
+            escaped = str(seg.resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-f", "concat", "-safe", "0",
+        "-i", str(list_file),
+        "-c", "copy",
+        *(container_args or []),
+        str(output_file),
+    ]
+    print("Running ffmpeg (concat):", " ".join(cmd))
+    video_engine.run_ffmpeg(cmd, "FFmpeg concat failed")
+
+
+def segment_frames(segment: Dict) -> int:
+    if segment["kind"] == "clip":
+        return segment["end_frame"] - segment["start_frame"]
+    return segment["frames"]
+
+
+def render_parallel(
+    cfg: Dict,
+    base_dir: Path,
+    output_file: Path,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Optional[Dict]:
+    """
+    Renderiza a timeline em segmentos paralelos e retorna as estatísticas do render.
+    Retorna None se a timeline não puder ser dividida (o chamador usa o grafo único).
+    """
+    w, h, fps = video_engine.get_video_settings(cfg)
+    clips = video_engine.prepare_clips(cfg, base_dir)
+    segments = plan_segments(clips, fps)
+    if segments is None:
+        return None
+
+    parallelism = get_parallelism(cfg)
+    # Divide as threads do x264 do job entre os ffmpeg simultâneos
+    threads = max(1, JOB_CPUS // parallelism)
+    encoder_args = video_engine.get_encoder_args(cfg)
+    use_cache = use_segment_cache(cfg)
+
+    stats = {"segments": len(segments), "cache_hits": 0, "cache_misses": 0, "seconds_saved": 0.0}
+
+    work_dir = Path(tempfile.mkdtemp(prefix="segments_", dir=output_file.parent))
+    start = time.perf_counter()
+    try:
+        segment_files = [work_dir / f"seg_{i:04d}.mp4" for i in range(len(segments))]
+        keys = [
+            segment_cache_key(seg, w, h, fps, encoder_args) if use_cache else None
+            for seg in segments
+        ]
+
+        pending = []
+        for i, key in enumerate(keys):
+            if key and segment_cache.fetch(key, ".mp4", segment_files[i]):
+                stats["cache_hits"] += 1
+                stats["seconds_saved"] += float(segment_cache.meta(key).get("render_seconds", 0.0))
+            else:
+                pending.append(i)
+        stats["cache_misses"] = len(pending) if use_cache else 0
+
+        # Progresso = frames de segmentos prontos / frames totais
+        total_frames = sum(segment_frames(seg) for seg in segments)
+        done = {"frames": sum(segment_frames(segments[i]) for i in range(len(segments)) if i not in pending)}
+        done_lock = threading.Lock()
+
+        def report(status: str = "running"):
+            if progress_callback is None:
+                return
+            with done_lock:
+                frames = done["frames"]
+            progress_callback(video_engine.progress_update(
+                frames / fps, total_frames / fps, time.perf_counter() - start, frame=frames, status=status
+            ))
+
+        def render(i: int):
+            seg_start = time.perf_counter()
+            cmd = build_segment_command(segments[i], w, h, fps, encoder_args, segment_files[i], threads)
+            video_engine.run_ffmpeg(cmd, f"FFmpeg segment {i} failed")
+            if keys[i]:
+                segment_cache.store(
+                    keys[i], segment_files[i], ".mp4",
+                    {"render_seconds": time.perf_counter() - seg_start}
+                )
+            with done_lock:
+                done["frames"] += segment_frames(segments[i])
+            report()
+
+        print(f"Rendering {len(pending)}/{len(segments)} segments with parallelism={parallelism}")
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            # list() propaga a primeira exceção
+            list(pool.map(render, pending))
+
+        concat_segments(segment_files, output_file, work_dir, video_engine.container_args(cfg))
+        report("end")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+    lookups = stats["cache_hits"] + stats["cache_misses"]
+    stats["cache_hit_ratio"] = (stats["cache_hits"] / lookups) if lookups else 0.0
+    print(
+        f"Parallel render finished in {stats['seconds']:.2f}s "
+        f"(cache hits {stats['cache_hits']}/{lookups}, saved ~{stats['seconds_saved']:.1f}s)"
+    )
+    return stats
@@ -0,0 +1,265 @@
+"""
+Smart-render do merge de vídeo + áudio.
+
+O merge só altera o final do vídeo (fade out e, com narração, o último frame congelado
+pelo tpad). Em vez de re-encodar tudo, o vídeo é cortado no keyframe anterior ao início
+da alteração: o prefixo é copiado sem re-encode, só a cauda é codificada com os mesmos
+parâmetros (codec, profile, level, pix_fmt, tamanho, fps) e as duas partes são juntadas
+em MPEG-TS (parâmetros do H.264 em banda) antes do remux para MP4.
+O áudio é mixado à parte, com os mesmos filtros do merge completo.
+
+Os SPS/PPS da cauda quase nunca são iguais aos do original (referências, flags do PPS),
+então a saída troca de parâmetros no meio do stream: ela é marcada como avc3 (parâmetros
+em banda) e não avc1, e é conferida com ffprobe antes de ser aceita. Fica desligado por
+padrão (MERGE_SMART_RENDER) até verify_smart_render.py passar nos players de destino.
+"""
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import media_probe
+import video_engine
+
+# Prefixo mínimo copiado para valer a pena (abaixo disso o merge completo é usado)
+SMART_RENDER_MIN_COPY_SECONDS = float(os.environ.get("SMART_RENDER_MIN_COPY_SECONDS", "2.0"))
+
+# Profiles do ffprobe -> libx264 (só 8 bits 4:2:0, o que o merge completo gera)
+X264_PROFILES = {
+    "constrained baseline": "baseline",
+    "baseline": "baseline",
+    "main": "main",
+    "high": "high",
+}
+
+
+def frame_rate(params: Dict) -> float:
+    num, _, den = str(params.get("r_frame_rate", "0/1")).partition("/")
+    return float(num) / float(den or 1) if float(den or 1) else 0.0
+
+
+def tail_encoder_args(params: Dict, preset: str = "medium") -> Optional[List[str]]:
+    """
+    Parâmetros do libx264 que reproduzem o stream de entrada, ou None se ele não pode
+    ser casado (codec, pix_fmt, profile ou frame rate variável).
+    """
+    if params.get("codec_name") != "h264" or params.get("pix_fmt") != "yuv420p":
+        return None
+    profile = X264_PROFILES.get(str(params.get("profile", "")).lower())
+    if profile is None:
+        return None
+    if params.get("sample_aspect_ratio") not in (None, "1:1", "0:1", "N/A"):
+        return None
+
+    rate = params.get("r_frame_rate", "0/0")
+    if rate in ("0/0", "") or rate != params.get("avg_frame_rate", rate):
+        return None
+
+    args = [
+        "-c:v", "libx264",
+        "-preset", preset,
+        "-crf", "23",
+        "-profile:v", profile,
+        "-pix_fmt", "yuv420p",
+        "-r", rate,
+    ]
+    level = params.get("level")
+    if isinstance(level, int) and level > 0:
+        args += ["-level:v", f"{level / 10:.1f}"]
+    return args
+
+
+def split_copy(video_input: Path, times: List[float], work_dir: Path, fps: float) -> List[Path]:
+    """
+    Corta o vídeo (stream copy, MPEG-TS com H.264 annexb) nos keyframes `times`.
+    Retorna as partes em ordem: [0, t1), [t1, t2), ..., [tn, fim).
+    """
+    video_engine.run_ffmpeg([
+        "ffmpeg", "-y",
+        "-i", str(video_input),
+        "-map", "0:v:0",
+        "-c", "copy",
+        "-bsf:v", "h264_mp4toannexb",
+        "-f", "segment",
+        "-segment_format", "mpegts",
+        "-segment_times", ",".join(f"{t}" for t in times),
+        # Os tempos vêm do ffprobe com 6 casas: meio frame de tolerância para cortar no keyframe certo
+        "-segment_time_delta", f"{0.5 / fps}",
+        "-reset_timestamps", "1",
+        str(work_dir / "part_%03d.ts"),
+    ], "FFmpeg stream copy split failed")
+    return sorted(work_dir.glob("part_*.ts"))
+
+
+def seek_time(keyframe: float, fps: float) -> float:
+    # Meio frame antes do keyframe: o -ss preciso mantém o keyframe mesmo com arredondamento do tempo
+    return max(0.0, keyframe - 0.5 / fps)
+
+
+def check_output(path: Path, expected_duration: float, fps: float) -> Optional[str]:
+    """
+    Confere frames e duração do vídeo juntado contra o esperado (tolerância de um frame).
+    Retorna a descrição da diferença, ou None se bate.
+    """
+    frames, duration = media_probe.count_video_frames(path)
+    expected_frames = expected_duration * fps
+    if abs(frames - expected_frames) > 1 or abs(duration - expected_duration) > 1.5 / fps:
+        return (
+            f"{frames} frames / {duration:.3f}s, "
+            f"expected ~{expected_frames:.1f} frames / {expected_duration:.3f}s"
+        )
+    return None
+
+
+def concat_list(parts: List[Path], list_file: Path) -> Path:
+    with open(list_file, "w", encoding="utf-8") as f:
+        for part in parts:
+            escaped = str(part.resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_file
+
+
+def find_split_point(video_input: Path, edit_start: float) -> Optional[float]:
+    """
+    Último keyframe em ou antes de edit_start (None se não houver prefixo aproveitável).
+    """
+    keyframes = [k for k in media_probe.get_keyframe_times(video_input) if k <= edit_start + 1e-3]
+    if not keyframes or keyframes[-1] < SMART_RENDER_MIN_COPY_SECONDS:
+        return None
+    return keyframes[-1]
+
+
+def merge_smart(
+    video_input: Path,
+    output_file: Path,
+    narration_input: Optional[Path],
+    background_input: Optional[Path],
+    vol_narration: float,
+    vol_background: float,
+    start_fade: float,
+    fade_duration: float,
+    total_duration: float,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Optional[Dict]:
+    """
+    Mesmo resultado de merge_video_audio re-encodando só a cauda.
+    Retorna as estatísticas, ou None quando o smart-render não se aplica ou falha
+    (o chamador faz o merge completo).
+    """
+    start = time.perf_counter()
+    try:
+        params = media_probe.video_stream_params(video_input)
+        encoder_args = tail_encoder_args(params)
+        if encoder_args is None:
+            print(f"Smart render: stream not matchable ({params.get('codec_name')}/{params.get('profile')}/{params.get('pix_fmt')})")
+            return None
+        if abs(float(params.get("start_time") or 0.0)) > 1e-3:
+            print("Smart render: video does not start at 0")
+            return None
+
+        video_duration = media_probe.get_duration(video_input)
+        # A saída só difere da entrada a partir do fade ou do fim do vídeo (tpad)
+        edit_start = min(start_fade, video_duration, total_duration)
+        split = find_split_point(video_input, edit_start)
+        if split is None:
+            print(f"Smart render: no keyframe worth copying before {edit_start:.2f}s")
+            return None
+    except (RuntimeError, ValueError) as e:
+        print(f"Smart render: probe failed ({e})")
+        return None
+
+    work_dir = Path(tempfile.mkdtemp(prefix="smart_merge_", dir=output_file.parent))
+    try:
+        # 1. Prefixo: stream copy até o keyframe
+        fps = frame_rate(params)
+        prefix = split_copy(video_input, [split], work_dir, fps)[0]
+
+        # 2. Cauda: decodifica a partir do keyframe e aplica os mesmos filtros de vídeo do merge
+        seek = seek_time(split, fps)
+        vf = []
+        if narration_input:
+            vf.append("tpad=stop=-1:stop_mode=clone")
+        vf.append(f"fade=t=out:st={start_fade - seek}:d={fade_duration}")
+        vf.append("setpts=PTS-STARTPTS")
+        tail = work_dir / "tail.ts"
+        tail_duration = total_duration - split
+        video_engine.run_ffmpeg([
+            "ffmpeg", "-y",
+            "-ss", f"{seek}",
+            "-i", str(video_input),
+            "-map", "0:v:0",
+            "-vf", ",".join(vf),
+            *encoder_args,
+            "-t", str(tail_duration),
+            "-f", "mpegts",
+            str(tail),
+        ], "FFmpeg smart render (tail encode) failed", total_duration=tail_duration, progress_callback=progress_callback)
+
+        # 3. Áudio completo, com os mesmos filtros do merge
+        audio_inputs: List[str] = []
+        narr_idx = bg_idx = -1
+        if narration_input:
+            audio_inputs += ["-i", str(narration_input)]
+            narr_idx = 0
+        if background_input:
+            audio_inputs += ["-stream_loop", "-1", "-i", str(background_input)]
+            bg_idx = narr_idx + 1
+        if narration_input:
+            afc = video_engine.build_narration_audio_filters(
+                narr_idx, bg_idx, start_fade, fade_duration, vol_narration, vol_background
+            )
+        else:
+            afc = video_engine.build_background_audio_filters(bg_idx, start_fade, fade_duration, vol_background)
+        audio = work_dir / "audio.m4a"
+        video_engine.run_ffmpeg([
+            "ffmpeg", "-y",
+            *audio_inputs,
+            "-filter_complex", ";".join(afc),
+            "-map", "[a_final]",
+            "-c:a", "aac",
+            "-t", str(total_duration),
+            str(audio),
+        ], "FFmpeg smart render (audio mix) failed")
+
+        # 4. Prefixo + cauda (concat sem re-encode) + áudio num MP4
+        list_file = concat_list([prefix, tail], work_dir / "parts.txt")
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", str(list_file),
+            "-i", str(audio),
+            "-map", "0:v",
+            "-map", "1:a",
+            "-c", "copy",
+            # SPS/PPS mudam na emenda: avc3 avisa o player que os parâmetros vêm em banda
+            "-tag:v", "avc3",
+            "-t", str(total_duration),
+            str(output_file),
+        ]
+        print("Running ffmpeg (smart merge):", " ".join(cmd))
+        video_engine.run_ffmpeg(cmd, "FFmpeg smart render (concat) failed")
+
+        mismatch = check_output(output_file, total_duration, fps)
+        if mismatch is not None:
+            print(f"Smart render output does not match the full merge ({mismatch}), falling back to full merge")
+            return None
+    except RuntimeError as e:
+        print(f"Smart render failed, falling back to full merge: {e}")
+        return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stats = {
+        "merge_mode": "smart",
+        "copied_seconds": round(split, 3),
+        "encoded_seconds": round(tail_duration, 3),
+        "duration": total_duration,
+        "seconds": time.perf_counter() - start,
+    }
+    print(
+        f"Smart merge finished in {stats['seconds']:.2f}s "
+        f"(copied {split:.2f}s, encoded {tail_duration:.2f}s)"
+    )
+    return stats
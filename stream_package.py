@@ -0,0 +1,225 @@
+"""
+Empacotamento HLS/DASH dos vídeos gerados.
+
+- Sem ladder: o MP4 é segmentado por stream copy (os cortes caem nos keyframes; os renders
+  com video.package já saem com um keyframe a cada segment_seconds).
+- Com ladder: um único decode, `split` em N saídas escaladas e N encodes com keyframes
+  alinhados entre as renditions (requisito do ABR). O áudio é codificado uma vez e
+  compartilhado (grupo de áudio no HLS, adaptation set no DASH).
+
+Os segmentos são gravados conforme o encode anda (playlist HLS do tipo "event", arquivos
+.tmp renomeados ao fechar), então os primeiros já podem ser servidos antes do fim.
+O resultado final é um zip com manifesto + segmentos.
+"""
+import os
+import shutil
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import media_probe
+import video_engine
+
+PACKAGE_FORMATS = ("hls", "dash")
+PACKAGE_SEGMENT_SECONDS = float(os.environ.get("PACKAGE_SEGMENT_SECONDS", "4"))
+PACKAGE_DIR = "package"
+
+# Bitrate de vídeo por rendition, pelo lado menor (1080 = "1080p" também em vídeo vertical)
+LADDER_BITRATES_K = {
+    2160: 14000,
+    1440: 9000,
+    1080: 5000,
+    720: 2800,
+    540: 1800,
+    480: 1400,
+    360: 800,
+    240: 400,
+}
+AUDIO_BITRATE = "128k"
+
+
+def package_options(raw: Optional[Dict]) -> Optional[Dict]:
+    """
+    Normaliza video.package / campos do formulário: {"format", "segment_seconds", "ladder"}.
+    `ladder` é a lista de lados menores (ex: [1080, 720, 480]); vazia = stream copy.
+    """
+    if not raw:
+        return None
+    fmt = str(raw.get("format", "hls")).lower()
+    if fmt not in PACKAGE_FORMATS:
+        raise ValueError(f"package format inválido: {fmt} (opções: {', '.join(PACKAGE_FORMATS)})")
+    ladder = raw.get("ladder") or []
+    if isinstance(ladder, str):
+        ladder = [part for part in ladder.replace(" ", "").split(",") if part]
+    return {
+        "format": fmt,
+        "segment_seconds": max(1.0, float(raw.get("segment_seconds", PACKAGE_SEGMENT_SECONDS))),
+        "ladder": sorted({int(str(rung).lower().rstrip("p")) for rung in ladder}, reverse=True),
+    }
+
+
+def keyframe_args(segment_seconds: float) -> List[str]:
+    """
+    Keyframe em cada fronteira de segmento (e só por tempo, sem scene cut),
+    para os segmentos terem a duração pedida e as renditions ficarem alinhadas.
+    """
+    return ["-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})", "-sc_threshold", "0"]
+
+
+def rendition_size(width: int, height: int, rung: int) -> Tuple[int, int]:
+    """
+    Tamanho (par) com o lado menor igual a `rung`, mantendo a proporção.
+    """
+    short = min(width, height)
+    scale = rung / float(short)
+    return (
+        max(2, int(round(width * scale / 2)) * 2),
+        max(2, int(round(height * scale / 2)) * 2),
+    )
+
+
+def build_renditions(width: int, height: int, ladder: List[int]) -> List[Dict]:
+    short = min(width, height)
+    # Renditions maiores que a origem não acrescentam nada
+    rungs = [r for r in ladder if r <= short] or [short]
+    renditions = []
+    for rung in rungs:
+        w, h = rendition_size(width, height, rung)
+        nearest = min(LADDER_BITRATES_K, key=lambda k: abs(k - rung))
+        kbps = int(LADDER_BITRATES_K[nearest] * rung / nearest)
+        renditions.append({"name": f"{rung}p", "width": w, "height": h, "bitrate_k": kbps})
+    return renditions
+
+
+def build_package_command(
+    video_input: Path,
+    out_dir: Path,
+    options: Dict,
+    width: int,
+    height: int,
+    has_audio: bool
+) -> List[str]:
+    seg = options["segment_seconds"]
+    cmd = ["ffmpeg", "-y", "-i", str(video_input)]
+    renditions = build_renditions(width, height, options["ladder"]) if options["ladder"] else []
+
+    if renditions:
+        # Um decode, N escalas
+        labels = [f"v{i}" for i in range(len(renditions))]
+        fc = [f"[0:v]split={len(renditions)}" + "".join(f"[{l}in]" for l in labels)]
+        for label, r in zip(labels, renditions):
+            fc.append(f"[{label}in]scale={r['width']}:{r['height']}[{label}]")
+        cmd += ["-filter_complex", ";".join(fc)]
+        for i, (label, r) in enumerate(zip(labels, renditions)):
+            cmd += [
+                "-map", f"[{label}]",
+                f"-c:v:{i}", "libx264",
+                f"-b:v:{i}", f"{r['bitrate_k']}k",
+                f"-maxrate:v:{i}", f"{int(r['bitrate_k'] * 1.07)}k",
+                f"-bufsize:v:{i}", f"{r['bitrate_k'] * 2}k",
+            ]
+        cmd += ["-preset", "medium", "-pix_fmt", "yuv420p", *keyframe_args(seg)]
+        if has_audio:
+            cmd += ["-map", "0:a:0", "-c:a", "aac", "-b:a", AUDIO_BITRATE]
+        video_count = len(renditions)
+    else:
+        cmd += ["-map", "0:v:0"]
+        if has_audio:
+            cmd += ["-map", "0:a:0"]
+        cmd += ["-c", "copy"]
+        video_count = 1
+
+    if options["format"] == "hls":
+        streams = [f"v:{i},agroup:aud" if has_audio else f"v:{i}" for i in range(video_count)]
+        if has_audio:
+            streams.insert(0, "a:0,agroup:aud")
+        cmd += [
+            "-f", "hls",
+            "-hls_time", str(seg),
+            # "event": a playlist é reescrita a cada segmento (vod só grava no fim)
+            "-hls_playlist_type", "event",
+            "-hls_flags", "independent_segments+temp_file",
+            "-hls_segment_filename", str(out_dir / "stream_%v" / "seg_%05d.ts"),
+            "-master_pl_name", "master.m3u8",
+            "-var_stream_map", " ".join(streams),
+            str(out_dir / "stream_%v" / "index.m3u8"),
+        ]
+    else:
+        sets = ["id=0,streams=v"] + (["id=1,streams=a"] if has_audio else [])
+        cmd += [
+            "-f", "dash",
+            "-seg_duration", str(seg),
+            "-use_template", "1",
+            "-use_timeline", "1",
+            "-adaptation_sets", " ".join(sets),
+            # Mesmos segmentos fMP4 também descritos em HLS (master.m3u8)
+            "-hls_playlist", "1",
+            "-init_seg_name", "init_$RepresentationID$.m4s",
+            "-media_seg_name", "chunk_$RepresentationID$_$Number%05d$.m4s",
+            str(out_dir / "manifest.mpd"),
+        ]
+    return cmd
+
+
+def zip_package(out_dir: Path, zip_path: Path) -> Path:
+    # Segmentos e vídeos já são comprimidos: ZIP_STORED só empacota
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for f in sorted(out_dir.rglob("*")):
+            if f.is_file() and not f.name.endswith(".tmp"):
+                zf.write(f, f.relative_to(out_dir).as_posix())
+    return zip_path
+
+
+def package_video(
+    video_input: Path,
+    out_dir: Path,
+    options: Dict,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Gera o pacote HLS/DASH de `video_input` em out_dir e retorna as estatísticas.
+    """
+    start = time.perf_counter()
+    info = media_probe.probe(video_input)
+    if not info.width or not info.height:
+        raise ValueError(f"Não foi possível obter as dimensões de {Path(video_input).name}")
+    has_audio = bool(info.audio_codec)
+
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+    cmd = build_package_command(video_input, out_dir, options, info.width, info.height, has_audio)
+    print("Running ffmpeg (package):", " ".join(cmd))
+    video_engine.run_ffmpeg(
+        cmd, f"FFmpeg {options['format'].upper()} packaging failed",
+        total_duration=info.duration, progress_callback=progress_callback
+    )
+
+    files = [f for f in out_dir.rglob("*") if f.is_file()]
+    renditions = build_renditions(info.width, info.height, options["ladder"]) if options["ladder"] else []
+    return {
+        "package_format": options["format"],
+        "segment_seconds": options["segment_seconds"],
+        "renditions": renditions or [{"name": "source", "width": info.width, "height": info.height, "copy": True}],
+        "segments": sum(1 for f in files if f.suffix in (".ts", ".m4s") and not f.name.startswith("init_")),
+        "package_bytes": sum(f.stat().st_size for f in files),
+        "package_seconds": time.perf_counter() - start,
+    }
+
+
+def package_job_output(
+    job_dir: Path,
+    video_output: Path,
+    options: Dict,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Tuple[Path, Dict]:
+    """
+    Empacota a saída de um job em job_dir/package e devolve (zip, estatísticas).
+    O MP4 intermediário é removido.
+    """
+    out_dir = job_dir / PACKAGE_DIR
+    stats = package_video(video_output, out_dir, options, progress_callback)
+    zip_path = zip_package(out_dir, job_dir / f"{PACKAGE_DIR}_{options['format']}.zip")
+    video_output.unlink(missing_ok=True)
+    return zip_path, stats
@@ -0,0 +1,218 @@
+"""
+Legendas sem re-encode do vídeo inteiro.
+
+- "partial": as legendas costumam cobrir só parte do vídeo (intro, CTA). Os intervalos das
+  cues do SRT são expandidos para os GOPs (keyframe a keyframe) que os contêm; só esses
+  GOPs são re-encodados com o filtro subtitles e o mesmo force_style, o resto é copiado.
+  Cada trecho re-encodado traz SPS/PPS próprios, então a saída é marcada como avc3 e
+  conferida com ffprobe (frames e duração iguais aos do original) antes de ser aceita.
+- "soft": a legenda vai como faixa mov_text no MP4, sem tocar no vídeo.
+
+Os dois são opcionais (subtitle_mode ou SUBTITLE_MODE); o padrão continua "burn".
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import media_probe
+import smart_merge
+import video_engine
+
+# Acima desta fração do vídeo coberta por legendas o re-encode completo é usado
+PARTIAL_SUBTITLE_MAX_COVERAGE = float(os.environ.get("PARTIAL_SUBTITLE_MAX_COVERAGE", "0.8"))
+PARTIAL_SUBTITLE_WORKERS = int(os.environ.get("PARTIAL_SUBTITLE_WORKERS", "2"))
+
+_SRT_TIME = r"(\d+):(\d{2}):(\d{2})[,.](\d{1,3})"
+_SRT_CUE = re.compile(_SRT_TIME + r"\s*-->\s*" + _SRT_TIME)
+
+
+def _srt_seconds(h: str, m: str, s: str, ms: str) -> float:
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms.ljust(3, "0")) / 1000.0
+
+
+def parse_srt(text: str) -> List[Tuple[float, float]]:
+    """
+    Intervalos (início, fim) em segundos das cues do SRT, em ordem.
+    """
+    cues = []
+    for match in _SRT_CUE.finditer(text):
+        start = _srt_seconds(*match.groups()[:4])
+        end = _srt_seconds(*match.groups()[4:])
+        if end > start:
+            cues.append((start, end))
+    return sorted(cues)
+
+
+def cue_ranges(cues: List[Tuple[float, float]], keyframes: List[float], duration: float) -> List[Tuple[float, float]]:
+    """
+    Expande as cues para intervalos entre keyframes [keyframe <= início, keyframe >= fim)
+    e junta os que se tocam.
+    """
+    ranges: List[Tuple[float, float]] = []
+    for start, end in cues:
+        if start >= duration:
+            continue
+        a = max([k for k in keyframes if k <= start + 1e-3] or [0.0])
+        b = min([k for k in keyframes if k >= end - 1e-3] or [duration])
+        if ranges and a <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], b))
+        else:
+            ranges.append((a, b))
+    return ranges
+
+
+def render_partial(
+    video_input: Path,
+    srt_input: Path,
+    output_file: Path,
+    force_style: str,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Optional[Dict]:
+    """
+    Queima as legendas re-encodando só os GOPs com cues.
+    Retorna as estatísticas, ou None quando não se aplica (o chamador faz o re-encode completo).
+    """
+    start = time.perf_counter()
+    try:
+        params = media_probe.video_stream_params(video_input)
+        encoder_args = smart_merge.tail_encoder_args(params, preset="fast")
+        if encoder_args is None or abs(float(params.get("start_time") or 0.0)) > 1e-3:
+            print("Partial subtitles: stream not matchable, using full re-encode")
+            return None
+        duration = media_probe.get_duration(video_input)
+        keyframes = media_probe.get_keyframe_times(video_input)
+    except (RuntimeError, ValueError) as e:
+        print(f"Partial subtitles: probe failed ({e})")
+        return None
+
+    cues = parse_srt(srt_input.read_text(encoding="utf-8", errors="replace"))
+    ranges = cue_ranges(cues, keyframes, duration)
+    encoded_seconds = sum(b - a for a, b in ranges)
+    if duration <= 0 or encoded_seconds / duration > PARTIAL_SUBTITLE_MAX_COVERAGE:
+        print(f"Partial subtitles: cues cover {encoded_seconds:.1f}s of {duration:.1f}s, using full re-encode")
+        return None
+
+    if not ranges:
+        # Nenhuma cue dentro do vídeo: nada para queimar
+        video_engine.run_ffmpeg(
+            ["ffmpeg", "-y", "-i", str(video_input), "-c", "copy", str(output_file)],
+            "FFmpeg copy failed"
+        )
+        return {"subtitle_mode": "partial", "ranges": [], "encoded_seconds": 0.0,
+                "copied_seconds": round(duration, 3), "seconds": time.perf_counter() - start}
+
+    fps = smart_merge.frame_rate(params)
+    boundaries = sorted({t for r in ranges for t in r if 0.0 < t < duration})
+    # Partes [0, b1), [b1, b2), ..., [bn, fim); as que caem dentro de um range são re-encodadas
+    edges = [0.0, *boundaries, duration]
+    pieces = list(zip(edges[:-1], edges[1:]))
+    to_encode = [
+        i for i, (a, b) in enumerate(pieces)
+        if any(ra <= a + 1e-3 and b <= rb + 1e-3 for ra, rb in ranges)
+    ]
+
+    work_dir = Path(tempfile.mkdtemp(prefix="subs_partial_", dir=output_file.parent))
+    try:
+        parts = smart_merge.split_copy(video_input, boundaries, work_dir, fps) if boundaries else []
+        if len(parts) != len(pieces):
+            print(f"Partial subtitles: expected {len(pieces)} copied parts, got {len(parts)}")
+            return None
+
+        done = {"seconds": 0.0}
+        done_lock = threading.Lock()
+        vf_subs = video_engine.subtitles_filter(srt_input, force_style)
+
+        def encode(i: int):
+            a, b = pieces[i]
+            seek = smart_merge.seek_time(a, fps)
+            out = work_dir / f"subs_{i:03d}.ts"
+            cmd = [
+                "ffmpeg", "-y",
+                "-ss", f"{seek}",
+                "-i", str(video_input.resolve()),
+                "-map", "0:v:0",
+                # Volta os timestamps para o tempo do vídeo original antes do subtitles
+                "-vf", f"setpts=PTS+{seek}/TB,{vf_subs},setpts=PTS-STARTPTS",
+                *encoder_args,
+                "-t", str(b - a),
+                "-f", "mpegts",
+                str(out.resolve()),
+            ]
+            video_engine.run_ffmpeg(cmd, f"FFmpeg subtitle range {a:.2f}-{b:.2f}s failed", cwd=srt_input.parent)
+            parts[i] = out
+            with done_lock:
+                done["seconds"] += b - a
+                seconds = done["seconds"]
+            if progress_callback is not None:
+                progress_callback(video_engine.progress_update(
+                    seconds, encoded_seconds, time.perf_counter() - start,
+                    status="end" if seconds >= encoded_seconds - 1e-3 else "running"
+                ))
+
+        print(f"Partial subtitles: re-encoding {len(to_encode)}/{len(pieces)} ranges ({encoded_seconds:.2f}s of {duration:.2f}s)")
+        with ThreadPoolExecutor(max_workers=max(1, PARTIAL_SUBTITLE_WORKERS)) as pool:
+            list(pool.map(encode, to_encode))
+
+        list_file = smart_merge.concat_list(parts, work_dir / "parts.txt")
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", str(list_file),
+            "-i", str(video_input),
+            "-map", "0:v",
+            "-map", "1:a?",
+            "-c", "copy",
+            # SPS/PPS mudam a cada trecho re-encodado: parâmetros em banda (avc3)
+            "-tag:v", "avc3",
+            str(output_file),
+        ]
+        print("Running ffmpeg (partial subtitles concat):", " ".join(cmd))
+        video_engine.run_ffmpeg(cmd, "FFmpeg partial subtitles concat failed")
+
+        _, source_duration = media_probe.count_video_frames(video_input)
+        mismatch = smart_merge.check_output(output_file, source_duration, fps)
+        if mismatch is not None:
+            print(f"Partial subtitles output does not match the source ({mismatch}), falling back to full re-encode")
+            return None
+    except RuntimeError as e:
+        print(f"Partial subtitles failed, falling back to full re-encode: {e}")
+        return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "subtitle_mode": "partial",
+        "ranges": [[round(a, 3), round(b, 3)] for a, b in ranges],
+        "encoded_seconds": round(encoded_seconds, 3),
+        "copied_seconds": round(duration - encoded_seconds, 3),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def mux_soft(video_input: Path, srt_input: Path, output_file: Path) -> Dict:
+    """
+    Legenda como faixa mov_text (sem re-encode). O estilo (cor, posição, tamanho)
+    fica por conta do player.
+    """
+    start = time.perf_counter()
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(video_input),
+        "-i", str(srt_input),
+        "-map", "0:v",
+        "-map", "0:a?",
+        "-map", "1:0",
+        "-c", "copy",
+        "-c:s", "mov_text",
+        "-disposition:s:0", "default",
+        str(output_file),
+    ]
+    print("Running ffmpeg (soft subtitles):", " ".join(cmd))
+    video_engine.run_ffmpeg(cmd, "Erro no FFmpeg ao adicionar legendas")
+    return {"subtitle_mode": "soft", "seconds": time.perf_counter() - start}
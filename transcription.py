@@ -0,0 +1,308 @@
+"""
+Transcrição com Whisper (timestamps por palavra).
+
+O áudio vem do audio_ingest (PCM 16 kHz decodificado uma vez, lido por memmap) e é
+passado ao modelo como array. Áudios curtos vão numa única passada, como antes.
+Áudios longos são divididos em trechos nos silêncios (detecção por energia),
+transcritos em paralelo num pool de processos (cada processo com seu modelo no
+model_registry, lendo só o seu trecho do PCM) e os timestamps das palavras são
+deslocados de volta para a linha do tempo global. Como os cortes caem em silêncio,
+nenhuma palavra é partida entre dois trechos. Quando as cópias do modelo nos workers
+não cabem no orçamento WHISPER_CACHE_MAX_MB, os trechos rodam em sequência no modelo
+residente deste processo.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import audio_ingest
+import disk_cache
+from model_registry import registry as whisper_registry
+
+# Acima desta duração (s) a transcrição é dividida em trechos
+WHISPER_LONG_AUDIO_SECONDS = float(os.environ.get("WHISPER_LONG_AUDIO_SECONDS", "300"))
+# Tamanho alvo de cada trecho (s); o corte real cai no silêncio mais próximo
+WHISPER_CHUNK_SECONDS = float(os.environ.get("WHISPER_CHUNK_SECONDS", "120"))
+# Processos de transcrição. Cada um carrega a própria cópia do modelo, além da que fica
+# residente no processo da API: a memória é ~(1 + WHISPER_WORKERS) x o modelo. Com
+# WHISPER_CACHE_MAX_MB, o pool só é usado se essas cópias cabem no orçamento
+WHISPER_WORKERS = int(os.environ.get("WHISPER_WORKERS", "2"))
+
+# Cache das palavras transcritas (áudio + modelo + idioma); reagrupar o SRT não chama o Whisper
+TRANSCRIPT_CACHE_ENABLED = os.environ.get("TRANSCRIPT_CACHE", "1") == "1"
+TRANSCRIPT_CACHE_MAX_MB = int(os.environ.get("TRANSCRIPT_CACHE_MAX_MB", "256"))
+# Incrementar quando o formato das palavras ou a transcrição mudar
+TRANSCRIPT_CACHE_VERSION = 1
+
+transcript_cache = disk_cache.DiskCache("transcripts", TRANSCRIPT_CACHE_MAX_MB)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def plan_chunks(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    db=None,
+    chunk_seconds: float = WHISPER_CHUNK_SECONDS
+) -> List[Tuple[float, float]]:
+    """
+    Trechos (início, fim) de ~chunk_seconds, cortados no meio do silêncio mais longo
+    da janela [alvo - 25%, alvo + 25%]. Sem silêncio na janela, corta no frame de menor
+    energia da janela (ou no alvo, sem energia).
+    """
+    chunks = []
+    start = 0.0
+    while duration - start > chunk_seconds * 1.25:
+        target = start + chunk_seconds
+        lo, hi = target - chunk_seconds * 0.25, target + chunk_seconds * 0.25
+        candidates = [(b - a, (a + b) / 2) for a, b in silences if lo <= (a + b) / 2 <= hi]
+        if candidates:
+            cut = max(candidates)[1]
+        elif db is not None and len(db):
+            frame = audio_ingest.FRAME_SECONDS
+            i0 = int(lo / frame)
+            i1 = max(i0 + 1, min(len(db), int(hi / frame)))
+            cut = (i0 + int(db[i0:i1].argmin()) + 0.5) * frame
+        else:
+            cut = target
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, duration))
+    return chunks
+
+
+def _words_from_result(result: Dict, offset: float = 0.0) -> List[Dict]:
+    words = []
+    for seg in result["segments"]:
+        for w in seg.get("words", []):
+            words.append({
+                "word": w["word"],
+                "start": float(w["start"]) + offset,
+                "end": float(w["end"]) + offset,
+                "probability": float(w.get("probability", 0.0)),
+            })
+    return words
+
+
+def _load_samples(pcm_path: str, start: int = 0, end: Optional[int] = None):
+    import numpy as np
+
+    # Cópia gravável do trecho (o memmap é somente leitura)
+    return np.array(audio_ingest.read_pcm(Path(pcm_path), start, end))
+
+
+def _detect_language_worker(model_size: str, device: Optional[str], pcm_path: str) -> str:
+    import whisper
+
+    samples = _load_samples(pcm_path, 0, 30 * audio_ingest.SAMPLE_RATE)
+    with whisper_registry.use(model_size, device) as model:
+        audio = whisper.pad_or_trim(samples)
+        mel = whisper.log_mel_spectrogram(audio, getattr(model.dims, "n_mels", 80)).to(model.device)
+        _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
+
+
+def _transcribe_chunk_worker(
+    model_size: str,
+    device: Optional[str],
+    pcm_path: str,
+    start: int,
+    end: int,
+    language: Optional[str]
+) -> List[Dict]:
+    # Cada worker lê seu trecho direto do PCM (sem copiar o áudio pelo pipe do pool)
+    samples = _load_samples(pcm_path, start, end)
+    with whisper_registry.use(model_size, device) as model:
+        result = model.transcribe(samples, language=language, word_timestamps=True)
+    return _words_from_result(result, start / float(audio_ingest.SAMPLE_RATE))
+
+
+def _init_worker():
+    # Cada worker fica só com o último modelo usado: a conta de _pool_fits é uma cópia por worker
+    whisper_registry.max_bytes = 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, WHISPER_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def _pool_fits(model_size: str, device: Optional[str]) -> bool:
+    """
+    O pool soma WHISPER_WORKERS cópias do modelo às residentes neste processo. Sem
+    orçamento (WHISPER_CACHE_MAX_MB=0) ele é sempre usado; com orçamento, só se as
+    cópias cabem no que sobra depois dos modelos residentes.
+    """
+    budget = whisper_registry.max_bytes
+    if budget <= 0:
+        return True
+    # O tamanho vem do modelo residente, que é carregado aqui se ainda não estiver
+    model_bytes = whisper_registry.model_bytes(model_size, device)
+    return whisper_registry.used_bytes() + max(1, WHISPER_WORKERS) * model_bytes <= budget
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def transcript_key(audio_sha256: str, model_size: str, language: Optional[str]) -> str:
+    return disk_cache.make_key(TRANSCRIPT_CACHE_VERSION, audio_sha256, model_size, language or "auto")
+
+
+def audio_info_key(audio_sha256: str) -> str:
+    return disk_cache.make_key(TRANSCRIPT_CACHE_VERSION, "audio_info", audio_sha256)
+
+
+def cached_audio_info(audio_sha256: str) -> Optional[Dict]:
+    """
+    Estatísticas do áudio (IngestedAudio.to_dict) guardadas ao lado da transcrição,
+    para um cache hit não precisar decodificar o áudio só para elas.
+    """
+    if not TRANSCRIPT_CACHE_ENABLED:
+        return None
+    cached = transcript_cache.lookup(audio_info_key(audio_sha256), ".json")
+    if cached is None:
+        return None
+    try:
+        return json.loads(cached.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def store_audio_info(audio_sha256: str, info: Dict):
+    if TRANSCRIPT_CACHE_ENABLED:
+        transcript_cache.store_bytes(audio_info_key(audio_sha256), json.dumps(info).encode("utf-8"), ".json")
+
+
+def transcribe_words(
+    audio_path: Path,
+    model_size: str = "medium",
+    language: Optional[str] = None,
+    device: Optional[str] = None,
+    chunked: Optional[bool] = None,
+    audio_sha256: Optional[str] = None,
+    audio: Optional[audio_ingest.IngestedAudio] = None,
+    audio_loader: Optional[Callable[[], audio_ingest.IngestedAudio]] = None
+) -> List[Dict]:
+    """
+    Palavras com timestamps globais ({"word", "start", "end", "probability"}),
+    servidas do cache em disco quando o mesmo áudio já foi transcrito com o mesmo
+    modelo e idioma. `audio_sha256` evita recalcular o hash (uploads) e `audio`
+    reaproveita um áudio já ingerido. `audio_loader` só é chamado num cache miss,
+    então um hit não decodifica o áudio.
+    """
+    audio_sha256 = audio_sha256 or (audio.sha256 if audio else None)
+    key = None
+    if TRANSCRIPT_CACHE_ENABLED:
+        key = transcript_key(audio_sha256 or disk_cache.file_sha256(audio_path), model_size, language)
+        cached = transcript_cache.lookup(key, ".json")
+        if cached is not None:
+            try:
+                words = json.loads(cached.read_text(encoding="utf-8"))
+                print(f"Transcript cache hit ({len(words)} words)")
+                return words
+            except (OSError, ValueError):
+                # Despejado ou corrompido: transcreve de novo
+                pass
+
+    if audio is None and audio_loader is not None:
+        audio = audio_loader()
+    if audio is not None:
+        words = _transcribe(audio, model_size, language, device, chunked)
+    else:
+        work_dir = tempfile.mkdtemp(prefix="ingest_")
+        try:
+            words = _transcribe(
+                audio_ingest.ingest(audio_path, Path(work_dir), audio_sha256),
+                model_size, language, device, chunked
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if key is not None:
+        transcript_cache.store_bytes(
+            key, json.dumps(words).encode("utf-8"), ".json",
+            {"model_size": model_size, "language": language, "words": len(words)}
+        )
+    return words
+
+
+def _transcribe(
+    audio: audio_ingest.IngestedAudio,
+    model_size: str,
+    language: Optional[str],
+    device: Optional[str],
+    chunked: Optional[bool]
+) -> List[Dict]:
+    """
+    chunked=None decide pela duração (WHISPER_LONG_AUDIO_SECONDS).
+    """
+    duration = audio.duration
+    if chunked is None:
+        chunked = duration > WHISPER_LONG_AUDIO_SECONDS
+
+    if not chunked:
+        samples = _load_samples(str(audio.pcm_path))
+        # O modelo vem do registro global (carregado uma vez por processo)
+        with whisper_registry.use(model_size, device) as model:
+            print(f"Transcribing audio (Language: {language or 'Auto-detect'})...")
+            result = model.transcribe(samples, language=language, word_timestamps=True)
+        return _words_from_result(result)
+
+    db = audio.energy_db()
+    chunks = plan_chunks(duration, audio_ingest.find_silences(db), db)
+    pcm_path = str(audio.pcm_path)
+    sr = audio.sample_rate
+
+    if not _pool_fits(model_size, device):
+        # As funções dos workers rodam aqui mesmo, no modelo residente
+        if language is None:
+            language = _detect_language_worker(model_size, device, pcm_path)
+        print(
+            f"Transcribing {duration:.1f}s of audio in {len(chunks)} chunks on the resident model "
+            f"({WHISPER_WORKERS} worker copies do not fit WHISPER_CACHE_MAX_MB) (Language: {language})..."
+        )
+        words: List[Dict] = []
+        for a, b in chunks:
+            words.extend(_transcribe_chunk_worker(model_size, device, pcm_path, int(a * sr), int(b * sr), language))
+        return words
+
+    pool = get_pool()
+    # Idioma detectado uma vez (no início do áudio) e usado em todos os trechos,
+    # como na passada única
+    if language is None:
+        language = pool.submit(_detect_language_worker, model_size, device, pcm_path).result()
+
+    print(
+        f"Transcribing {duration:.1f}s of audio in {len(chunks)} chunks "
+        f"with {WHISPER_WORKERS} workers (Language: {language})..."
+    )
+    futures = [
+        pool.submit(
+            _transcribe_chunk_worker, model_size, device, pcm_path,
+            int(a * sr), int(b * sr), language
+        )
+        for a, b in chunks
+    ]
+    words = []
+    for future in futures:
+        words.extend(future.result())
+    return words
@@ -0,0 +1,395 @@
+import hashlib
+import os
+import shutil
+import time
+import zipfile
+from contextvars import ContextVar
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:
+    # Versões antigas do python-multipart (o mesmo fallback do Starlette)
+    from multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Limites em MB (0 = sem limite)
+MAX_UPLOAD_FILE_MB = int(os.environ.get("MAX_UPLOAD_FILE_MB", "1024"))
+MAX_UPLOAD_REQUEST_MB = int(os.environ.get("MAX_UPLOAD_REQUEST_MB", "2048"))
+MAX_ZIP_EXTRACTED_MB = int(os.environ.get("MAX_ZIP_EXTRACTED_MB", "4096"))
+
+MB = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class UploadResult:
+    def __init__(self, filename: str, path: Optional[Path], size: int, sha256: str, seconds: float):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.seconds = seconds
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.size / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "filename": self.filename,
+            "size": self.size,
+            "sha256": self.sha256,
+            "seconds": round(self.seconds, 3),
+            "bytes_per_sec": round(self.bytes_per_sec, 1),
+        }
+
+
+class UploadBudget:
+    """
+    Controla o total de bytes recebidos numa mesma requisição (soma de todos os arquivos).
+    """
+
+    def __init__(self, max_request_mb: int = MAX_UPLOAD_REQUEST_MB, max_file_mb: int = MAX_UPLOAD_FILE_MB):
+        self.max_request_bytes = max_request_mb * MB
+        self.max_file_bytes = max_file_mb * MB
+        self.used = 0
+        self.results: List[UploadResult] = []
+
+    def add(self, result: UploadResult):
+        self.consume(result.filename, result.size, result.size)
+        self.results.append(result)
+
+    def consume(self, filename: str, file_bytes: int, n: int):
+        self.used += n
+        if self.max_file_bytes and file_bytes > self.max_file_bytes:
+            raise UploadTooLarge(
+                f"Arquivo '{filename}' excede o limite de {self.max_file_bytes // MB} MB"
+            )
+        if self.max_request_bytes and self.used > self.max_request_bytes:
+            raise UploadTooLarge(
+                f"Upload total excede o limite de {self.max_request_bytes // MB} MB por requisição"
+            )
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_bytes": self.used,
+            "files": [r.to_dict() for r in self.results],
+        }
+
+
+class _MultipartTracker:
+    """
+    Acompanha o corpo multipart enquanto ele chega, com o mesmo parser que o Starlette
+    usa (python-multipart): aplica os limites por requisição e por arquivo e mede, para
+    cada arquivo, tamanho, sha256 e o tempo de chegada dos bytes (a taxa real do upload,
+    não a da cópia do arquivo temporário).
+    """
+
+    def __init__(self, boundary: Optional[bytes], max_request_bytes: int, max_file_bytes: int):
+        self.max_request_bytes = max_request_bytes
+        self.max_file_bytes = max_file_bytes
+        self.total = 0
+        # Resultados por Content-Disposition da parte (o mesmo cabeçalho que o UploadFile guarda)
+        self.received: Dict[str, List[UploadResult]] = {}
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self._part: Optional[Dict] = None
+        self._parser = None
+        if boundary:
+            self._parser = MultipartParser(boundary, callbacks={
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            })
+
+    def feed(self, chunk: bytes):
+        self.total += len(chunk)
+        if self.max_request_bytes and self.total > self.max_request_bytes:
+            raise UploadTooLarge(
+                f"Upload total excede o limite de {self.max_request_bytes // MB} MB por requisição"
+            )
+        if self._parser is None:
+            return
+        try:
+            self._parser.write(chunk)
+        except UploadTooLarge:
+            raise
+        except Exception:
+            # Corpo malformado: o parser do Starlette devolve o erro; aqui só deixamos de medir
+            self._parser = None
+            self.received = {}
+
+    def take(self, disposition: str) -> Optional[UploadResult]:
+        results = self.received.get(disposition)
+        return results.pop(0) if results else None
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = b""
+        self._value = b""
+
+    def _on_headers_finished(self):
+        disposition = self._headers.get(b"content-disposition", b"")
+        _, options = parse_options_header(disposition)
+        if b"filename" not in options:
+            # Campo comum do formulário, não é arquivo
+            return
+        self._part = {
+            "disposition": disposition.decode("latin-1"),
+            "filename": options[b"filename"].decode("utf-8", errors="replace"),
+            "digest": hashlib.sha256(),
+            "size": 0,
+            "start": time.perf_counter(),
+        }
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part is None:
+            return
+        part["size"] += end - start
+        if self.max_file_bytes and part["size"] > self.max_file_bytes:
+            raise UploadTooLarge(
+                f"Arquivo '{part['filename']}' excede o limite de {self.max_file_bytes // MB} MB"
+            )
+        part["digest"].update(data[start:end])
+
+    def _on_part_end(self):
+        part = self._part
+        if part is None:
+            return
+        result = UploadResult(
+            part["filename"], None, part["size"], part["digest"].hexdigest(),
+            time.perf_counter() - part["start"]
+        )
+        self.received.setdefault(part["disposition"], []).append(result)
+        self._part = None
+
+
+# Tracker da requisição em andamento, lido por save_upload/hash_upload no handler
+_current_tracker: ContextVar[Optional[_MultipartTracker]] = ContextVar("upload_tracker", default=None)
+
+
+def _multipart_boundary(content_type: str) -> Optional[bytes]:
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            return value.strip('"').encode("latin-1")
+    return None
+
+
+class UploadLimitMiddleware:
+    """
+    Aplica os limites de upload no corpo da requisição enquanto ele chega, antes que o
+    parser multipart grave as partes em arquivos temporários. Um Content-Length acima do
+    limite é recusado sem ler o corpo. Sem Content-Length (chunked), a leitura é
+    interrompida no primeiro bloco que passa do limite total ou do limite por arquivo.
+    A recusa é um 413 com {"error": ...}. Tamanho, sha256 e tempo de chegada de cada
+    arquivo ficam disponíveis para save_upload/hash_upload (ver _MultipartTracker).
+    """
+
+    def __init__(self, app, max_request_mb: int = MAX_UPLOAD_REQUEST_MB, max_file_mb: int = MAX_UPLOAD_FILE_MB):
+        self.app = app
+        self.max_request_bytes = max_request_mb * MB
+        self.max_file_bytes = max_file_mb * MB
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        if not content_type.lower().startswith("multipart/"):
+            await self.app(scope, receive, send)
+            return
+
+        length = headers.get(b"content-length", b"")
+        if self.max_request_bytes and length.isdigit() and int(length) > self.max_request_bytes:
+            response = JSONResponse(
+                {"error": f"Upload total excede o limite de {self.max_request_bytes // MB} MB por requisição"},
+                status_code=413,
+            )
+            await response(scope, receive, send)
+            return
+
+        tracker = _MultipartTracker(_multipart_boundary(content_type), self.max_request_bytes, self.max_file_bytes)
+        state = {"rejected": False}
+
+        async def limited_receive():
+            if state["rejected"]:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                try:
+                    tracker.feed(message.get("body", b""))
+                except UploadTooLarge as e:
+                    state["rejected"] = True
+                    await JSONResponse({"error": str(e)}, status_code=413)(scope, receive, send)
+                    # O parser vê o cliente como desconectado e para de ler
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # Depois da recusa a resposta já foi enviada; a do app é descartada
+            if not state["rejected"]:
+                await send(message)
+
+        token = _current_tracker.set(tracker)
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        finally:
+            _current_tracker.reset(token)
+
+
+def safe_filename(filename: Optional[str], default: str) -> str:
+    # Remove diretórios do nome enviado pelo cliente (evita path traversal)
+    name = os.path.basename(filename or "")
+    return name or default
+
+
+def received_upload(upload: UploadFile) -> Optional[UploadResult]:
+    """
+    Tamanho, sha256 e tempo de chegada medidos pelo UploadLimitMiddleware para este arquivo.
+    None sem o middleware (ex.: chamadas diretas), quando o hash é feito na cópia.
+    """
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return None
+    return tracker.take(upload.headers.get("content-disposition", ""))
+
+
+def _copy_hashing(fileobj: BinaryIO, sink: Optional[BinaryIO] = None) -> Tuple[int, str, float]:
+    # Fallback sem o middleware: lê o temporário do upload em blocos (fora do event loop)
+    digest = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        digest.update(chunk)
+        if sink is not None:
+            sink.write(chunk)
+    fileobj.seek(0)
+    return size, digest.hexdigest(), time.perf_counter() - start
+
+
+def _copy_to(fileobj: BinaryIO, dest: Path, hashing: bool) -> Optional[Tuple[int, str, float]]:
+    with open(dest, "wb") as f:
+        if hashing:
+            return _copy_hashing(fileobj, f)
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, f, UPLOAD_CHUNK_SIZE)
+    return None
+
+
+async def save_upload(upload: UploadFile, dest: Path, budget: UploadBudget) -> UploadResult:
+    """
+    Copia o upload para `dest`. Quando o handler roda, o parser multipart já gravou o
+    arquivo num temporário; a cópia vai para o threadpool para não travar o event loop.
+    Tamanho, sha256 e tempo vêm do UploadLimitMiddleware, que os mede enquanto os bytes
+    chegam (sem ele, são calculados durante a cópia).
+    """
+    result = received_upload(upload)
+    try:
+        copied = await run_in_threadpool(_copy_to, upload.file, dest, result is None)
+    except Exception:
+        dest.unlink(missing_ok=True)
+        raise
+    if result is None:
+        result = UploadResult(upload.filename or "", None, *copied)
+    try:
+        budget.add(result)
+    except UploadTooLarge:
+        dest.unlink(missing_ok=True)
+        raise
+
+    result.path = dest
+    print(
+        f"Upload '{result.filename}' -> {dest.name}: {result.size / MB:.1f} MB "
+        f"received in {result.seconds:.2f}s ({result.bytes_per_sec / MB:.1f} MB/s)"
+    )
+    return result
+
+
+async def hash_upload(upload: UploadFile, budget: UploadBudget) -> UploadResult:
+    """
+    Tamanho e sha256 do upload sem copiá-lo (medidos na chegada, ou lidos do temporário
+    sem o middleware); o arquivo fica na posição 0.
+    """
+    result = received_upload(upload)
+    if result is None:
+        result = UploadResult(upload.filename or "", None, *await run_in_threadpool(_copy_hashing, upload.file))
+    budget.add(result)
+    await upload.seek(0)
+    return result
+
+
+def _extract_zip(fileobj, dest_dir: Path, max_extracted: int) -> int:
+    dest_root = dest_dir.resolve()
+    extracted = 0
+
+    with zipfile.ZipFile(fileobj, "r") as zip_ref:
+        for member in zip_ref.infolist():
+            target = (dest_root / member.filename).resolve()
+            if dest_root != target and dest_root not in target.parents:
+                raise ValueError(f"Caminho inválido no ZIP: {member.filename}")
+
+            if member.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+
+            extracted += member.file_size
+            if max_extracted and extracted > max_extracted:
+                raise UploadTooLarge(f"Conteúdo do ZIP excede {max_extracted // MB} MB descompactado")
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with zip_ref.open(member) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+
+    return extracted
+
+
+async def extract_zip_upload(
+    upload: UploadFile,
+    dest_dir: Path,
+    budget: UploadBudget,
+    max_extracted_mb: int = MAX_ZIP_EXTRACTED_MB
+) -> UploadResult:
+    """
+    Extrai o ZIP direto do arquivo temporário do upload, sem gravar uma segunda cópia.
+    Tamanho e hash vêm da chegada do upload (hash_upload); depois extrai membro a membro.
+    """
+    result = await hash_upload(upload, budget)
+
+    extracted = await run_in_threadpool(_extract_zip, upload.file, dest_dir, max_extracted_mb * MB)
+
+    print(
+        f"ZIP '{result.filename}': {result.size / MB:.1f} MB "
+        f"({result.bytes_per_sec / MB:.1f} MB/s), {extracted / MB:.1f} MB extracted"
+    )
+    return result
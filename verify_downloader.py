@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import downloader
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Servidor local no lugar do CDN do Replicate:
+    /ok      arquivo inteiro, com suporte a Range
+    /flaky   derruba a conexão no meio da primeira resposta, depois responde com Range
+    /norange derruba a conexão no meio e ignora Range (o download recomeça do zero)
+    /busy    503 na primeira requisição
+    /missing 404
+    /done416 chunked sem o bloco final (tamanho desconhecido); o Range seguinte recebe
+             416 com o tamanho igual ao já baixado (download completo)
+    /stale416 chunked cortado no meio; o Range seguinte recebe 416 com outro tamanho
+             (recomeça do zero)
+    """
+    protocol_version = "HTTP/1.1"
+    hits = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        count = self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path == "/missing" or (self.path == "/busy" and count == 1):
+            self.send_response(404 if self.path == "/missing" else 503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.path in ("/done416", "/stale416"):
+            if count == 1:
+                body = PAYLOAD if self.path == "/done416" else PAYLOAD[:len(PAYLOAD) // 2]
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(body), body))
+                # Sem o bloco "0" final: o cliente vê a conexão cair
+                self.close_connection = True
+                return
+            if count == 2:
+                size = len(PAYLOAD) if self.path == "/done416" else len(PAYLOAD) + 1
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.path != "/norange":
+            start = int(range_header.split("=", 1)[1].split("-", 1)[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+        if self.path in ("/flaky", "/norange") and count == 1:
+            # Metade do corpo e fecha a conexão
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def check(name, url, dest):
+    try:
+        stats = downloader.download(url, dest)
+    except downloader.DownloadError as e:
+        print(f"{name}: DownloadError ({e})")
+        return None
+    ok = hashlib.sha256(dest.read_bytes()).digest() == hashlib.sha256(PAYLOAD).digest()
+    print(f"{name}: {'SUCCESS' if ok else 'FAILURE'} {stats}")
+    return stats
+
+
+def test_downloader():
+    print("Testing downloader against a local stand-in server...")
+    downloader.DOWNLOAD_BACKOFF_SECONDS = 0.05
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    work = Path(tempfile.mkdtemp(prefix="verify_downloader_"))
+    try:
+        check("ok", f"{base}/ok", work / "ok.bin")
+
+        stats = check("flaky (resume)", f"{base}/flaky", work / "flaky.bin")
+        if stats and stats["resumed_bytes"] == 0:
+            print("FAILURE: flaky download did not resume with Range.")
+
+        stats = check("norange (restart)", f"{base}/norange", work / "norange.bin")
+        if stats and stats["resumed_bytes"] != 0:
+            print("FAILURE: server ignored Range but bytes were counted as resumed.")
+
+        check("busy (retry)", f"{base}/busy", work / "busy.bin")
+
+        check("416 after complete body", f"{base}/done416", work / "done416.bin")
+
+        stats = check("416 with another size (restart)", f"{base}/stale416", work / "stale416.bin")
+        if stats and stats["attempts"] != 3:
+            print(f"FAILURE: expected 3 attempts, got {stats['attempts']}.")
+
+        if check("missing", f"{base}/missing", work / "missing.bin") is None and not (work / "missing.bin").exists():
+            print("missing: SUCCESS (no retry on 404, no partial file)")
+
+        print("Totals:", downloader.stats())
+    finally:
+        server.shutdown()
+        downloader.close_session()
+        for f in work.iterdir():
+            f.unlink()
+        work.rmdir()
+
+
+if __name__ == "__main__":
+    test_downloader()
@@ -0,0 +1,102 @@
+"""
+Confere que os modos "parallel" e "windowed" saem iguais ao grafo único: mesmo número
+de frames e PSNR alto frame a frame. Os renders usam x264 sem perdas (crf 0), então
+qualquer diferença vem dos filtros (cortes, janelas de transição), não do encoder.
+Rodar no build de ffmpeg de produção antes de tornar "auto" o padrão de RENDER_MODE.
+"""
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import benchmark
+import video_engine
+
+# Média e pior frame aceitos contra o grafo único (dB)
+MIN_AVG_PSNR = 50.0
+MIN_FRAME_PSNR = 40.0
+
+CASES = {
+    # Durações e transições que caem em frames inteiros
+    "whole_frames": {"duration": 2.0, "transition_duration": 0.5},
+    # Transições e clipes no meio de um frame (16.5 e 70.5 frames a 30 fps)
+    "fractional": {"duration": 2.35, "transition_duration": 0.55},
+    # Cortes secos misturados com transições
+    "hardcuts": {"duration": 1.5, "transition_duration": 0.4, "transitions": ["fade", "none", "wipeleft", "none"]},
+}
+
+
+def count_frames(path: Path) -> int:
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_frames",
+         "-show_entries", "stream=nb_read_frames", "-of", "default=noprint_wrappers=1:nokey=1", str(path)],
+        capture_output=True, text=True
+    )
+    try:
+        return int(result.stdout.strip())
+    except ValueError:
+        return 0
+
+
+def frame_psnr(reference: Path, candidate: Path, stats_file: Path):
+    """
+    PSNR médio e do pior frame do candidato contra a referência.
+    """
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-i", str(candidate), "-i", str(reference),
+        "-lavfi", f"[0:v][1:v]psnr=stats_file={stats_file}", "-f", "null", "-",
+    ], check=True)
+    values = []
+    for line in stats_file.read_text().splitlines():
+        for field in line.split():
+            if field.startswith("psnr_avg:"):
+                value = field.split(":", 1)[1]
+                values.append(float("inf") if value == "inf" else float(value))
+    if not values:
+        return 0.0, 0.0
+    finite = [v for v in values if v != float("inf")]
+    avg = sum(finite) / len(finite) if finite else float("inf")
+    return avg, min(values)
+
+
+def check_case(work: Path, name: str, params: dict, images) -> bool:
+    video_options = {"resolution": "320x568", "fps": 30, "prescale_images": True, "window_size": 2,
+                     "segment_cache": False, "encoder": {"preset": "ultrafast", "crf": 0}}
+    outputs = {}
+    for mode in ("single", "parallel", "windowed"):
+        cfg = benchmark.make_timeline(
+            images, duration=params["duration"], transition_duration=params["transition_duration"],
+            transitions=params.get("transitions", ["fade", "wipeleft", "slideup", "circlecrop"]),
+            video_options={**video_options, "render_mode": mode},
+        )
+        out = work / f"{name}_{mode}.mp4"
+        stats = video_engine.generate_video_from_config(cfg, work, out)
+        if stats["render_mode"] != mode:
+            print(f"FAILURE: {name}/{mode} fell back to {stats['render_mode']}")
+            return False
+        outputs[mode] = out
+
+    ok = True
+    expected = count_frames(outputs["single"])
+    for mode in ("parallel", "windowed"):
+        frames = count_frames(outputs[mode])
+        avg, worst = frame_psnr(outputs["single"], outputs[mode], work / f"{name}_{mode}_psnr.log")
+        passed = frames == expected and avg >= MIN_AVG_PSNR and worst >= MIN_FRAME_PSNR
+        print(
+            f"{'SUCCESS' if passed else 'FAILURE'}: {name}/{mode} frames {frames} (single {expected}), "
+            f"PSNR avg {avg:.1f} dB, worst frame {worst:.1f} dB"
+        )
+        ok = ok and passed
+    return ok
+
+
+if __name__ == "__main__":
+    work = Path(tempfile.mkdtemp(prefix="verify_modes_"))
+    try:
+        images = benchmark.make_images(work, 7, "640x480")
+        results = [check_case(work, name, params, images) for name, params in CASES.items()]
+        print("\nAll render modes match the single graph." if all(results) else "\nRender modes differ from the single graph.")
+    except Exception as e:
+        print(f"ERROR: {e}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
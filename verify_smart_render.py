@@ -0,0 +1,103 @@
+"""
+Confere o smart-render do merge e as legendas "partial": a saída emendada (trechos
+copiados + trechos re-encodados) precisa decodificar sem erros e ter os mesmos frames e
+duração do re-encode completo.
+O vídeo de entrada é codificado com parâmetros diferentes dos da cauda (preset, referências),
+como um vídeo enviado por fora, para que os SPS/PPS mudem na emenda.
+Rodar no build de ffmpeg de produção antes de ligar MERGE_SMART_RENDER ou SUBTITLE_MODE=partial.
+"""
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import media_probe
+import video_engine
+
+
+def make_source(work: Path) -> Path:
+    source = work / "source.mp4"
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", "testsrc2=duration=8:size=640x360:rate=30",
+        "-f", "lavfi", "-i", "sine=frequency=660:duration=8",
+        "-c:v", "libx264", "-preset", "veryfast", "-x264-params", "ref=1:keyint=30",
+        "-pix_fmt", "yuv420p", "-c:a", "aac", str(source),
+    ], check=True)
+    return source
+
+
+def make_audio(work: Path, name: str, seconds: float, freq: int) -> Path:
+    path = work / name
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency={freq}:duration={seconds}", str(path),
+    ], check=True)
+    return path
+
+
+def decode_errors(path: Path) -> str:
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", str(path), "-f", "null", "-"],
+        capture_output=True, text=True
+    )
+    return result.stderr.strip()
+
+
+def check(name: str, smart: Path, full: Path, stats: dict, mode_key: str, mode: str) -> bool:
+    errors = decode_errors(smart)
+    frames, duration = media_probe.count_video_frames(smart)
+    full_frames, full_duration = media_probe.count_video_frames(full)
+    passed = (
+        stats.get(mode_key) == mode
+        and not errors
+        and frames == full_frames
+        and abs(duration - full_duration) < 0.05
+    )
+    print(
+        f"{'SUCCESS' if passed else 'FAILURE'}: {name} ({stats}) frames {frames} (full {full_frames}), "
+        f"duration {duration:.3f}s (full {full_duration:.3f}s)"
+    )
+    if errors:
+        print(f"  decode errors: {errors[:500]}")
+    return passed
+
+
+def test_merge(work: Path, source: Path) -> bool:
+    narration = make_audio(work, "narration.wav", 6.5, 440)
+    background = make_audio(work, "background.mp3", 3.0, 880)
+    ok = True
+    for name, narr in (("merge+narration", narration), ("merge+background", None)):
+        full = work / f"{name}_full.mp4"
+        smart = work / f"{name}_smart.mp4"
+        video_engine.merge_video_audio(source, full, narr, background, fade_duration=1.0, smart_render=False)
+        stats = video_engine.merge_video_audio(source, smart, narr, background, fade_duration=1.0, smart_render=True)
+        ok = check(name, smart, full, stats, "merge_mode", "smart") and ok
+    return ok
+
+
+def test_partial_subtitles(work: Path, source: Path) -> bool:
+    # Duas cues curtas, em GOPs separados, para re-encodar só parte do vídeo
+    srt = work / "subs.srt"
+    srt.write_text(
+        "1\n00:00:01,200 --> 00:00:01,800\nPrimeira\n\n"
+        "2\n00:00:05,100 --> 00:00:05,600\nSegunda\n",
+        encoding="utf-8"
+    )
+    full = work / "subs_full.mp4"
+    partial = work / "subs_partial.mp4"
+    video_engine.add_subtitles(source, srt, full, mode="burn")
+    stats = video_engine.add_subtitles(source, srt, partial, mode="partial")
+    return check("subtitles partial", partial, full, stats, "subtitle_mode", "partial")
+
+
+if __name__ == "__main__":
+    work = Path(tempfile.mkdtemp(prefix="verify_smart_"))
+    try:
+        source = make_source(work)
+        results = [test_merge(work, source), test_partial_subtitles(work, source)]
+        print("\nSmart render output is valid." if all(results) else "\nSmart render output is not valid.")
+    except Exception as e:
+        print(f"ERROR: {e}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
@@ -1,17 +1,55 @@
 import subprocess
+import os
 import json
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
-import wave
-import contextlib
-import whisper
+from typing import Callable, Dict, List, Tuple, Optional
+import threading
+from collections import deque
 import warnings
 import math
 import json
 import re
+import time
+import media_probe
+import transcription
 
 COMMON_EXTS = [".png", ".jpg", ".jpeg", ".webp"]
 
+# "single" = um único filter_complex; "parallel" = segmentos renderizados em paralelo;
+# "windowed" = janelas de N imagens em sequência, para timelines longas;
+# "auto" = "parallel" quando o cache de segmentos vale, senão "single" (video.render_mode).
+# O padrão fica "single" até verify_render_modes.py confirmar, no build de produção, que
+# "parallel" sai igual frame a frame
+DEFAULT_RENDER_MODE = os.environ.get("RENDER_MODE", "single")
+# Decodifica/redimensiona cada imagem uma única vez antes do render (video.prescale_images)
+PRESCALE_IMAGES = os.environ.get("PRESCALE_IMAGES", "1") == "1"
+# Engine padrão do zoom_slow: "zoompan" ou "fast" (video.kenburns_engine / effect.engine)
+KENBURNS_ENGINE = os.environ.get("KENBURNS_ENGINE", "zoompan")
+# Merge de áudio re-encodando só a cauda do vídeo (fade/tpad); o merge completo é o fallback.
+# Desligado por padrão: a saída troca SPS/PPS na emenda (ver smart_merge)
+MERGE_SMART_RENDER = os.environ.get("MERGE_SMART_RENDER", "0") == "1"
+# Legendas: "burn" (re-encode completo), "partial" (só os GOPs com legenda) ou "soft" (mov_text).
+# "partial" e "soft" só com opt-in: "partial" emenda SPS/PPS diferentes (ver subtitle_render)
+SUBTITLE_MODES = ("burn", "partial", "soft")
+SUBTITLE_MODE = os.environ.get("SUBTITLE_MODE", "burn")
+# Modo preview (video.preview): resolução/fps reduzidos e encoder rápido, mesmos tempos
+PREVIEW_SCALE = float(os.environ.get("PREVIEW_SCALE", "0.5"))
+PREVIEW_FPS = int(os.environ.get("PREVIEW_FPS", "15"))
+PREVIEW_PRESET = os.environ.get("PREVIEW_PRESET", "ultrafast")
+PREVIEW_CRF = int(os.environ.get("PREVIEW_CRF", "30"))
+# Streaming (video.streaming): MP4 fragmentado, sem voltar no arquivo para escrever o moov,
+# então a saída pode ser um pipe lido enquanto o encode roda. Fragmentos de no máximo N segundos
+STREAM_FRAGMENT_SECONDS = float(os.environ.get("STREAM_FRAGMENT_SECONDS", "1.0"))
+# Cortes secos (transition "none") unidos com concat em vez de xfade de duração 0 (video.hardcut_concat)
+HARDCUT_CONCAT = os.environ.get("HARDCUT_CONCAT", "1") == "1"
+# Teto de memória (MB) de um render (video.memory_limit_mb); acima dele o modo "single"
+# passa para "windowed". 0 = sem teto
+RENDER_MEMORY_LIMIT_MB = int(os.environ.get("RENDER_MEMORY_LIMIT_MB", "0"))
+
+# Maior pico de RSS (KB) entre os ffmpeg executados neste processo desde o último reset
+_ffmpeg_peak = {"rss_kb": 0}
+_ffmpeg_peak_lock = threading.Lock()
+
 def find_image_file(item: Dict, base_dir: Path) -> Path:
     if "image_file" in item and item["image_file"]:
         p = base_dir / item["image_file"]
@@ -37,7 +75,7 @@ def find_image_file(item: Dict, base_dir: Path) -> Path:
         f"Nomeie como img01.png/.jpg etc, ou use 'image_file' no JSON."
     )
 
-def get_video_settings(cfg: Dict) -> Tuple[int, int, int]:
+def get_full_video_settings(cfg: Dict) -> Tuple[int, int, int]:
     res = cfg.get("video", {}).get("resolution", "1080x1920")
     fps = int(cfg.get("video", {}).get("fps", 30))
     try:
@@ -46,12 +84,75 @@ def get_video_settings(cfg: Dict) -> Tuple[int, int, int]:
     except Exception:
         raise ValueError(f"resolution inválida: {res} (ex: '1080x1920')")
 
-def effect_filter(effect: Dict, w: int, h: int, fps: int, duration: float) -> str:
+def is_preview(cfg: Dict) -> bool:
+    return bool(cfg.get("video", {}).get("preview", False))
+
+def is_streaming(cfg: Dict) -> bool:
+    return bool(cfg.get("video", {}).get("streaming", False))
+
+def container_args(cfg: Dict) -> List[str]:
+    """
+    Parâmetros do muxer MP4: fragmentado (moov vazio no início) no modo streaming.
+    """
+    if not is_streaming(cfg):
+        return []
+    return [
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-frag_duration", str(int(STREAM_FRAGMENT_SECONDS * 1_000_000)),
+        "-f", "mp4",
+    ]
+
+def preview_scale(cfg: Dict) -> float:
+    return min(1.0, max(0.05, float(cfg.get("video", {}).get("preview_scale", PREVIEW_SCALE))))
+
+def get_video_settings(cfg: Dict) -> Tuple[int, int, int]:
+    """
+    Resolução e fps do render. No modo preview a resolução é reduzida por preview_scale
+    (dimensões pares, exigência do yuv420p) e o fps limitado a preview_fps.
+    Durações e offsets continuam em segundos, então os tempos da timeline não mudam.
+    """
+    w, h, fps = get_full_video_settings(cfg)
+    if not is_preview(cfg):
+        return w, h, fps
+    scale = preview_scale(cfg)
+    pw = max(2, int(round(w * scale / 2)) * 2)
+    ph = max(2, int(round(h * scale / 2)) * 2)
+    pfps = max(1, min(fps, int(cfg.get("video", {}).get("preview_fps", PREVIEW_FPS))))
+    return pw, ph, pfps
+
+def is_fast_kenburns(effect: Dict) -> bool:
+    return (effect or {}).get("type") == "zoom_slow" and effect.get("engine", "zoompan") == "fast"
+
+def effect_source_geometry(effect: Dict, w: int, h: int) -> Tuple[int, int, bool]:
+    """
+    Tamanho da imagem de origem que o efeito precisa (largura, altura, recorte no canto superior esquerdo).
+    É o mesmo scale/crop que effect_filter aplica antes da animação.
+    """
+    etype = (effect or {}).get("type", "none")
+    if etype == "slide_horizontal":
+        return int(w * 2), h, True
+    if etype == "slide_vertical":
+        return w, int(effect.get("source_scale_height", int(h * 1.25))), True
+    return w, h, False
+
+def hold_filter(fps: int) -> str:
+    # Repete o único frame da entrada (ver clip_input_args) como um stream a `fps`;
+    # o trim do clipe encerra a repetição
+    return f"loop=loop=-1:size=1,setpts=N/{fps}/TB,"
+
+def effect_filter(effect: Dict, w: int, h: int, fps: int, duration: float, prescaled: bool = False) -> str:
+    """
+    Filtro do efeito para um clipe. A entrada é um único frame: o scale/crop inicial roda
+    uma vez e o resultado é repetido (hold_filter); o zoompan já gera os frames sozinho.
+    Com prescaled=True a entrada já é a imagem normalizada no tamanho de
+    effect_source_geometry e o scale/crop inicial é omitido.
+    """
     etype = (effect or {}).get("type", "none")
-    base = f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h}"
+    base = "" if prescaled else f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h},"
+    hold = hold_filter(fps)
 
     if etype == "none":
-        return f"{base},fps={fps},format=yuv420p"
+        return f"{base}format=yuv420p,{hold}fps={fps}"
 
     if etype == "zoom_slow":
         zs = float(effect.get("zoom_start", 1.0))
@@ -59,8 +160,24 @@ def effect_filter(effect: Dict, w: int, h: int, fps: int, duration: float) -> st
         step = float(effect.get("zoom_step", 0.0015))
         frames = max(1, int(round(duration * fps)))
 
+        if effect.get("engine", "zoompan") == "fast":
+            # perspective com os cantos do retângulo central de lado 1/zoom: a cada frame
+            # só os w×h pixels da saída são interpolados (subpixel, sem o arredondamento
+            # de x/y do zoompan), a partir da imagem no tamanho da saída
+            zoom = f"min({zs}+on*{step},{ze})"
+            lo = f"(1-1/{zoom})/2"
+            hi = f"(1+1/{zoom})/2"
+            return (
+                f"{base}format=yuv420p,{hold}"
+                f"perspective="
+                f"x0='W*{lo}':y0='H*{lo}':x1='W*{hi}':y1='H*{lo}':"
+                f"x2='W*{lo}':y2='H*{hi}':x3='W*{hi}':y3='H*{hi}':"
+                f"eval=frame,"
+                f"fps={fps}"
+            )
+
         return (
-            f"{base},"
+            f"{base}"
             f"zoompan=z='if(eq(on,0),{zs},min(zoom+{step},{ze}))':"
             f"x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':"
             f"d={frames}:s={w}x{h}:fps={fps},"
@@ -75,7 +192,7 @@ def effect_filter(effect: Dict, w: int, h: int, fps: int, duration: float) -> st
         st_out = float(fout.get("start_time", max(0.0, duration - 0.5)))
         d_out = float(fout.get("duration", 0.5))
         return (
-            f"{base},fps={fps},"
+            f"{base}{hold}fps={fps},"
             f"fade=t=in:st={st_in}:d={d_in},"
             f"fade=t=out:st={st_out}:d={d_out},"
             f"format=yuv420p"
@@ -94,8 +211,9 @@ def effect_filter(effect: Dict, w: int, h: int, fps: int, duration: float) -> st
         else:
             x_expr = f"(t/{duration})*{w}"
 
+        pre = "" if prescaled else f"scale={wide_w}:{h}:force_original_aspect_ratio=increase,"
         return (
-            f"scale={wide_w}:{h}:force_original_aspect_ratio=increase,"
+            f"{pre}{hold}"
             f"crop={w}:{h}:x='{x_expr}':y=0,"
             f"fps={fps},format=yuv420p"
         )
@@ -112,70 +230,209 @@ def effect_filter(effect: Dict, w: int, h: int, fps: int, duration: float) -> st
         else:
             y_expr = f"{delta}-(t/{duration})*{delta}"
 
+        pre = "" if prescaled else f"scale={w}:{tall_h}:force_original_aspect_ratio=increase,"
         return (
-            f"scale={w}:{tall_h}:force_original_aspect_ratio=increase,"
+            f"{pre}{hold}"
             f"crop={w}:{h}:x=0:y='{y_expr}',"
             f"fps={fps},format=yuv420p"
         )
 
-    return f"{base},fps={fps},format=yuv420p"
+    return f"{base}format=yuv420p,{hold}fps={fps}"
 
-def build_ffmpeg_command(cfg: Dict, base_dir: Path, out_path: Path) -> List[str]:
-    w, h, fps = get_video_settings(cfg)
+def preview_effect(effect: Dict, scale: float, fps_ratio: float) -> Dict:
+    """
+    Ajusta os parâmetros absolutos do efeito para o preview: source_scale_height está em
+    pixels e zoom_step é por frame, então o movimento por segundo fica igual ao do render final.
+    """
+    effect = dict(effect)
+    if "source_scale_height" in effect:
+        effect["source_scale_height"] = int(round(float(effect["source_scale_height"]) * scale))
+    if effect.get("type") == "zoom_slow":
+        effect["zoom_step"] = float(effect.get("zoom_step", 0.0015)) * fps_ratio
+    return effect
+
+def get_encoder_args(cfg: Dict) -> List[str]:
+    """
+    Parâmetros do encoder de vídeo (video.encoder no JSON).
+    Os padrões são os mesmos que o ffmpeg usa implicitamente para .mp4 (libx264, medium, crf 23).
+    """
+    enc = cfg.get("video", {}).get("encoder", {}) or {}
+    if is_preview(cfg):
+        args = [
+            "-c:v", str(enc.get("codec", "libx264")),
+            "-preset", PREVIEW_PRESET,
+            "-crf", str(PREVIEW_CRF),
+        ]
+    else:
+        args = [
+            "-c:v", str(enc.get("codec", "libx264")),
+            "-preset", str(enc.get("preset", "medium")),
+            "-crf", str(enc.get("crf", 23)),
+        ]
+    package = cfg.get("video", {}).get("package")
+    if package:
+        # Import local: stream_package depende deste módulo
+        import stream_package
+        # Keyframes nas fronteiras dos segmentos: o empacotamento sem ladder é só stream copy
+        args += stream_package.keyframe_args(stream_package.package_options(package)["segment_seconds"])
+    return args
 
+def transition_params(t: Dict) -> Tuple[str, float]:
+    t = t or {}
+    ttype = t.get("type", "xfade")
+
+    if ttype == "none":
+        return "fade", 0.0
+    return t.get("transition", "fade"), float(t.get("duration", 0.5))
+
+def load_timeline(cfg: Dict, base_dir: Path) -> List[Dict]:
+    """
+    Lê timeline.images (ordenado por 'order') e resolve arquivo, duração, efeito e transição de cada clipe.
+    """
     images = cfg.get("timeline", {}).get("images", [])
     if not images:
         raise ValueError("JSON sem timeline.images")
 
     images = sorted(images, key=lambda x: int(x.get("order", 9999)))
 
-    input_files: List[Path] = []
-    durations: List[float] = []
-    transitions: List[Dict] = []
+    # Engine do zoom_slow: "zoompan" (original) ou "fast"; por efeito ou global
+    kenburns_engine = cfg.get("video", {}).get("kenburns_engine", KENBURNS_ENGINE)
+    preview = is_preview(cfg)
+    if preview:
+        # O original fica em full_effect, usado pelas masters em resolução cheia
+        scale = preview_scale(cfg)
+        fps_ratio = get_full_video_settings(cfg)[2] / get_video_settings(cfg)[2]
 
-    for item in images:
-        input_files.append(find_image_file(item, base_dir))
-        durations.append(float(item.get("duration_seconds", 5)))
-        transitions.append(item.get("transition_to_next", {}) or {})
+    clips: List[Dict] = []
+    for i, item in enumerate(images):
+        trans, td = transition_params(item.get("transition_to_next", {}) or {})
+        effect = item.get("effect", {}) or {"type": "none"}
+        if effect.get("type") == "zoom_slow" and "engine" not in effect:
+            effect = {**effect, "engine": kenburns_engine}
+        clip = {
+            "index": i,
+            "file": find_image_file(item, base_dir),
+            "duration": float(item.get("duration_seconds", 5)),
+            "effect": effect,
+            "transition": trans,
+            "transition_duration": td,
+        }
+        if preview:
+            clip["full_effect"] = effect
+            clip["effect"] = preview_effect(effect, scale, fps_ratio)
+        clips.append(clip)
+    return clips
 
-    cmd = ["ffmpeg", "-y"]
+def clip_input_args(clip: Dict, fps: int) -> List[str]:
+    # Um único frame: a imagem é decodificada uma vez (sem -loop 1, que decodifica o
+    # arquivo de novo a cada frame) e o filtro do efeito gera o resto (ver effect_filter)
+    return ["-framerate", str(fps), "-i", str(clip["file"])]
 
-    for img_file, dur in zip(input_files, durations):
-        cmd += ["-loop", "1", "-framerate", str(fps), "-t", f"{dur}", "-i", str(img_file)]
+def clip_filter(clip: Dict, w: int, h: int, fps: int) -> str:
+    vf = effect_filter(clip["effect"], w, h, fps, clip["duration"], prescaled=clip.get("prescaled", False))
+    return f"{vf},trim=duration={clip['duration']},setpts=PTS-STARTPTS,fps={fps}"
 
-    fc_parts: List[str] = []
-    labels: List[str] = []
+def prepare_clips(cfg: Dict, base_dir: Path) -> List[Dict]:
+    """
+    load_timeline + troca de cada imagem pela versão normalizada (video.prescale_images).
+    """
+    w, h, _ = get_video_settings(cfg)
+    clips = load_timeline(cfg, base_dir)
+    if cfg.get("video", {}).get("prescale_images", PRESCALE_IMAGES):
+        # Import local: image_prep depende deste módulo
+        import image_prep
+        # No preview as masters saem das masters em resolução cheia, que ficam no cache para o render final
+        full_size = get_full_video_settings(cfg)[:2] if is_preview(cfg) else None
+        clips = image_prep.prepare_masters(clips, w, h, base_dir, full_size=full_size)
+    return clips
 
-    for i, item in enumerate(images):
-        eff = item.get("effect", {}) or {"type": "none"}
-        dur = durations[i]
+def get_memory_limit_mb(cfg: Dict) -> int:
+    return max(0, int(cfg.get("video", {}).get("memory_limit_mb", RENDER_MEMORY_LIMIT_MB)))
+
+def use_hardcut_concat(cfg: Dict) -> bool:
+    return bool(cfg.get("video", {}).get("hardcut_concat", HARDCUT_CONCAT))
+
+def build_slideshow_graph(
+    clips: List[Dict],
+    w: int,
+    h: int,
+    fps: int,
+    hardcut: bool = HARDCUT_CONCAT
+) -> Tuple[List[str], List[str], str, float]:
+    """
+    Monta as entradas e o filter_complex do slideshow (efeitos + xfade).
+    Retorna (argumentos de entrada, partes do filtro, label final, duração total).
+    """
+    input_args: List[str] = []
 
-        vf = effect_filter(eff, w, h, fps, dur)
+    for clip in clips:
+        input_args += clip_input_args(clip, fps)
+
+    fc_parts: List[str] = []
+    labels: List[str] = []
 
+    for i, clip in enumerate(clips):
         out_label = f"v{i}"
-        fc_parts.append(
-            f"[{i}:v]{vf},trim=duration={dur},setpts=PTS-STARTPTS,fps={fps}[{out_label}]"
-        )
+        fc_parts.append(f"[{i}:v]{clip_filter(clip, w, h, fps)}[{out_label}]")
         labels.append(out_label)
 
+    current, current_len = build_transition_chain(fc_parts, labels, clips, hardcut=hardcut)
+    return input_args, fc_parts, current, current_len
+
+def group_hardcuts(fc_parts: List[str], labels: List[str], clips: List[Dict], suffix: str = "") -> Tuple[List[str], List[Dict]]:
+    """
+    Junta cada sequência de clipes ligados por corte seco num único concat.
+    Retorna os labels e "clipes" resultantes (duração somada, transição do último da sequência).
+    """
+    runs = [[0]]
+    for i in range(len(labels) - 1):
+        if clips[i]["transition_duration"] <= 0:
+            runs[-1].append(i + 1)
+        else:
+            runs.append([i + 1])
+
+    run_labels: List[str] = []
+    run_clips: List[Dict] = []
+    for r, run in enumerate(runs):
+        label = labels[run[0]]
+        if len(run) > 1:
+            label = f"c{r}{suffix}"
+            fc_parts.append("".join(f"[{labels[i]}]" for i in run) + f"concat=n={len(run)}:v=1:a=0[{label}]")
+        run_labels.append(label)
+        run_clips.append({
+            "duration": sum(clips[i]["duration"] for i in run),
+            "transition": clips[run[-1]]["transition"],
+            "transition_duration": clips[run[-1]]["transition_duration"],
+        })
+    return run_labels, run_clips
+
+def build_transition_chain(
+    fc_parts: List[str],
+    labels: List[str],
+    clips: List[Dict],
+    suffix: str = "",
+    hardcut: bool = HARDCUT_CONCAT
+) -> Tuple[str, float]:
+    """
+    Encadeia os clipes (labels) com xfade, acrescentando os filtros em fc_parts.
+    Com hardcut, os cortes secos viram concat e o xfade fica só nas transições reais,
+    em vez de uma cadeia de xfade com duration=0 que mantém todas as entradas vivas.
+    Retorna (label final, duração total). `suffix` separa os labels de saídas diferentes.
+    """
+    if hardcut:
+        labels, clips = group_hardcuts(fc_parts, labels, clips, suffix)
+
     current = labels[0]
-    current_len = durations[0]
+    current_len = clips[0]["duration"]
 
     for i in range(0, len(labels) - 1):
-        t = transitions[i] or {}
-        ttype = t.get("type", "xfade")
-
-        if ttype == "none":
-            trans = "fade"
-            td = 0.0
-        else:
-            trans = t.get("transition", "fade")
-            td = float(t.get("duration", 0.5))
+        trans = clips[i]["transition"]
+        td = clips[i]["transition_duration"]
 
         offset = max(0.0, current_len - td)
 
         next_label = labels[i + 1]
-        out_label = f"x{i}"
+        out_label = f"x{i}{suffix}"
 
         fc_parts.append(
             f"[{current}][{next_label}]"
@@ -183,34 +440,464 @@ def build_ffmpeg_command(cfg: Dict, base_dir: Path, out_path: Path) -> List[str]
             f"format=yuv420p[{out_label}]"
         )
 
-        current_len = current_len + durations[i + 1] - td
+        current_len = current_len + clips[i + 1]["duration"] - td
         current = out_label
 
+    return current, current_len
+
+def build_ffmpeg_command(cfg: Dict, base_dir: Path, out_path: Path) -> List[str]:
+    w, h, fps = get_video_settings(cfg)
+    clips = prepare_clips(cfg, base_dir)
+
+    input_args, fc_parts, current, _ = build_slideshow_graph(clips, w, h, fps, use_hardcut_concat(cfg))
     filter_complex = ";".join(fc_parts)
 
-    cmd += [
+    return [
+        "ffmpeg", "-y",
+        *input_args,
         "-filter_complex", filter_complex,
         "-map", f"[{current}]",
         "-r", str(fps),
         "-pix_fmt", "yuv420p",
+        *get_encoder_args(cfg),
+        *container_args(cfg),
         str(out_path),
     ]
-    return cmd
 
-def generate_video_from_config(cfg: Dict, base_dir: Path, output_file: Path):
+def is_multi_output(cfg: Dict) -> bool:
+    return bool(cfg.get("video", {}).get("resolutions"))
+
+def get_output_targets(cfg: Dict) -> List[Dict]:
+    """
+    Saídas de video.resolutions: "1080x1920" ou {"resolution", "name", "effect_overrides"}.
+    effect_overrides ({"zoom_slow": {"zoom_end": 1.08}}) muda parâmetros por tipo de efeito
+    só nessa saída. Com preview, cada saída é reduzida como em get_video_settings.
+    """
+    targets = []
+    for entry in cfg.get("video", {}).get("resolutions") or []:
+        if isinstance(entry, str):
+            entry = {"resolution": entry}
+        single = {**cfg, "video": {**cfg.get("video", {}), "resolution": entry["resolution"]}}
+        w, h, fps = get_video_settings(single)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(entry.get("name") or entry["resolution"]))
+        if any(t["name"] == name for t in targets):
+            raise ValueError(f"Saída repetida em video.resolutions: {name}")
+        targets.append({
+            "name": name,
+            "width": w,
+            "height": h,
+            "fps": fps,
+            "effect_overrides": entry.get("effect_overrides") or {},
+        })
+    return targets
+
+def target_clips(clips: List[Dict], target: Dict, primary_height: int) -> List[Dict]:
+    """
+    Clipes com os efeitos ajustados para uma saída: parâmetros em pixels acompanham a
+    altura da saída (mesma regra do preview) e effect_overrides vale por tipo de efeito.
+    O engine do zoom_slow não muda: ele define a entrada, que é compartilhada.
+    """
+    scale = target["height"] / float(primary_height)
+    result = []
+    for clip in clips:
+        effect = preview_effect(clip["effect"], scale, 1.0)
+        overrides = target["effect_overrides"].get(effect.get("type", "none")) or {}
+        effect.update({k: v for k, v in overrides.items() if k != "engine"})
+        result.append({**clip, "effect": effect, "prescaled": False})
+    return result
+
+def build_multi_output_command(cfg: Dict, base_dir: Path, output_dir: Path) -> Tuple[List[str], List[Dict]]:
+    """
+    Um único ffmpeg para todas as saídas de video.resolutions: cada imagem é decodificada
+    uma vez e dividida (split) entre as saídas; cada ramo tem seu scale/crop, efeitos e
+    transições, e todas as saídas são codificadas no mesmo processo.
+    Retorna (comando, saídas com o caminho de cada arquivo).
+    """
+    targets = get_output_targets(cfg)
+    if not targets:
+        raise ValueError("video.resolutions vazio")
+    # A primeira saída é a referência dos parâmetros em pixels do JSON
+    first = cfg["video"]["resolutions"][0]
+    primary = {**cfg, "video": {**cfg["video"], "resolution": first if isinstance(first, str) else first["resolution"]}}
+    _, primary_height, fps = get_video_settings(primary)
+    # Sem prescale: as masters normalizadas são por geometria de saída, e aqui a entrada é única
+    clips = load_timeline(primary, base_dir)
+
+    input_args: List[str] = []
+    for clip in clips:
+        input_args += clip_input_args(clip, fps)
+
+    fc_parts: List[str] = []
+    count = len(targets)
+    sources = []
+    for i in range(len(clips)):
+        if count > 1:
+            fc_parts.append(f"[{i}:v]split={count}" + "".join(f"[s{i}_{t}]" for t in range(count)))
+            sources.append([f"s{i}_{t}" for t in range(count)])
+        else:
+            sources.append([f"{i}:v"])
+
+    output_args: List[str] = []
+    encoder_args = get_encoder_args(cfg)
+    for t, target in enumerate(targets):
+        w, h = target["width"], target["height"]
+        tclips = target_clips(clips, target, primary_height)
+        labels = []
+        for i, clip in enumerate(tclips):
+            label = f"v{i}_{t}"
+            fc_parts.append(f"[{sources[i][t]}]{clip_filter(clip, w, h, fps)}[{label}]")
+            labels.append(label)
+        final, duration = build_transition_chain(fc_parts, labels, tclips, f"_{t}", use_hardcut_concat(cfg))
+        target["file"] = output_dir / f"{target['name']}.mp4"
+        target["duration"] = duration
+        output_args += [
+            "-map", f"[{final}]",
+            "-r", str(fps),
+            "-pix_fmt", "yuv420p",
+            *encoder_args,
+            str(target["file"]),
+        ]
+
+    cmd = ["ffmpeg", "-y", *input_args, "-filter_complex", ";".join(fc_parts), *output_args]
+    return cmd, targets
+
+def _parse_ffmpeg_time(value: str) -> Optional[float]:
+    try:
+        h, m, sec = value.strip().split(":")
+        return int(h) * 3600 + int(m) * 60 + float(sec)
+    except Exception:
+        return None
+
+def progress_update(
+    out_time: float,
+    total_duration: Optional[float],
+    elapsed: float,
+    frame: int = 0,
+    fps: float = 0.0,
+    speed: Optional[float] = None,
+    status: str = "running"
+) -> Dict:
+    """
+    Monta o dicionário de progresso publicado no callback (percentual e ETA a partir da duração total).
+    """
+    update = {
+        "status": status,
+        "frame": frame,
+        "fps": fps,
+        "out_time": round(out_time, 3),
+        "speed": speed,
+        "elapsed": round(elapsed, 3),
+        "total_duration": total_duration,
+        "percent": None,
+        "eta_seconds": None,
+    }
+    if total_duration:
+        done = min(1.0, max(0.0, out_time / total_duration))
+        update["percent"] = round(done * 100, 2)
+        if status == "end":
+            update["percent"] = 100.0
+            update["eta_seconds"] = 0.0
+        elif done > 0:
+            # Estimativa pelo ritmo real até agora (mais estável que o speed instantâneo)
+            update["eta_seconds"] = round(elapsed * (1 - done) / done, 1)
+        elif speed:
+            update["eta_seconds"] = round(total_duration / speed, 1)
+    return update
+
+def _run_ffmpeg_with_progress(
+    cmd: List[str],
+    error_message: str,
+    cwd: Optional[Path],
+    total_duration: Optional[float],
+    progress_callback: Callable[[Dict], None]
+) -> int:
+    # -progress pipe:1 escreve blocos key=value no stdout; o stderr fica para erros
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
+    )
+
+    stderr_tail: deque = deque(maxlen=200)
+    probed: Dict[str, Optional[float]] = {"duration": total_duration}
+
+    def drain_stderr():
+        for line in proc.stderr:
+            stderr_tail.append(line)
+            # Sem duração conhecida, usa a do primeiro input ("Duration: 00:01:02.50")
+            if probed["duration"] is None and "Duration:" in line:
+                probed["duration"] = _parse_ffmpeg_time(line.split("Duration:", 1)[1].split(",", 1)[0])
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    start = time.perf_counter()
+    block: Dict[str, str] = {}
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        if key != "progress":
+            block[key] = value
+            continue
+
+        out_us = block.get("out_time_us") or block.get("out_time_ms") or "0"
+        try:
+            out_time = max(0.0, int(out_us) / 1_000_000)
+        except ValueError:
+            out_time = 0.0
+        try:
+            speed = float(block.get("speed", "").rstrip("x"))
+        except ValueError:
+            speed = None
+        try:
+            fps = float(block.get("fps", 0) or 0)
+        except ValueError:
+            fps = 0.0
+
+        update = progress_update(
+            out_time,
+            probed["duration"],
+            time.perf_counter() - start,
+            frame=int(block.get("frame", 0) or 0),
+            fps=fps,
+            speed=speed,
+            status="end" if value == "end" else "running",
+        )
+        try:
+            progress_callback(update)
+        except Exception as e:
+            print(f"Progress callback error: {e}")
+        block = {}
+
+    returncode, peak_rss_kb = _wait_process(proc)
+    stderr_thread.join(timeout=5)
+    if returncode != 0:
+        raise RuntimeError(
+            f"{error_message} with exit code {returncode}.\nStderr: {''.join(stderr_tail)}"
+        )
+    return peak_rss_kb
+
+def _wait_process(proc: subprocess.Popen) -> Tuple[int, int]:
+    """
+    Espera o processo com wait4, que devolve também o pico de RSS (KB) só dele
+    (o RUSAGE_CHILDREN é o máximo de todos os filhos já coletados). Retorna (exit code, pico).
+    """
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # Já coletado por outro caminho: sem medição
+        return proc.wait(), 0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    with _ffmpeg_peak_lock:
+        _ffmpeg_peak["rss_kb"] = max(_ffmpeg_peak["rss_kb"], usage.ru_maxrss)
+    return proc.returncode, usage.ru_maxrss
+
+def reset_ffmpeg_peak_rss():
+    with _ffmpeg_peak_lock:
+        _ffmpeg_peak["rss_kb"] = 0
+
+def ffmpeg_peak_rss_kb() -> int:
+    with _ffmpeg_peak_lock:
+        return _ffmpeg_peak["rss_kb"]
+
+def run_ffmpeg(
+    cmd: List[str],
+    error_message: str = "FFmpeg failed",
+    cwd: Optional[Path] = None,
+    total_duration: Optional[float] = None,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> int:
+    """
+    Executa o ffmpeg. Com progress_callback, acompanha o canal -progress e publica
+    frame/fps/out_time/speed + percentual e ETA (relativos a total_duration).
+    Retorna o pico de RSS (KB) do processo.
+    """
+    if progress_callback is not None:
+        return _run_ffmpeg_with_progress(cmd, error_message, cwd, total_duration, progress_callback)
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    stderr = proc.stderr.read()
+    proc.stderr.close()
+    returncode, peak_rss_kb = _wait_process(proc)
+    if returncode != 0:
+        raise RuntimeError(f"{error_message} with exit code {returncode}.\nStderr: {stderr}")
+    return peak_rss_kb
+
+def timeline_duration(clips: List[Dict]) -> float:
+    # Mesma conta do current_len em build_slideshow_graph
+    total = clips[0]["duration"]
+    for i in range(len(clips) - 1):
+        total += clips[i + 1]["duration"] - clips[i]["transition_duration"]
+    return total
+
+def get_render_mode(cfg: Dict) -> str:
+    """
+    video.render_mode, com "auto" resolvido: "parallel" quando o cache de segmentos está
+    ligado, para que reenviar a timeline editada só re-renderize os segmentos que mudaram.
+    Streaming e pacote HLS/DASH ficam no grafo único: a concatenação só escreve a saída
+    no fim, e os keyframes forçados por tempo seriam contados por segmento.
+    """
+    video = cfg.get("video", {})
+    mode = video.get("render_mode", DEFAULT_RENDER_MODE)
+    if mode != "auto":
+        return mode
+    # Import local: segment_renderer depende deste módulo
+    import segment_renderer
+    if segment_renderer.use_segment_cache(cfg) and not is_streaming(cfg) and not video.get("package"):
+        return "parallel"
+    return "single"
+
+def generate_video_from_config(
+    cfg: Dict,
+    base_dir: Path,
+    output_file: Path,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Renderiza a timeline e retorna estatísticas do render (modo, tempo, cache de segmentos).
+    """
+    render_mode = get_render_mode(cfg)
+    w, h, fps = get_video_settings(cfg)
+    settings = {"resolution": f"{w}x{h}", "fps": fps, "preview": is_preview(cfg), "streaming": is_streaming(cfg)}
+    if render_mode == "parallel":
+        # Import local: segment_renderer depende deste módulo
+        import segment_renderer
+        stats = segment_renderer.render_parallel(cfg, base_dir, output_file, progress_callback)
+        if stats is not None:
+            return {"render_mode": "parallel", **settings, **stats}
+        print("Parallel render not possible for this timeline, falling back to single graph")
+        render_mode = "single"
+    if render_mode == "single" and get_memory_limit_mb(cfg):
+        # Import local: window_renderer depende deste módulo
+        import window_renderer
+        images = len(load_timeline(cfg, base_dir))
+        if window_renderer.exceeds_memory_limit(cfg, images):
+            print(f"Single graph with {images} images would exceed memory_limit_mb, using windowed render")
+            render_mode = "windowed"
+    if render_mode == "windowed":
+        import window_renderer
+        stats = window_renderer.render_windowed(cfg, base_dir, output_file, progress_callback)
+        return {"render_mode": "windowed", **settings, **stats}
+
+    start = time.perf_counter()
     cmd = build_ffmpeg_command(cfg, base_dir, output_file)
     print("Running ffmpeg:", " ".join(cmd))
+    total_duration = timeline_duration(load_timeline(cfg, base_dir))
+    run_ffmpeg(cmd, total_duration=total_duration, progress_callback=progress_callback)
+    return {"render_mode": "single", **settings, "seconds": time.perf_counter() - start, "duration": total_duration}
+
+def generate_video_outputs(
+    cfg: Dict,
+    base_dir: Path,
+    output_dir: Path,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Renderiza todas as saídas de video.resolutions numa única passada (ver
+    build_multi_output_command) e retorna as estatísticas com os dados de cada saída.
+    """
+    start = time.perf_counter()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cmd, targets = build_multi_output_command(cfg, base_dir, output_dir)
+    print("Running ffmpeg (multi output):", " ".join(cmd))
+    total_duration = max(t["duration"] for t in targets)
+    run_ffmpeg(cmd, "FFmpeg multi-output render failed", total_duration=total_duration, progress_callback=progress_callback)
+    seconds = time.perf_counter() - start
+
+    outputs = []
+    for target in targets:
+        size = target["file"].stat().st_size
+        outputs.append({
+            "name": target["name"],
+            "file": target["file"].name,
+            "resolution": f"{target['width']}x{target['height']}",
+            "duration": target["duration"],
+            "bytes": size,
+            "bitrate_kbps": round(size * 8 / 1000 / target["duration"], 1) if target["duration"] else None,
+            # As saídas são codificadas juntas: o tempo de cada uma é o da passada
+            "seconds": seconds,
+        })
+    print(f"Multi-output render finished in {seconds:.2f}s ({len(outputs)} outputs, one decode pass)")
+    return {
+        "render_mode": "multi",
+        "fps": targets[0]["fps"],
+        "preview": is_preview(cfg),
+        "seconds": seconds,
+        "outputs": outputs,
+    }
+
+def build_narration_mix_filters(
+    video_label: str,
+    narr_idx: int,
+    bg_idx: int,
+    start_fade: float,
+    fade_duration: float,
+    vol_narration: float,
+    vol_background: float
+) -> List[str]:
+    """
+    Filtros do merge com narração: estende o vídeo congelando o último frame,
+    aplica fade out e mixa narração + background. Saídas: [v_final] e [a_final].
+    """
+    fc = []
     
-    try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"FFmpeg failed with exit code {e.returncode}.\nStderr: {e.stderr}") from e
+    # Vídeo: tpad para estender (congelar o ultimo frame) se o vídeo for menor que o áudio
+    # Mas o script original usa tpad=stop=-1:stop_mode=clone
+    fc.append(f"[{video_label}]tpad=stop=-1:stop_mode=clone[v_ext]")
+    fc.append(f"[v_ext]fade=t=out:st={start_fade}:d={fade_duration}[v_final]")
+    fc += build_narration_audio_filters(narr_idx, bg_idx, start_fade, fade_duration, vol_narration, vol_background)
+    return fc
+
+def build_narration_audio_filters(
+    narr_idx: int,
+    bg_idx: int,
+    start_fade: float,
+    fade_duration: float,
+    vol_narration: float,
+    vol_background: float
+) -> List[str]:
+    """
+    Parte de áudio do merge com narração (narração + background, fade out). Saída: [a_final].
+    """
+    fc = []
+    audio_mix_parts = []
+    
+    if narr_idx != -1:
+        fc.append(f"[{narr_idx}:a]volume={vol_narration}[a_narr]")
+        audio_mix_parts.append("[a_narr]")
+        
+    if bg_idx != -1:
+        fc.append(f"[{bg_idx}:a]volume={vol_background}[a_bg]")
+        audio_mix_parts.append("[a_bg]")
+        
+    # Mixagem
+    if len(audio_mix_parts) == 2:
+         fc.append(f"{''.join(audio_mix_parts)}amix=inputs=2:dropout_transition=2[a_mix]")
+         fc.append(f"[a_mix]afade=t=out:st={start_fade}:d={fade_duration}[a_final]")
+    elif len(audio_mix_parts) == 1:
+         # Só um audio, aplica fade direto
+         fc.append(f"{audio_mix_parts[0]}afade=t=out:st={start_fade}:d={fade_duration}[a_final]")
+    else:
+         # Sem audio? (Não deve cair aqui pelo if inicial)
+         pass
+
+    return fc
+
+def build_background_mix_filters(
+    video_label: str,
+    bg_idx: int,
+    start_fade: float,
+    fade_duration: float,
+    vol_background: float
+) -> List[str]:
+    """
+    Filtros do merge só com música de fundo (mantém a duração do vídeo). Saídas: [v_final] e [a_final].
+    """
+    fc = build_background_audio_filters(bg_idx, start_fade, fade_duration, vol_background)
+    # Video fade out? Se quiser manter consistente
+    fc.append(f"[{video_label}]fade=t=out:st={start_fade}:d={fade_duration}[v_final]")
+    return fc
 
-def get_wav_duration(filename: str) -> float:
-    with contextlib.closing(wave.open(filename, 'r')) as f:
-        frames = f.getnframes()
-        rate = f.getframerate()
-        return frames / float(rate)
+def build_background_audio_filters(bg_idx: int, start_fade: float, fade_duration: float, vol_background: float) -> List[str]:
+    # Audio do background
+    return [f"[{bg_idx}:a]volume={vol_background},afade=t=out:st={start_fade}:d={fade_duration}[a_final]"]
 
 def merge_video_audio(
     video_input: Path,
@@ -219,12 +906,17 @@ def merge_video_audio(
     background_input: Optional[Path] = None,
     vol_narration: float = 1.0,
     vol_background: float = 0.1,
-    fade_duration: float = 2.0
-):
+    fade_duration: float = 2.0,
+    progress_callback: Optional[Callable[[Dict], None]] = None,
+    smart_render: Optional[bool] = None
+) -> Dict:
     """
     Mescla vídeo com narração (opcional) e música de fundo (opcional).
     Aplica fade out no final.
+    Com smart_render (padrão MERGE_SMART_RENDER), só a cauda alterada é re-encodada
+    (ver smart_merge); o merge completo abaixo fica como fallback.
     """
+    start = time.perf_counter()
     
     # Se não tiver inputs de áudio extras, podemos retornar o vídeo original ou
     # (se quiser garantir o formato) fazer uma cópia simples.
@@ -235,7 +927,7 @@ def merge_video_audio(
         cmd = ["ffmpeg", "-y", "-i", str(video_input), "-c", "copy", str(output_file)]
         print("Running ffmpeg (copy):", " ".join(cmd))
         subprocess.run(cmd, check=True)
-        return
+        return {"merge_mode": "copy", "seconds": time.perf_counter() - start}
 
     # Lógica de duração
     # Se tiver narração, a duração é (narração + fade).
@@ -254,7 +946,7 @@ def merge_video_audio(
     
     narr_duration = 0.0
     if narration_input:
-        narr_duration = get_wav_duration(str(narration_input))
+        narr_duration = media_probe.get_duration(narration_input)
         
     # Se não tiver narração, não faz sentido usar a lógica de "estender até acabar a narração".
     # Nesse caso, vamos assumir que usamos a duração do vídeo original como base,
@@ -292,34 +984,9 @@ def merge_video_audio(
             input_idx += 1
             
         # Construção do Filter Complex
-        fc = []
-        
-        # Vídeo: tpad para estender (congelar o ultimo frame) se o vídeo for menor que o áudio
-        # Mas o script original usa tpad=stop=-1:stop_mode=clone
-        fc.append(f"[0:v]tpad=stop=-1:stop_mode=clone[v_ext]")
-        fc.append(f"[v_ext]fade=t=out:st={start_fade}:d={fade_duration}[v_final]")
-        
-        # Áudio
-        audio_mix_parts = []
-        
-        if narr_idx != -1:
-            fc.append(f"[{narr_idx}:a]volume={vol_narration}[a_narr]")
-            audio_mix_parts.append("[a_narr]")
-            
-        if bg_idx != -1:
-            fc.append(f"[{bg_idx}:a]volume={vol_background}[a_bg]")
-            audio_mix_parts.append("[a_bg]")
-            
-        # Mixagem
-        if len(audio_mix_parts) == 2:
-             fc.append(f"{''.join(audio_mix_parts)}amix=inputs=2:dropout_transition=2[a_mix]")
-             fc.append(f"[a_mix]afade=t=out:st={start_fade}:d={fade_duration}[a_final]")
-        elif len(audio_mix_parts) == 1:
-             # Só um audio, aplica fade direto
-             fc.append(f"{audio_mix_parts[0]}afade=t=out:st={start_fade}:d={fade_duration}[a_final]")
-        else:
-             # Sem audio? (Não deve cair aqui pelo if inicial)
-             pass
+        fc = build_narration_mix_filters(
+            "0:v", narr_idx, bg_idx, start_fade, fade_duration, vol_narration, vol_background
+        )
 
         cmd = [
             'ffmpeg', '-y',
@@ -357,34 +1024,14 @@ def merge_video_audio(
         inputs = ["-i", str(video_input)]
         inputs.extend(["-stream_loop", "-1", "-i", str(background_input)])
         
-        # Pegar duração do vídeo via ffprobe para o fade?
-        # Se não quisermos usar ffprobe, podemos usar '-shortest' no ffmpeg, 
-        # mas queremos o fade out...
-        
-        # Para simplificar e evitar dependência complexa de ffprobe agora (embora já tenhamos subprocess),
-        # vamos tentar usar uma estratégia que não exija saber a duração exata a priori se possível,
-        # ou usamos o `get_wav_duration` se o input fosse wav, mas video é mp4.
-        
-        # Vou usar ffprobe para pegar duração do vídeo, é mais seguro.
-        
-        def get_video_duration(fpath):
-            result = subprocess.run(
-                ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", str(fpath)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT
-            )
-            return float(result.stdout)
-            
-        vid_duration = get_video_duration(video_input)
+        # Precisamos da duração do vídeo para o fade out.
+        # Duração lida do cabeçalho do MP4 (ffprobe só se o formato não for reconhecido)
+        vid_duration = media_probe.get_duration(video_input)
         
         # Vamos aplicar fade out no final do vídeo
         start_fade = max(0, vid_duration - fade_duration)
         
-        fc = []
-        # Audio do background
-        fc.append(f"[1:a]volume={vol_background},afade=t=out:st={start_fade}:d={fade_duration}[a_final]")
-        # Video fade out? Se quiser manter consistente
-        fc.append(f"[0:v]fade=t=out:st={start_fade}:d={fade_duration}[v_final]")
+        fc = build_background_mix_filters("0:v", 1, start_fade, fade_duration, vol_background)
         
         cmd = [
             'ffmpeg', '-y',
@@ -397,31 +1044,34 @@ def merge_video_audio(
             '-t', str(vid_duration),
             str(output_file)
         ]
+        total_duration = vid_duration
+
+    if MERGE_SMART_RENDER if smart_render is None else smart_render:
+        # Import local: smart_merge depende deste módulo
+        import smart_merge
+        stats = smart_merge.merge_smart(
+            video_input, output_file, narration_input, background_input,
+            vol_narration, vol_background, start_fade, fade_duration, total_duration,
+            progress_callback
+        )
+        if stats is not None:
+            return stats
 
     print("Running ffmpeg (merge):", " ".join(cmd))
-    try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"FFmpeg merge failed.\nStderr: {e.stderr}") from e
+    run_ffmpeg(
+        cmd,
+        "FFmpeg merge failed",
+        total_duration=total_duration,
+        progress_callback=progress_callback
+    )
+    return {"merge_mode": "full", "duration": total_duration, "seconds": time.perf_counter() - start}
 
 def get_video_dimensions(video_path: Path):
     """
-    Uses ffprobe to get the real video dimensions.
+    Real video dimensions (container headers, ffprobe as fallback).
     """
-    cmd = [
-        "ffprobe", 
-        "-v", "error", 
-        "-select_streams", "v:0", 
-        "-show_entries", "stream=width,height", 
-        "-of", "json", 
-        str(video_path)
-    ]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        width = int(data["streams"][0]["width"])
-        height = int(data["streams"][0]["height"])
-        return width, height
+        return media_probe.get_dimensions(video_path)
     except Exception as e:
         print(f"Error probing video: {e}")
         # Last resort fallback, but try to be conservative
@@ -440,16 +1090,12 @@ def color_to_ass(hex_color: str) -> str:
     r, g, b = hex_color[:2], hex_color[2:4], hex_color[4:]
     return f"&H{b}{g}{r}"
 
-def add_subtitles(
-    video_input: Path,
-    srt_input: Path,
-    output_file: Path,
-    position_y: int = 0, # 0 = Base absoluta, + = Sobe em direção ao topo
+def build_subtitle_style(
+    position_y: int = 0,
     font_color: str = "#FFFFFF",
     outline_color: str = "#000000",
     font_size: int = 24
-):
-    
+) -> str:
     # Prepara cores
     primary_colour = color_to_ass(font_color)
     outline_colour_ass = color_to_ass(outline_color)
@@ -462,17 +1108,51 @@ def add_subtitles(
 
     # Constrói o estilo forçado
     # BorderStyle=1 (Outline + DropShadow básico)
-    force_style = (
+    return (
         f"Alignment={alignment},MarginV={margin_v},Fontsize={font_size},"
         f"PrimaryColour={primary_colour},OutlineColour={outline_colour_ass},"
         "BorderStyle=1,Outline=1,Shadow=0"
     )
-    
-    print(f"DEBUG: Aplicando legendas com MarginV={margin_v} (Distância do fundo)")
 
-    # Escapar nome do arquivo para o filtro
+def subtitles_filter(srt_input: Path, force_style: str) -> str:
+    # Usa só o nome do arquivo: o ffmpeg roda com cwd na pasta do SRT
     srt_filename = srt_input.name
-    vf_arg = f"subtitles='{srt_filename}':force_style='{force_style}'"
+    return f"subtitles='{srt_filename}':force_style='{force_style}'"
+
+def add_subtitles(
+    video_input: Path,
+    srt_input: Path,
+    output_file: Path,
+    position_y: int = 0, # 0 = Base absoluta, + = Sobe em direção ao topo
+    font_color: str = "#FFFFFF",
+    outline_color: str = "#000000",
+    font_size: int = 24,
+    progress_callback: Optional[Callable[[Dict], None]] = None,
+    mode: Optional[str] = None
+) -> Dict:
+    """
+    mode: "burn" re-encoda o vídeo inteiro; "partial" re-encoda só os GOPs com legenda
+    (fallback para "burn"); "soft" adiciona uma faixa mov_text sem re-encode.
+    """
+    mode = mode or SUBTITLE_MODE
+    if mode not in SUBTITLE_MODES:
+        raise ValueError(f"subtitle_mode inválido: {mode} (use {', '.join(SUBTITLE_MODES)})")
+    force_style = build_subtitle_style(position_y, font_color, outline_color, font_size)
+    start = time.perf_counter()
+
+    if mode in ("partial", "soft"):
+        # Import local: subtitle_render depende deste módulo
+        import subtitle_render
+        if mode == "soft":
+            return subtitle_render.mux_soft(video_input, srt_input, output_file)
+        stats = subtitle_render.render_partial(video_input, srt_input, output_file, force_style, progress_callback)
+        if stats is not None:
+            return stats
+
+    print(f"DEBUG: Aplicando legendas com MarginV={position_y} (Distância do fundo)")
+
+    # Escapar nome do arquivo para o filtro
+    vf_arg = subtitles_filter(srt_input, force_style)
 
     cmd = [
         "ffmpeg", "-y",
@@ -487,50 +1167,125 @@ def add_subtitles(
     # Executa a partir da pasta do SRT para evitar erros de caminho no Windows
     cwd = srt_input.parent
     
+    if progress_callback is not None:
+        # Sem total_duration: o percentual usa a duração do input lida no stderr do ffmpeg
+        run_ffmpeg(cmd, "Erro no FFmpeg ao adicionar legendas", cwd=cwd, progress_callback=progress_callback)
+        return {"subtitle_mode": "burn", "seconds": time.perf_counter() - start}
+
     try:
         subprocess.run(cmd, check=True, cwd=cwd)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"Erro no FFmpeg ao adicionar legendas") from e
+    return {"subtitle_mode": "burn", "seconds": time.perf_counter() - start}
 
-
-def generate_subtitles(
-    audio_path: Path,
-    output_srt_path: Optional[Path] = None,
-    words_per_line: int = 5,
-    model_size: str = "medium",
-    language: Optional[str] = None
-) -> str:
+def render_full(
+    cfg: Dict,
+    base_dir: Path,
+    output_file: Path,
+    narration_input: Optional[Path] = None,
+    background_input: Optional[Path] = None,
+    vol_narration: float = 1.0,
+    vol_background: float = 0.1,
+    fade_duration: float = 2.0,
+    srt_input: Optional[Path] = None,
+    position_y: int = 0,
+    font_color: str = "#FFFFFF",
+    outline_color: str = "#000000",
+    font_size: int = 24,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
     """
-    Generates an SRT string from an audio file using OpenAI Whisper.
-    Groups words based on words_per_line constraint.
-    If output_srt_path is provided, also saves to file.
-    If language is None, Whisper will auto-detect.
+    Slideshow + áudio (tpad, fades, amix) + legendas queimadas num único grafo e um único encode.
+    Equivale a generate_video_from_config -> merge_video_audio -> add_subtitles,
+    sem as três gerações de x264.
     """
-    
-    warnings.filterwarnings("ignore")
-    
-    print(f"Loading Whisper model ({model_size})...")
-    model = whisper.load_model(model_size)
-    
-    print(f"Transcribing audio (Language: {language or 'Auto-detect'})...")
-    # Using word_timestamps=True to get word-level precision
-    result = model.transcribe(str(audio_path), language=language, word_timestamps=True)
-    
-    def fmt(t):
-        h = int(t // 3600)
-        m = int((t % 3600) // 60)
-        s = int(t % 60)
-        ms = int((t - int(t)) * 1000)
-        return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+    start = time.perf_counter()
+    w, h, fps = get_video_settings(cfg)
+    clips = prepare_clips(cfg, base_dir)
+    input_args, fc, video_label, video_len = build_slideshow_graph(clips, w, h, fps, use_hardcut_concat(cfg))
+
+    # Índices das entradas de áudio (depois das imagens)
+    input_idx = len(clips)
+    narr_idx = -1
+    if narration_input:
+        input_args += ["-i", str(narration_input.resolve())]
+        narr_idx = input_idx
+        input_idx += 1
 
+    bg_idx = -1
+    if background_input:
+        input_args += ["-stream_loop", "-1", "-i", str(background_input.resolve())]
+        bg_idx = input_idx
+        input_idx += 1
+
+    audio_label = None
+    if narration_input:
+        # Mesma regra do merge: duração = narração + fade, vídeo estendido com tpad
+        narr_duration = media_probe.get_duration(narration_input)
+        total_duration = narr_duration + fade_duration
+        fc += build_narration_mix_filters(
+            video_label, narr_idx, bg_idx, narr_duration, fade_duration, vol_narration, vol_background
+        )
+        video_label, audio_label = "v_final", "a_final"
+    elif background_input:
+        # Só música: mantém a duração do slideshow (já conhecida, sem ffprobe)
+        total_duration = video_len
+        start_fade = max(0, video_len - fade_duration)
+        fc += build_background_mix_filters(video_label, bg_idx, start_fade, fade_duration, vol_background)
+        video_label, audio_label = "v_final", "a_final"
+    else:
+        total_duration = video_len
+
+    if srt_input:
+        force_style = build_subtitle_style(position_y, font_color, outline_color, font_size)
+        fc.append(f"[{video_label}]{subtitles_filter(srt_input, force_style)}[v_subs]")
+        video_label = "v_subs"
+
+    cmd = [
+        "ffmpeg", "-y",
+        *input_args,
+        "-filter_complex", ";".join(fc),
+        "-map", f"[{video_label}]",
+    ]
+    if audio_label:
+        cmd += ["-map", f"[{audio_label}]", "-c:a", "aac"]
+    cmd += [
+        "-r", str(fps),
+        "-pix_fmt", "yuv420p",
+        *get_encoder_args(cfg),
+        *container_args(cfg),
+        "-t", str(total_duration),
+        str(output_file.resolve()),
+    ]
+
+    print("Running ffmpeg (full render):", " ".join(cmd))
+    # O filtro subtitles usa o nome relativo do SRT, então roda na pasta dele
+    run_ffmpeg(
+        cmd,
+        "FFmpeg full render failed",
+        cwd=srt_input.parent if srt_input else None,
+        total_duration=total_duration,
+        progress_callback=progress_callback
+    )
+    return {
+        "render_mode": "full", "resolution": f"{w}x{h}", "fps": fps, "preview": is_preview(cfg),
+        "streaming": is_streaming(cfg), "seconds": time.perf_counter() - start, "duration": total_duration,
+    }
+
+
+def format_srt_time(t: float) -> str:
+    h = int(t // 3600)
+    m = int((t % 3600) // 60)
+    s = int(t % 60)
+    ms = int((t - int(t)) * 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+def group_words_to_srt(all_words: List[Dict], words_per_line: int = 5) -> str:
+    """
+    Agrupa as palavras (com timestamps) em linhas de até words_per_line palavras no formato SRT.
+    """
     lines_srt = []
     counter = 1
-    
-    all_words = []
-    for seg in result["segments"]:
-        if 'words' in seg:
-            for w in seg['words']:
-                all_words.append(w)
 
     # Group words
     current_group = []
@@ -549,18 +1304,49 @@ def generate_subtitles(
             text_content = " ".join([w['word'].strip() for w in current_group])
             
             lines_srt.append(str(counter))
-            lines_srt.append(f"{fmt(start_time)} --> {fmt(end_time)}")
+            lines_srt.append(f"{format_srt_time(start_time)} --> {format_srt_time(end_time)}")
             lines_srt.append(text_content)
             lines_srt.append("")
             
             counter += 1
             current_group = []
 
-    srt_content = "\n".join(lines_srt)
+    return "\n".join(lines_srt)
+
+def generate_subtitles(
+    audio_path: Path,
+    output_srt_path: Optional[Path] = None,
+    words_per_line: int = 5,
+    model_size: str = "medium",
+    language: Optional[str] = None,
+    device: Optional[str] = None,
+    chunked: Optional[bool] = None,
+    audio_sha256: Optional[str] = None,
+    audio=None,
+    audio_loader=None
+) -> str:
+    """
+    Generates an SRT string from an audio file using OpenAI Whisper.
+    Groups words based on words_per_line constraint.
+    If output_srt_path is provided, also saves to file.
+    If language is None, Whisper will auto-detect.
+    Long audio (or chunked=True) is split at silences and transcribed in parallel.
+    The word-level transcript is cached by audio hash + model + language, so
+    regrouping with another words_per_line doesn't run Whisper again.
+    `audio` (audio_ingest.IngestedAudio) reuses PCM already decoded for this input;
+    `audio_loader` decodes it only on a transcript cache miss.
+    """
+    
+    warnings.filterwarnings("ignore")
+    
+    all_words = transcription.transcribe_words(
+        audio_path, model_size, language, device, chunked,
+        audio_sha256=audio_sha256, audio=audio, audio_loader=audio_loader
+    )
+    srt_content = group_words_to_srt(all_words, words_per_line)
     
     if output_srt_path:
         output_srt_path.write_text(srt_content, encoding="utf-8")
         print(f"Subtitles generated at: {output_srt_path}")
         
     return srt_content
-
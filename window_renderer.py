@@ -0,0 +1,242 @@
+"""
+Renderização em janelas para timelines longas.
+
+No grafo único cada imagem é uma entrada aberta do início ao fim do ffmpeg,
+então a memória cresce com o número de imagens. Aqui a timeline é dividida em janelas
+de N imagens renderizadas uma de cada vez, cada uma num ffmpeg com só as suas imagens
+(mais a primeira da janela seguinte quando há transição na fronteira), e as janelas são
+unidas com stream copy. As fronteiras caem no miolo de um clipe, onde só ele aparece,
+e são contadas em frames da timeline inteira, então transições e duração batem com o
+grafo único.
+
+O tamanho da janela é video.window_size, limitado pelo teto video.memory_limit_mb:
+antes da primeira janela por uma estimativa, depois pelo pico de RSS medido.
+"""
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import segment_renderer
+import video_engine
+
+# Imagens por janela (video.window_size)
+RENDER_WINDOW_SIZE = int(os.environ.get("RENDER_WINDOW_SIZE", "24"))
+# Fração do teto usada no planejamento (o pico real oscila entre janelas)
+MEMORY_HEADROOM = 0.85
+# Estimativa antes da primeira medição: custo fixo + frames do encoder (lookahead/referências)
+# + frames em fila por entrada
+ESTIMATE_BASE_MB = 64
+ESTIMATE_ENCODER_FRAMES = 64
+ESTIMATE_INPUT_FRAMES = 8
+
+
+def get_window_size(cfg: Dict) -> int:
+    return max(1, int(cfg.get("video", {}).get("window_size", RENDER_WINDOW_SIZE)))
+
+
+def estimate_render_mb(images: int, w: int, h: int) -> float:
+    """
+    Memória aproximada de um ffmpeg com `images` entradas: encoder em yuv420p e
+    frames RGB(A) em fila nos filtros de cada entrada.
+    """
+    yuv_mb = w * h * 1.5 / 2 ** 20
+    rgba_mb = w * h * 4 / 2 ** 20
+    return ESTIMATE_BASE_MB + ESTIMATE_ENCODER_FRAMES * yuv_mb + images * ESTIMATE_INPUT_FRAMES * rgba_mb
+
+
+def images_for_memory(limit_mb: int, w: int, h: int) -> int:
+    fixed = estimate_render_mb(0, w, h)
+    per_image = estimate_render_mb(1, w, h) - fixed
+    return max(1, int((limit_mb * MEMORY_HEADROOM - fixed) / per_image))
+
+
+def exceeds_memory_limit(cfg: Dict, images: int) -> bool:
+    limit = video_engine.get_memory_limit_mb(cfg)
+    w, h, _ = video_engine.get_video_settings(cfg)
+    return bool(limit) and estimate_render_mb(images, w, h) > limit * MEMORY_HEADROOM
+
+
+def window_starts(clips: List[Dict], fps: int) -> List[int]:
+    """
+    Clipes onde uma janela pode começar: o miolo do clipe (entre a transição de entrada
+    e a de saída) não é vazio. Mesma regra de plan_segments.
+    """
+    starts = [0]
+    for i in range(1, len(clips)):
+        head = clips[i - 1]["transition_duration"]
+        td = clips[i]["transition_duration"] if i < len(clips) - 1 else 0.0
+        if int(round(head * fps)) <= int(round((clips[i]["duration"] - td) * fps)):
+            starts.append(i)
+    return starts
+
+
+def next_window_start(starts: List[int], start: int, size: int, count: int) -> int:
+    if start + size >= count:
+        return count
+    candidates = [s for s in starts if start < s <= start + size]
+    if candidates:
+        return candidates[-1]
+    # Nenhuma fronteira válida dentro do tamanho: a janela cresce até a próxima
+    later = [s for s in starts if s > start]
+    return later[0] if later else count
+
+
+def clip_offset(clips: List[Dict], index: int) -> float:
+    # Início do clipe `index` na timeline (mesma conta de timeline_duration)
+    return sum(clip["duration"] - clip["transition_duration"] for clip in clips[:index])
+
+
+def boundary_frame(clips: List[Dict], index: int, fps: int) -> int:
+    """
+    Frame global onde começa a janela que abre no clipe `index` (início do miolo dele).
+    """
+    if index >= len(clips):
+        return int(round(video_engine.timeline_duration(clips) * fps))
+    head = clips[index - 1]["transition_duration"] if index > 0 else 0.0
+    return int(round((clip_offset(clips, index) + head) * fps))
+
+
+def build_window_command(
+    window_clips: List[Dict],
+    start_frame: int,
+    frames: int,
+    w: int,
+    h: int,
+    fps: int,
+    encoder_args: List[str],
+    hardcut: bool,
+    out_path: Path
+) -> List[str]:
+    input_args, fc_parts, current, _ = video_engine.build_slideshow_graph(window_clips, w, h, fps, hardcut)
+    fc_parts.append(
+        f"[{current}]trim=start_frame={start_frame}:end_frame={start_frame + frames},"
+        f"setpts=PTS-STARTPTS[out]"
+    )
+    return [
+        "ffmpeg", "-y",
+        *input_args,
+        "-filter_complex", ";".join(fc_parts),
+        "-map", "[out]",
+        "-r", str(fps),
+        "-pix_fmt", "yuv420p",
+        *encoder_args,
+        "-an", str(out_path),
+    ]
+
+
+def window_progress(
+    progress_callback: Callable[[Dict], None],
+    frames_before: int,
+    total_frames: int,
+    fps: int,
+    start: float
+) -> Callable[[Dict], None]:
+    """
+    Converte o progresso de uma janela em progresso da timeline inteira.
+    """
+    def callback(update: Dict):
+        frame = frames_before + int(update.get("frame", 0))
+        progress_callback(video_engine.progress_update(
+            frame / fps, total_frames / fps, time.perf_counter() - start,
+            frame=frame, fps=update.get("fps", 0.0), speed=update.get("speed"),
+        ))
+    return callback
+
+
+def render_windowed(
+    cfg: Dict,
+    base_dir: Path,
+    output_file: Path,
+    progress_callback: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Renderiza a timeline janela a janela e retorna as estatísticas (com o pico de RSS
+    de cada janela). Com teto de memória, o tamanho da próxima janela é ajustado
+    pelo pico da anterior.
+    """
+    w, h, fps = video_engine.get_video_settings(cfg)
+    clips = video_engine.prepare_clips(cfg, base_dir)
+    hardcut = video_engine.use_hardcut_concat(cfg)
+    encoder_args = video_engine.get_encoder_args(cfg)
+    limit_mb = video_engine.get_memory_limit_mb(cfg)
+    max_size = get_window_size(cfg)
+    size = min(max_size, images_for_memory(limit_mb, w, h)) if limit_mb else max_size
+
+    starts = window_starts(clips, fps)
+    total_frames = boundary_frame(clips, len(clips), fps)
+    windows: List[Dict] = []
+
+    work_dir = Path(tempfile.mkdtemp(prefix="windows_", dir=output_file.parent))
+    start = time.perf_counter()
+    try:
+        window_files: List[Path] = []
+        first = 0
+        while first < len(clips):
+            end = next_window_start(starts, first, size, len(clips))
+            window_clips = clips[first:end]
+            if end < len(clips) and clips[end - 1]["transition_duration"] > 0:
+                # A transição da fronteira precisa da primeira imagem da próxima janela
+                window_clips = clips[first:end + 1]
+            frames_before = boundary_frame(clips, first, fps)
+            frames = boundary_frame(clips, end, fps) - frames_before
+            # O grafo da janela começa no primeiro clipe dela: o corte é relativo a esse frame
+            local_start = frames_before - int(round(clip_offset(clips, first) * fps))
+
+            out_path = work_dir / f"win_{len(windows):04d}.mp4"
+            cmd = build_window_command(
+                window_clips, local_start, frames, w, h, fps, encoder_args, hardcut, out_path
+            )
+            callback = None
+            if progress_callback is not None:
+                callback = window_progress(progress_callback, frames_before, total_frames, fps, start)
+
+            window_start = time.perf_counter()
+            print(f"Rendering window {len(windows)}: images {first}-{end - 1} ({len(window_clips)} inputs, {frames} frames)")
+            peak_rss_kb = video_engine.run_ffmpeg(
+                cmd, f"FFmpeg window {len(windows)} failed",
+                total_duration=frames / fps, progress_callback=callback
+            )
+            windows.append({
+                "images": end - first,
+                "inputs": len(window_clips),
+                "frames": frames,
+                "seconds": time.perf_counter() - window_start,
+                "peak_rss_kb": peak_rss_kb,
+            })
+            window_files.append(out_path)
+
+            if limit_mb and peak_rss_kb:
+                if peak_rss_kb > limit_mb * 1024:
+                    print(f"Window peak RSS {peak_rss_kb / 1024:.0f} MB above memory_limit_mb={limit_mb}")
+                # Pico tratado como proporcional às entradas (conservador: ignora o custo fixo);
+                # cresce no máximo 2x por janela
+                fit = int(len(window_clips) * limit_mb * 1024 * MEMORY_HEADROOM / peak_rss_kb)
+                size = max(1, min(max_size, size * 2, fit))
+            first = end
+
+        segment_renderer.concat_segments(window_files, output_file, work_dir, video_engine.container_args(cfg))
+        if progress_callback is not None:
+            progress_callback(video_engine.progress_update(
+                total_frames / fps, total_frames / fps, time.perf_counter() - start,
+                frame=total_frames, status="end",
+            ))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stats = {
+        "seconds": time.perf_counter() - start,
+        "duration": total_frames / fps,
+        "window_size": max_size,
+        "memory_limit_mb": limit_mb or None,
+        "window_peak_rss_kb": max(win["peak_rss_kb"] for win in windows),
+        "max_window_inputs": max(win["inputs"] for win in windows),
+        "windows": windows,
+    }
+    print(
+        f"Windowed render finished in {stats['seconds']:.2f}s "
+        f"({len(windows)} windows, peak {stats['window_peak_rss_kb'] / 1024:.0f} MB)"
+    )
+    return stats